@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+# Scale benchmark for the local pipeline (scripts/local_pipeline.py).
+#
+# For every requested size the Chinook Track table is grown synthetically to
+# that many rows (cached under build/benchmarks/db/), then the whole pipeline
+# runs ``--repeat`` times in a fresh worker process so peak RSS is measured per
+# size. Results (rows/s, p50/p99 invocation latency per stage, peak RSS and
+# the handlers' own EMF stage timings as ``breakdown_ms``) are written as JSON;
+# ``--baseline`` compares throughput against an earlier file and exits
+# non-zero on regressions. The baseline is read before anything is written and
+# latest.json is replaced only after the comparison, so passing the previous
+# run's latest.json compares against that run, not this one.
+#
+#   python scripts/benchmark.py --sizes 10000,100000,1000000
+#   cp build/benchmarks/latest.json build/benchmarks/baseline.json
+#   python scripts/benchmark.py --sizes 10000 --baseline build/benchmarks/baseline.json
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'shared'))
+
+from local_pipeline import DEFAULT_DB_PATH, LocalPipeline
+from metrics import peak_rss_mb, percentile
+
+STAGES = ('ingestion', 'processing', 'analytics')
+DEFAULT_OUT_DIR = os.path.join(ROOT, 'build', 'benchmarks')
+
+
+def grow_database(rows, path, source=DEFAULT_DB_PATH):
+    """Copy the Chinook DB to ``path`` with exactly ``rows`` Track rows.
+
+    Extra rows cycle through the original tracks (same albums, genres and
+    prices) with a suffixed name and a slightly shifted duration.
+    """
+    if os.path.isfile(path):
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute('SELECT COUNT(*) FROM Track').fetchone()[0] == rows:
+                return path
+        finally:
+            conn.close()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.partial'
+    shutil.copyfile(source, tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        base = conn.execute('SELECT COUNT(*) FROM Track').fetchone()[0]
+        if rows <= base:
+            conn.execute('DELETE FROM Track WHERE TrackId > ?', (rows,))
+        else:
+            conn.execute(
+                'WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i + 1 < ?) '
+                'INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice) '
+                "SELECT t.Name || ' #' || (seq.i / ? + 1), t.AlbumId, t.MediaTypeId, t.GenreId, t.Composer, "
+                't.Milliseconds + seq.i % 1000, t.Bytes, t.UnitPrice '
+                'FROM seq JOIN Track t ON t.TrackId = seq.i % ? + 1',
+                (rows - base, base, base)
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return path
+
+
+def _add_breakdown(totals, docs, repeat):
+    """Accumulate the mean per-run Duration of each handler stage from its EMF documents."""
+    for doc in docs:
+        if 'Duration' in doc and doc.get('Stage') != 'total':
+            totals[doc['Stage']] = totals.get(doc['Stage'], 0) + doc['Duration'] / repeat
+
+
+def run_worker(db_path, rows, repeat, mode, payload_format, chunk_size):
+    """Run the pipeline ``repeat`` times in this process and summarize each stage."""
+    latencies = {stage: [] for stage in STAGES}
+    seconds = {stage: [] for stage in STAGES}
+    breakdown = {stage: {} for stage in STAGES}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix='bench-s3-') as root:
+            pipeline = LocalPipeline(root, db_path=db_path, mode=mode, payload_format=payload_format, chunk_size=chunk_size)
+            out = pipeline.run()
+        if out['ingestion']['rows'] != rows:
+            raise RuntimeError(f"expected {rows} rows, ingested {out['ingestion']['rows']}")
+        latencies['ingestion'].append(out['ingestion']['seconds'])
+        for stage in ('processing', 'analytics'):
+            latencies[stage].extend(inv['seconds'] for inv in out[stage]['invocations'])
+        for stage in STAGES:
+            seconds[stage].append(out[stage]['seconds'])
+        _add_breakdown(breakdown['ingestion'], out['ingestion']['metrics'], repeat)
+        for stage in ('processing', 'analytics'):
+            for inv in out[stage]['invocations']:
+                _add_breakdown(breakdown[stage], inv['metrics'], repeat)
+
+    stages = {}
+    for stage in STAGES:
+        median = percentile(seconds[stage], 50)
+        stages[stage] = {
+            'invocations': len(latencies[stage]),
+            'seconds_median': round(median, 4),
+            'rows_per_sec': round(rows / median, 1) if median else None,
+            'p50_ms': round(percentile(latencies[stage], 50) * 1000, 2),
+            'p99_ms': round(percentile(latencies[stage], 99) * 1000, 2),
+            'breakdown_ms': {name: round(ms, 2) for name, ms in sorted(breakdown[stage].items())}
+        }
+    return {'rows': rows, 'repeat': repeat, 'stages': stages, 'peak_rss_mb': peak_rss_mb()}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """List the (size, stage) pairs whose throughput dropped more than ``tolerance`` below ``baseline``."""
+    previous = {r['rows']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results['results']:
+        before = previous.get(result['rows'])
+        if not before:
+            continue
+        for stage, now in result['stages'].items():
+            then = before['stages'].get(stage, {}).get('rows_per_sec')
+            if then and now['rows_per_sec'] is not None and now['rows_per_sec'] < then * (1 - tolerance):
+                regressions.append({
+                    'rows': result['rows'],
+                    'stage': stage,
+                    'baseline_rows_per_sec': then,
+                    'rows_per_sec': now['rows_per_sec'],
+                    'change': round(now['rows_per_sec'] / then - 1, 3)
+                })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the local pipeline at growing data sizes.')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='comma separated Track row counts (up to 10000000)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--mode', choices=['batch', 'stream'], default='stream')
+    parser.add_argument('--payload-format', choices=['json', 'columnar'], default='json')
+    parser.add_argument('--chunk-size', type=int, default=None, help='INGEST_CHUNK_SIZE for stream mode')
+    parser.add_argument('--out', default=DEFAULT_OUT_DIR, help='directory for result JSON files')
+    parser.add_argument('--baseline', help='earlier result file to compare throughput against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed throughput drop before flagging a regression')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--db-path', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+
+    if args.worker:
+        result = run_worker(args.db_path, sizes[0], args.repeat, args.mode, args.payload_format, args.chunk_size)
+        print(json.dumps(result))
+        return 0
+
+    baseline = None
+    if args.baseline:
+        # Read up front: the baseline may be this directory's latest.json, which this run replaces
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = []
+    for rows in sizes:
+        db_path = grow_database(rows, os.path.join(args.out, 'db', f'chinook_{rows}.db'))
+        cmd = [
+            sys.executable, os.path.abspath(__file__), '--worker',
+            '--db-path', db_path, '--sizes', str(rows), '--repeat', str(args.repeat),
+            '--mode', args.mode, '--payload-format', args.payload_format
+        ]
+        if args.chunk_size:
+            cmd += ['--chunk-size', str(args.chunk_size)]
+        # One process per size so peak RSS belongs to that size alone
+        output = subprocess.check_output(cmd, text=True)
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        stages = ', '.join(f"{s} {v['rows_per_sec']:.0f} rows/s" for s, v in result['stages'].items())
+        print(f"{rows} rows: {stages}, peak RSS {result['peak_rss_mb']} MB", file=sys.stderr)
+
+    report = {
+        'created_at': datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'mode': args.mode,
+        'payload_format': args.payload_format,
+        'results': results
+    }
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"bench-{report['created_at']}-{report['git_commit'] or 'nogit'}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(path)
+
+    regressions = compare(report, baseline, args.tolerance) if baseline else []
+    for r in regressions:
+        print(f"REGRESSION {r['rows']} rows {r['stage']}: {r['rows_per_sec']} rows/s vs {r['baseline_rows_per_sec']} ({r['change']:+.1%})", file=sys.stderr)
+    # latest.json moves only after the comparison, so it always holds the previous run until then
+    with open(os.path.join(args.out, 'latest.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,432 @@
+import os
+import re
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+import platform
+import compileall
+import subprocess
+from datetime import datetime
+
+# Cold-start tooling for the Lambda bundles.
+#
+#   profile      import each handler in a fresh interpreter the way Lambda does
+#                (bundle dir, then the layer, no bytecode cache) and report the
+#                import time of every module (-X importtime), grouped by origin.
+#                With --out the report also holds the trace used by build-layer:
+#                every module loaded and every file opened under the bundle/layer.
+#   build-layer  copy only what one or more traces reached out of a full layer
+#                (as built by scripts/package_layer.sh) into a per-function layer.
+#   bench        spawn fresh interpreters and compare init time of the current
+#                packaging (source only, shared layer) against the pruned,
+#                precompiled one.
+#
+#   python scripts/coldstart.py profile processing_lambda --layer build/layer/python --client s3 --out build/traces/processing.json
+#   python scripts/coldstart.py build-layer build/traces/processing.json --layer build/layer/python --out build/layers/processing
+#   python scripts/coldstart.py bench --layer build/layer/python --pruned-layers build/layers --client s3
+#
+# Only imports that happen while profiling are seen. Exercise the handler with
+# --client (builds boto3 clients, no network) and --event (a local invocation),
+# and name anything reached only in other configurations with --require (e.g.
+# psycopg2 for a Postgres ingestion function).
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_DIR = os.path.join(ROOT, 'src')
+sys.path.insert(0, os.path.join(SRC_DIR, 'shared'))
+
+from metrics import percentile
+
+FUNCTIONS = ('ingestion_lambda', 'processing_lambda', 'analytics_lambda')
+# Never needed at runtime; dropped even from packages kept whole
+JUNK_DIRS = {'tests', 'test', 'testing', 'docs', 'doc', 'examples', '__pycache__'}
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+# Runs in the child interpreter: argv[1] is a JSON dict of settings
+_CHILD = r'''
+import os, sys, json, time
+args = json.loads(sys.argv[1])
+sys.path[:0] = args['path']
+opened = set()
+roots = tuple(args['roots'])
+
+def _audit(event, a):
+    if event == 'open' and a and isinstance(a[0], str) and a[0].startswith(roots):
+        opened.add(a[0])
+
+sys.addaudithook(_audit)
+t0 = time.perf_counter()
+import handler
+t1 = time.perf_counter()
+for name in args['clients']:
+    handler.boto3_client(name)
+t2 = time.perf_counter()
+result = handler.lambda_handler(args['event'], None) if args['event'] is not None else None
+t3 = time.perf_counter()
+modules = {n: getattr(m, '__file__', None) for n, m in list(sys.modules.items())}
+with open(args['out'], 'w') as f:
+    json.dump({
+        'init_ms': (t1 - t0) * 1000, 'clients_ms': (t2 - t1) * 1000, 'invoke_ms': (t3 - t2) * 1000,
+        'status': result.get('status') if isinstance(result, dict) else None,
+        'modules': modules, 'files': sorted(opened)
+    }, f, default=str)
+'''
+
+
+def short_name(lambda_dir):
+    return lambda_dir[:-len('_lambda')] if lambda_dir.endswith('_lambda') else lambda_dir
+
+
+def stage_bundle(lambda_dir, out_dir, compile=False):
+    """Lay out a function bundle like scripts/package_lambda.sh (handler dir + src/shared)."""
+    shutil.rmtree(out_dir, ignore_errors=True)
+    shutil.copytree(os.path.join(SRC_DIR, lambda_dir), out_dir, ignore=shutil.ignore_patterns('__pycache__', '*.pyc'))
+    shared = os.path.join(SRC_DIR, 'shared')
+    for name in os.listdir(shared):
+        if name.endswith('.py'):
+            shutil.copy(os.path.join(shared, name), out_dir)
+    if compile:
+        compileall.compile_dir(out_dir, quiet=1)
+    return out_dir
+
+
+def run_child(bundle, layer=None, clients=(), event=None, env=None, importtime=False):
+    """Import (and optionally invoke) the handler of ``bundle`` in a fresh interpreter.
+
+    Bytecode caching is disabled, as on Lambda where the bundle and layers are
+    read-only. Returns the child's measurements, plus the raw ``-X importtime``
+    lines when requested.
+    """
+    # The child runs in a temporary directory, so relative paths must be resolved here
+    path = [os.path.abspath(p) for p in [bundle] + ([layer] if layer else [])]
+    with tempfile.TemporaryDirectory(prefix='coldstart-') as tmp:
+        out = os.path.join(tmp, 'result.json')
+        args = {
+            'path': path,
+            'roots': [p + os.sep for p in path],
+            'clients': list(clients),
+            'event': event,
+            'out': out
+        }
+        child_env = {k: v for k, v in os.environ.items() if k != 'PYTHONPATH'}
+        child_env.update({'PYTHONDONTWRITEBYTECODE': '1', 'LOCAL_UPLOAD_DIR': os.path.join(tmp, 'uploads')})
+        child_env.update(env or {})
+        cmd = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', _CHILD, json.dumps(args)]
+        proc = subprocess.run(cmd, env=child_env, cwd=tmp, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f'handler import failed for {bundle}:\n{proc.stderr[-4000:]}')
+        with open(out) as f:
+            result = json.load(f)
+    if importtime:
+        result['importtime'] = proc.stderr
+    return result
+
+
+def parse_importtime(text):
+    """``-X importtime`` output as a list of ``{name, self_us, cumulative_us, depth}`` in import order."""
+    rows = []
+    for line in text.splitlines():
+        m = _IMPORTTIME.match(line)
+        if m:
+            rows.append({
+                'name': m.group(4),
+                'self_us': int(m.group(1)),
+                'cumulative_us': int(m.group(2)),
+                'depth': len(m.group(3)) // 2
+            })
+    return rows
+
+
+def module_origin(path, bundle, layer):
+    if not path:
+        return 'builtin'
+    path = os.path.abspath(path)
+    if path.startswith(os.path.abspath(bundle) + os.sep):
+        return 'function'
+    if layer and path.startswith(os.path.abspath(layer) + os.sep):
+        return 'layer'
+    return 'stdlib'
+
+
+def profile(lambda_dir, layer=None, clients=(), event=None, env=None, top=20):
+    """Import-time profile and trace of one handler."""
+    with tempfile.TemporaryDirectory(prefix='bundle-') as tmp:
+        bundle = stage_bundle(lambda_dir, os.path.join(tmp, 'bundle'))
+        result = run_child(bundle, layer, clients, event, env, importtime=True)
+        rows = parse_importtime(result.pop('importtime'))
+        files = result['modules']
+        by_origin = {}
+        by_package = {}
+        for row in rows:
+            origin = module_origin(files.get(row['name']), bundle, layer)
+            row['origin'] = origin
+            by_origin[origin] = by_origin.get(origin, 0) + row['self_us']
+            package = row['name'].split('.')[0]
+            by_package[package] = by_package.get(package, 0) + row['self_us']
+        trace = {
+            'layer': os.path.abspath(layer) if layer else None,
+            'modules': {n: os.path.relpath(p, layer) for n, p in files.items() if p and module_origin(p, bundle, layer) == 'layer'},
+            # Data files only; sources are in ``modules`` and probed bytecode caches may not exist
+            'files': sorted(
+                os.path.relpath(p, layer) for p in result['files']
+                if layer and module_origin(p, bundle, layer) == 'layer' and p not in files.values()
+                and not p.endswith('.pyc') and os.path.isfile(p)
+            )
+        }
+    return {
+        'function': short_name(lambda_dir),
+        'python': platform.python_version(),
+        'init_ms': round(result['init_ms'], 2),
+        'clients_ms': round(result['clients_ms'], 2),
+        'invoke_ms': round(result['invoke_ms'], 2) if event is not None else None,
+        'import_ms': round(sum(r['self_us'] for r in rows) / 1000, 2),
+        'by_origin_ms': {k: round(v / 1000, 2) for k, v in sorted(by_origin.items(), key=lambda kv: -kv[1])},
+        'by_package_ms': {k: round(v / 1000, 2) for k, v in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]},
+        'top_cumulative': sorted(rows, key=lambda r: -r['cumulative_us'])[:top],
+        'top_self': sorted(rows, key=lambda r: -r['self_us'])[:top],
+        'modules': rows,
+        'trace': trace
+    }
+
+
+def _walk_files(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            yield os.path.relpath(os.path.join(dirpath, name), root)
+
+
+def _top_level(rel):
+    return rel.split(os.sep, 1)[0]
+
+
+def _package_name(top):
+    """'boto3-1.34.0.dist-info' / 'psycopg2_binary.libs' / 'six.py' / '_cffi_backend.cpython-311-x86_64-linux-gnu.so' -> import-style name."""
+    if top.endswith('.dist-info'):
+        return top[:-len('.dist-info')].split('-', 1)[0].lower()
+    if top.endswith('.libs'):
+        return top[:-len('.libs')].lower()
+    return top.split('.', 1)[0].lower()
+
+
+def _is_junk(rel):
+    return any(part in JUNK_DIRS for part in rel.split(os.sep)[1:-1])
+
+
+def _dist_tops(layer, dist_info):
+    """Top-level names a .dist-info directory installed, from its RECORD."""
+    tops = set()
+    try:
+        with open(os.path.join(layer, dist_info, 'RECORD')) as f:
+            for line in f:
+                path = line.split(',', 1)[0]
+                if path and not path.startswith(dist_info):
+                    tops.add(_package_name(path.split('/', 1)[0]))
+    except FileNotFoundError:
+        tops.add(_package_name(dist_info))
+    return tops
+
+
+def select_layer_files(layer, traces, require=(), granularity='module'):
+    """Layer-relative paths to keep for the given traces (see build_layer)."""
+    every = sorted(_walk_files(layer))
+    reached = set()
+    for trace in traces:
+        reached.update(os.path.normpath(p) for p in trace['modules'].values())
+        reached.update(os.path.normpath(p) for p in trace['files'])
+    # The importer also probes bytecode caches that do not exist
+    reached = {p for p in reached if not p.startswith('..') and os.path.isfile(os.path.join(layer, p))}
+    keep_tops = {_package_name(_top_level(p)) for p in reached} | {r.lower() for r in require}
+
+    keep = set()
+    data_dirs = set()
+    for rel in reached:
+        keep.add(rel)
+        if rel.endswith('.py'):
+            head, name = os.path.split(rel)
+            stem = name[:-3]
+            for sibling in every:
+                if sibling.startswith(os.path.join(head, '__pycache__', stem + '.')) and sibling.endswith('.pyc'):
+                    keep.add(sibling)
+        elif not rel.endswith(('.so', '.pyd', '.pyc')):
+            # Data files: keep the whole directory (e.g. every model file of a botocore service)
+            data_dirs.add(os.path.dirname(rel))
+
+    for rel in every:
+        top = _top_level(rel)
+        name = _package_name(top)
+        if os.path.dirname(rel) in data_dirs:
+            keep.add(rel)
+        elif top.endswith('.libs') and any(name.startswith(t) for t in keep_tops):
+            # Vendored shared libraries are loaded by the linker, which the trace cannot see
+            keep.add(rel)
+        elif top.endswith('.dist-info') and _dist_tops(layer, top) & keep_tops:
+            keep.add(rel)
+        elif name in keep_tops and (granularity == 'package' or name in {r.lower() for r in require}) and not _is_junk(rel):
+            keep.add(rel)
+    return sorted(keep)
+
+
+def _size_by_top(root, files):
+    sizes = {}
+    for rel in files:
+        top = _package_name(_top_level(rel))
+        sizes[top] = sizes.get(top, 0) + os.path.getsize(os.path.join(root, rel))
+    return sizes
+
+
+def build_layer(traces, layer, out_dir, require=(), granularity='module', compile=True, make_zip=True):
+    """Write a pruned layer to ``<out_dir>/python`` (and ``<out_dir>.zip``); returns a size report.
+
+    ``granularity='module'`` keeps exactly the modules and data files the
+    traces reached; ``'package'`` keeps every reached top-level package whole
+    (minus tests/docs). Packages named in ``require`` are always kept whole.
+    Kept ``.py`` files are byte-compiled with the running interpreter unless
+    ``compile`` is False, because Lambda cannot write bytecode caches to /opt.
+    """
+    layer = os.path.abspath(layer)
+    files = select_layer_files(layer, traces, require, granularity)
+    target = os.path.join(out_dir, 'python')
+    shutil.rmtree(out_dir, ignore_errors=True)
+    for rel in files:
+        dest = os.path.join(target, rel)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copy2(os.path.join(layer, rel), dest)
+    os.makedirs(target, exist_ok=True)
+    if compile:
+        compileall.compile_dir(target, quiet=1)
+
+    before = _size_by_top(layer, list(_walk_files(layer)))
+    after = _size_by_top(target, list(_walk_files(target)))
+    report = {
+        'source_layer': layer,
+        'granularity': granularity,
+        'require': list(require),
+        'bytes_before': sum(before.values()),
+        'bytes_after': sum(after.values()),
+        'packages': {top: {'before': size, 'after': after.get(top, 0)} for top, size in sorted(before.items())},
+        'removed': sorted(top for top in before if top not in after)
+    }
+    with open(os.path.join(out_dir, 'layer-report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    if make_zip:
+        report['zip'] = shutil.make_archive(out_dir, 'zip', out_dir, 'python')
+    return report
+
+
+def bench(functions, runs=10, layer=None, pruned_layers=None, clients=(), env=None):
+    """Fresh-interpreter init times of each function, before and after.
+
+    before: source-only bundle with the shared layer (the current packaging).
+    after:  byte-compiled bundle with ``<pruned_layers>/<function>/python``
+            (or the shared layer when no pruned one exists).
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix='coldstart-bench-') as tmp:
+        for lambda_dir in functions:
+            name = short_name(lambda_dir)
+            pruned = os.path.join(pruned_layers, name, 'python') if pruned_layers else None
+            variants = {
+                'before': (stage_bundle(lambda_dir, os.path.join(tmp, name, 'before')), layer),
+                'after': (stage_bundle(lambda_dir, os.path.join(tmp, name, 'after'), compile=True),
+                          pruned if pruned and os.path.isdir(pruned) else layer)
+            }
+            entry = {'function': name}
+            for variant, (bundle, layer_dir) in variants.items():
+                samples = [run_child(bundle, layer_dir, clients, env=env) for _ in range(runs)]
+                init = [s['init_ms'] + s['clients_ms'] for s in samples]
+                entry[variant] = {
+                    'layer': layer_dir,
+                    'layer_bytes': sum(os.path.getsize(os.path.join(layer_dir, p)) for p in _walk_files(layer_dir)) if layer_dir else 0,
+                    'modules': len(samples[-1]['modules']),
+                    'init_p50_ms': round(percentile(init, 50), 2),
+                    'init_p99_ms': round(percentile(init, 99), 2)
+                }
+            entry['init_p50_change'] = round(entry['after']['init_p50_ms'] / entry['before']['init_p50_ms'] - 1, 3)
+            results.append(entry)
+    return results
+
+
+def _parse_env(pairs):
+    return dict(p.split('=', 1) for p in pairs or ())
+
+
+def _print_profile(report):
+    print(f"{report['function']}: handler import {report['init_ms']} ms, clients {report['clients_ms']} ms")
+    print('  by origin: ' + ', '.join(f'{k} {v} ms' for k, v in report['by_origin_ms'].items()))
+    print(f"  {'self ms':>9} {'cum ms':>9}  module")
+    for row in report['top_cumulative']:
+        print(f"  {row['self_us'] / 1000:9.2f} {row['cumulative_us'] / 1000:9.2f}  {'  ' * row['depth']}{row['name']} [{row['origin']}]")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cold-start profiling, layer pruning and init benchmarks.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('profile', help='import-time profile (and trace) of handlers')
+    p.add_argument('functions', nargs='*', default=list(FUNCTIONS))
+    p.add_argument('--layer', help='unpacked layer python/ directory to import dependencies from')
+    p.add_argument('--client', action='append', default=[], help='boto3 client to build after import (repeatable)')
+    p.add_argument('--event', help='JSON file with an event to invoke the handler with (local mode)')
+    p.add_argument('--env', action='append', help='KEY=VALUE for the handler environment (repeatable)')
+    p.add_argument('--top', type=int, default=20)
+    p.add_argument('--out', help='write the report (with trace) as JSON; a directory gets <function>.json per function')
+
+    b = sub.add_parser('build-layer', help='prune a layer to what the traces reached')
+    b.add_argument('traces', nargs='+', help='profile reports written with --out')
+    b.add_argument('--layer', required=True, help='full layer python/ directory (scripts/package_layer.sh)')
+    b.add_argument('--out', required=True, help='output directory; the zip is written next to it')
+    b.add_argument('--require', action='append', default=[], help='top-level package to keep whole (repeatable)')
+    b.add_argument('--granularity', choices=['module', 'package'], default='module')
+    b.add_argument('--no-compile', action='store_true', help='do not byte-compile the kept modules')
+
+    c = sub.add_parser('bench', help='compare cold-start init time before/after pruning')
+    c.add_argument('functions', nargs='*', default=list(FUNCTIONS))
+    c.add_argument('--runs', type=int, default=10)
+    c.add_argument('--layer', help='full layer python/ directory (the "before" layer)')
+    c.add_argument('--pruned-layers', help='directory with <function>/python pruned layers (the "after" layers)')
+    c.add_argument('--client', action='append', default=[])
+    c.add_argument('--env', action='append')
+    c.add_argument('--out', default=os.path.join(ROOT, 'build', 'benchmarks'))
+    args = parser.parse_args(argv)
+
+    if args.command == 'profile':
+        event = None
+        if args.event:
+            with open(args.event) as f:
+                event = json.load(f)
+        for lambda_dir in args.functions:
+            report = profile(lambda_dir, args.layer, args.client, event, _parse_env(args.env), args.top)
+            _print_profile(report)
+            if args.out:
+                path = os.path.join(args.out, f"{report['function']}.json") if len(args.functions) > 1 or os.path.isdir(args.out) else args.out
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                with open(path, 'w') as f:
+                    json.dump(report, f, indent=2)
+        return 0
+
+    if args.command == 'build-layer':
+        traces = []
+        for path in args.traces:
+            with open(path) as f:
+                traces.append(json.load(f)['trace'])
+        report = build_layer(traces, args.layer, args.out, args.require, args.granularity, compile=not args.no_compile)
+        print(f"{report['bytes_before']} -> {report['bytes_after']} bytes; removed: {', '.join(report['removed']) or 'nothing'}")
+        print(report.get('zip', args.out))
+        return 0
+
+    results = bench(args.functions, args.runs, args.layer, args.pruned_layers, args.client, _parse_env(args.env))
+    for r in results:
+        print(f"{r['function']}: init p50 {r['before']['init_p50_ms']} -> {r['after']['init_p50_ms']} ms ({r['init_p50_change']:+.1%}), "
+              f"layer {r['before']['layer_bytes']} -> {r['after']['layer_bytes']} bytes")
+    created_at = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f'coldstart-{created_at}.json')
+    with open(path, 'w') as f:
+        json.dump({'created_at': created_at, 'python': platform.python_version(), 'runs': args.runs, 'results': results}, f, indent=2)
+    print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
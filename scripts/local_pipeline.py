@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+
+# In-process run of ingestion -> processing -> analytics against FileSystemS3.
+#
+# Each Lambda handler is imported from src/ the same way it is packaged (its
+# own directory plus src/shared on sys.path), its bucket settings are pointed
+# at the local buckets and its boto3 client is replaced with the filesystem
+# stand-in. Events for the next stage are built from the objects the previous
+# stage created, exactly as the S3/EventBridge wiring would deliver them.
+#
+#   python scripts/local_pipeline.py --root build/local_s3
+#   python scripts/local_pipeline.py --mode stream --payload-format columnar
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from local_s3 import FileSystemS3
+
+DEFAULT_DB_PATH = os.path.join(ROOT, 'data', 'chinook.db')
+DEFAULT_QUERY = (
+    'SELECT Track.TrackId AS TrackId, Track.Name AS Name, Album.Title AS Title, Track.Composer AS Composer, '
+    'Track.Milliseconds AS Milliseconds, Track.UnitPrice AS UnitPrice '
+    'FROM Track JOIN Album ON Track.AlbumId = Album.AlbumId'
+)
+BUCKETS = {'raw': 'local-raw', 'processed': 'local-processed', 'analytics': 'local-analytics'}
+
+
+def load_lambda(lambda_dir, module='handler'):
+    """Import ``src/<lambda_dir>/<module>.py`` under a unique name with its directory on sys.path."""
+    src_dir = os.path.join(ROOT, 'src', lambda_dir)
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    name = f'local_{lambda_dir}_{module}'
+    spec = importlib.util.spec_from_file_location(name, os.path.join(src_dir, f'{module}.py'))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def s3_event(bucket, keys):
+    return {'Records': [{'s3': {'bucket': {'name': bucket}, 'object': {'key': k}}} for k in keys]}
+
+
+def list_keys(s3, bucket, prefix):
+    keys = []
+    token = None
+    while True:
+        kwargs = {'Bucket': bucket, 'Prefix': prefix}
+        if token:
+            kwargs['ContinuationToken'] = token
+        resp = s3.list_objects_v2(**kwargs)
+        keys.extend(obj['Key'] for obj in resp.get('Contents', []))
+        if not resp.get('IsTruncated'):
+            return keys
+        token = resp['NextContinuationToken']
+
+
+class LocalPipeline:
+    """The three Lambdas wired to one FileSystemS3 root.
+
+    ``run()`` performs one ingestion and feeds every new raw object through
+    processing and every new processed object through analytics, returning the
+    per-stage results with wall-clock timings.
+    """
+
+    def __init__(self, root, db_path=DEFAULT_DB_PATH, query=DEFAULT_QUERY, mode='batch', payload_format='json', chunk_size=None):
+        self.s3 = FileSystemS3(root)
+        self.query = query
+        # EMF documents emitted by the handlers, instead of printing them to stdout
+        self.emf = []
+        client = lambda name, **kwargs: self.s3
+
+        self.ingestion = load_lambda('ingestion_lambda')
+        self.ingestion.boto3_client = client
+        self.ingestion.DB_TYPE = 'sqlite'
+        self.ingestion.DB_PATH = db_path
+        self.ingestion.DB_S3_BUCKET = self.ingestion.DB_S3_KEY = ''
+        self.ingestion.RAW_BUCKET = BUCKETS['raw']
+        self.ingestion.INGEST_MODE = mode
+        self.ingestion.PAYLOAD_FORMAT = payload_format
+        if chunk_size:
+            self.ingestion.INGEST_CHUNK_SIZE = chunk_size
+
+        self.processing = load_lambda('processing_lambda')
+        self.processing.boto3_client = client
+        self.processing.RAW_BUCKET = BUCKETS['raw']
+        self.processing.PROCESSED_BUCKET = BUCKETS['processed']
+        self.processing.ANALYTICS_BUCKET = BUCKETS['analytics']
+        self.processing.PAYLOAD_FORMAT = payload_format
+
+        self.analytics = load_lambda('analytics_lambda')
+        self.analytics.boto3_client = client
+        self.analytics.PROCESSED_BUCKET = BUCKETS['processed']
+        self.analytics.ANALYTICS_BUCKET = BUCKETS['analytics']
+
+        for mod in (self.ingestion, self.processing, self.analytics):
+            mod.METRICS.sink = self.emf.append
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - start
+
+    def run_ingestion(self):
+        before = set(list_keys(self.s3, BUCKETS['raw'], 'raw/'))
+        previous = os.environ.get('INGEST_QUERY')
+        os.environ['INGEST_QUERY'] = self.query
+        try:
+            result, seconds = self._timed(self.ingestion.lambda_handler, {}, None)
+        finally:
+            if previous is None:
+                os.environ.pop('INGEST_QUERY', None)
+            else:
+                os.environ['INGEST_QUERY'] = previous
+        if result.get('status') != 'ok':
+            raise RuntimeError(f'ingestion failed: {result}')
+        new_keys = sorted(set(list_keys(self.s3, BUCKETS['raw'], 'raw/')) - before)
+        return {
+            'result': result, 'seconds': seconds, 'rows': result['row_count'], 'keys': new_keys,
+            'metrics': list(self.ingestion.METRICS.last)
+        }
+
+    def run_processing(self, raw_keys):
+        invocations = []
+        for key in raw_keys:
+            result, seconds = self._timed(self.processing.lambda_handler, s3_event(BUCKETS['raw'], [key]), None)
+            if result['status'] != 'ok':
+                raise RuntimeError(f'processing failed for {key}: {result}')
+            invocations.append({'key': key, 'seconds': seconds, 'results': result['results'], 'metrics': list(self.processing.METRICS.last)})
+        outputs = [
+            r['processed_path'][len(f"s3://{BUCKETS['processed']}/"):]
+            for inv in invocations for r in inv['results'] if r['status'] == 'ok'
+        ]
+        rows = sum(r.get('rows', 0) for inv in invocations for r in inv['results'])
+        return {'invocations': invocations, 'seconds': sum(i['seconds'] for i in invocations), 'rows': rows, 'keys': outputs}
+
+    def run_analytics(self, processed_keys):
+        invocations = []
+        for key in processed_keys:
+            result, seconds = self._timed(self.analytics.lambda_handler, s3_event(BUCKETS['processed'], [key]), None)
+            if result['status'] != 'ok':
+                raise RuntimeError(f'analytics failed for {key}: {result}')
+            invocations.append({'key': key, 'seconds': seconds, 'results': result['results'], 'metrics': list(self.analytics.METRICS.last)})
+        rows = sum(r.get('rows', 0) for inv in invocations for r in inv['results'])
+        return {'invocations': invocations, 'seconds': sum(i['seconds'] for i in invocations), 'rows': rows}
+
+    def run(self):
+        ingestion = self.run_ingestion()
+        processing = self.run_processing(ingestion['keys'])
+        analytics = self.run_analytics(processing['keys'])
+        return {'ingestion': ingestion, 'processing': processing, 'analytics': analytics}
+
+    def read_json(self, bucket, key):
+        return json.loads(self.s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run ingestion -> processing -> analytics locally against a filesystem S3.')
+    parser.add_argument('--root', default=os.path.join(ROOT, 'build', 'local_s3'), help='directory holding the local buckets')
+    parser.add_argument('--db-path', default=DEFAULT_DB_PATH)
+    parser.add_argument('--query', default=DEFAULT_QUERY)
+    parser.add_argument('--mode', choices=['batch', 'stream'], default='batch')
+    parser.add_argument('--payload-format', choices=['json', 'columnar'], default='json')
+    args = parser.parse_args(argv)
+
+    pipeline = LocalPipeline(args.root, args.db_path, args.query, args.mode, args.payload_format)
+    out = pipeline.run()
+    summary = {
+        stage: {'rows': res['rows'], 'seconds': round(res['seconds'], 4)}
+        for stage, res in out.items()
+    }
+    summary['raw_keys'] = out['ingestion']['keys']
+    summary['processed_keys'] = out['processing']['keys']
+    summary['root'] = pipeline.s3.root
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import io
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+
+# Filesystem-backed stand-in for the subset of the boto3 S3 client used by the
+# Lambdas, for running the whole pipeline in-process without AWS.
+#
+# Objects live at <root>/<bucket>/<key> with a <key>.meta.json sidecar holding
+# the ETag, content type and user metadata. Multipart uploads are staged under
+# <root>/.multipart/<upload id>/ and assembled on completion. Errors carry the
+# same ``response['Error']['Code']`` as botocore's ClientError, which is used
+# when botocore is installed.
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    class ClientError(Exception):
+        def __init__(self, error_response, operation_name):
+            super().__init__(f"An error occurred ({error_response['Error']['Code']}) when calling the {operation_name} operation")
+            self.response = error_response
+            self.operation_name = operation_name
+
+META_SUFFIX = '.meta.json'
+
+
+def _error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class FileSystemS3:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, bucket, key):
+        path = os.path.abspath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.join(self.root, bucket) + os.sep):
+            raise _error('InvalidKey', 'PutObject')
+        return path
+
+    def _meta(self, bucket, key):
+        try:
+            with open(self._path(bucket, key) + META_SUFFIX) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _store(self, bucket, key, source, etag, content_type=None, metadata=None):
+        """Atomically move ``source`` (a file path) into place with its metadata sidecar."""
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        meta = {
+            'ETag': etag,
+            'ContentType': content_type or 'binary/octet-stream',
+            'Metadata': {k.lower(): v for k, v in (metadata or {}).items()}
+        }
+        tmp_meta = f'{path}{META_SUFFIX}.{uuid.uuid4().hex}'
+        with open(tmp_meta, 'w') as f:
+            json.dump(meta, f)
+        os.replace(source, path)
+        os.replace(tmp_meta, path + META_SUFFIX)
+        return meta
+
+    def _check_conditions(self, bucket, key, if_match, if_none_match, operation):
+        current = self._meta(bucket, key)
+        if if_none_match == '*' and current is not None:
+            raise _error('PreconditionFailed', operation)
+        if if_match is not None and (current is None or current['ETag'] != if_match):
+            raise _error('PreconditionFailed', operation)
+
+    def put_object(self, Bucket, Key, Body=b'', ContentType=None, Metadata=None, IfMatch=None, IfNoneMatch=None, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        elif hasattr(Body, 'read'):
+            Body = Body.read()
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(Body)
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        with self._lock:
+            try:
+                self._check_conditions(Bucket, Key, IfMatch, IfNoneMatch, 'PutObject')
+            except ClientError:
+                os.remove(tmp)
+                raise
+            self._store(Bucket, Key, tmp, etag, ContentType, Metadata)
+        return {'ETag': etag}
+
+    def head_object(self, Bucket, Key, IfMatch=None, **kwargs):
+        meta = self._meta(Bucket, Key)
+        if meta is None:
+            raise _error('404', 'HeadObject')
+        if IfMatch is not None and IfMatch != meta['ETag']:
+            raise _error('PreconditionFailed', 'HeadObject')
+        return dict(meta, ContentLength=os.path.getsize(self._path(Bucket, Key)))
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        meta = self._meta(Bucket, Key)
+        if meta is None:
+            raise _error('NoSuchKey', 'GetObject')
+        if IfMatch is not None and IfMatch != meta['ETag']:
+            raise _error('PreconditionFailed', 'GetObject')
+        body = open(self._path(Bucket, Key), 'rb')
+        size = os.fstat(body.fileno()).st_size
+        if Range:
+            start, _, end = Range[len('bytes='):].partition('-')
+            start, end = int(start), min(int(end) if end else size - 1, size - 1)
+            body.seek(start)
+            data = body.read(end - start + 1)
+            body.close()
+            return dict(meta, Body=io.BytesIO(data), ContentLength=len(data))
+        return dict(meta, Body=body, ContentLength=size)
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        for path in (self._path(Bucket, Key), self._path(Bucket, Key) + META_SUFFIX):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None, MaxKeys=1000, StartAfter=None, **kwargs):
+        base = os.path.join(self.root, Bucket)
+        keys = []
+        for dirpath, _, files in os.walk(base):
+            for name in files:
+                if not name.endswith(META_SUFFIX):
+                    continue
+                key = os.path.relpath(os.path.join(dirpath, name[:-len(META_SUFFIX)]), base).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    keys.append(key)
+        keys.sort()
+        after = ContinuationToken or StartAfter
+        if after:
+            keys = [k for k in keys if k > after]
+        page = keys[:MaxKeys]
+        resp = {
+            'KeyCount': len(page),
+            'Contents': [
+                {'Key': k, 'Size': os.path.getsize(self._path(Bucket, k)), 'ETag': self._meta(Bucket, k)['ETag']}
+                for k in page
+            ],
+            'IsTruncated': len(keys) > MaxKeys
+        }
+        if resp['IsTruncated']:
+            resp['NextContinuationToken'] = page[-1]
+        return resp
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, Metadata=None, **kwargs):
+        upload_id = uuid.uuid4().hex
+        staging = os.path.join(self.root, '.multipart', upload_id)
+        os.makedirs(staging)
+        with open(os.path.join(staging, 'upload.json'), 'w') as f:
+            json.dump({'Bucket': Bucket, 'Key': Key, 'ContentType': ContentType, 'Metadata': Metadata or {}}, f)
+        return {'UploadId': upload_id, 'Bucket': Bucket, 'Key': Key}
+
+    def _staging(self, upload_id, operation):
+        staging = os.path.join(self.root, '.multipart', upload_id)
+        if not os.path.isdir(staging):
+            raise _error('NoSuchUpload', operation)
+        return staging
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        staging = self._staging(UploadId, 'UploadPart')
+        data = Body.read() if hasattr(Body, 'read') else bytes(Body)
+        with open(os.path.join(staging, f'{PartNumber:05d}.part'), 'wb') as f:
+            f.write(data)
+        return {'ETag': f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        staging = self._staging(UploadId, 'CompleteMultipartUpload')
+        with open(os.path.join(staging, 'upload.json')) as f:
+            upload = json.load(f)
+        assembled = os.path.join(staging, 'object')
+        digests = b''
+        with open(assembled, 'wb') as out:
+            for part in MultipartUpload['Parts']:
+                with open(os.path.join(staging, f"{part['PartNumber']:05d}.part"), 'rb') as f:
+                    data = f.read()
+                digests += hashlib.md5(data).digest()
+                out.write(data)
+        etag = f'"{hashlib.md5(digests).hexdigest()}-{len(MultipartUpload["Parts"])}"'
+        with self._lock:
+            self._store(Bucket, Key, assembled, etag, upload['ContentType'], upload['Metadata'])
+        shutil.rmtree(staging)
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        shutil.rmtree(self._staging(UploadId, 'AbortMultipartUpload'))
+        return {}
@@ -15,6 +15,20 @@ mkdir -p "$OUT_DIR"
 # Copy source into out dir and create a zip
 cp -r "$SRC_DIR"/* "$OUT_DIR"/
 
+# Bundle the modules shared by every handler (resource manager, etc.) next to handler.py
+SHARED_DIR="$(dirname "$0")/../src/shared"
+if [ -d "$SHARED_DIR" ]; then
+  cp "$SHARED_DIR"/*.py "$OUT_DIR"/
+fi
+
+# Lambda cannot write bytecode caches to /var/task, so every cold start would
+# recompile the bundle; ship it precompiled instead. The .pyc files are only
+# used when PYTHON matches the function runtime (python3.11).
+find "$OUT_DIR" -name __pycache__ -type d -prune -exec rm -rf {} +
+PYTHON_BIN="${PYTHON:-python3.11}"
+command -v "$PYTHON_BIN" > /dev/null || PYTHON_BIN=python3
+"$PYTHON_BIN" -m compileall -q "$OUT_DIR"
+
 pushd "$OUT_DIR" > /dev/null
 zip -r ../function.zip .
 popd
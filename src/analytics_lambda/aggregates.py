@@ -0,0 +1,150 @@
+from sketches import HyperLogLog, QuantileSketch
+
+# Mergeable partial aggregates for the analytics stage.
+#
+# One PartialAggregate is built per processed file. Partials (and rollups,
+# which are just merged partials) serialize to JSON and merge without access
+# to the underlying rows, so hourly/daily rollups are updated in O(new data).
+# Rollups remember which sources they already contain, which makes re-merging
+# the same partial (e.g. on a Lambda retry) a no-op.
+
+GROUP_COLUMNS = {'album': 'album_title', 'composer': 'composer'}
+DISTINCT_COLUMNS = {'track_id': 'track_id', 'album': 'album_title', 'composer': 'composer'}
+QUANTILE_COLUMNS = {'milliseconds': 'milliseconds'}
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+# Processed columns read by PartialAggregate.add (columnar payloads decode only these)
+INPUT_COLUMNS = frozenset(
+    list(GROUP_COLUMNS.values()) + list(DISTINCT_COLUMNS.values()) + list(QUANTILE_COLUMNS.values()) +
+    ['milliseconds', 'unit_price']
+)
+
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    return value if isinstance(value, (int, float)) else float(value)
+
+
+class PartialAggregate:
+    def __init__(self):
+        self.row_count = 0
+        self.duration_ms_total = 0
+        self.price_total = 0.0
+        # group name -> group value -> {'count', 'milliseconds', 'unit_price'}
+        self.groups = {name: {} for name in GROUP_COLUMNS}
+        self.distinct = {name: HyperLogLog() for name in DISTINCT_COLUMNS}
+        self.quantiles = {name: QuantileSketch() for name in QUANTILE_COLUMNS}
+        self.sources = set()
+
+    def add(self, row):
+        """Fold one processed row into the aggregate."""
+        ms = _number(row.get('milliseconds'))
+        price = _number(row.get('unit_price'))
+        self.row_count += 1
+        if ms is not None:
+            self.duration_ms_total += ms
+        if price is not None:
+            self.price_total += price
+        for name, column in GROUP_COLUMNS.items():
+            key = row.get(column)
+            key = 'UNKNOWN' if key is None else str(key)
+            g = self.groups[name].get(key)
+            if g is None:
+                g = self.groups[name][key] = {'count': 0, 'milliseconds': 0, 'unit_price': 0.0}
+            g['count'] += 1
+            if ms is not None:
+                g['milliseconds'] += ms
+            if price is not None:
+                g['unit_price'] += price
+        for name, column in DISTINCT_COLUMNS.items():
+            self.distinct[name].add(row.get(column))
+        for name, column in QUANTILE_COLUMNS.items():
+            self.quantiles[name].add(_number(row.get(column)))
+        return self
+
+    def merge(self, other):
+        """Merge ``other`` into this aggregate. Sources already merged are skipped."""
+        if other.sources and other.sources <= self.sources:
+            return self
+        self.row_count += other.row_count
+        self.duration_ms_total += other.duration_ms_total
+        self.price_total += other.price_total
+        for name, groups in other.groups.items():
+            mine = self.groups.setdefault(name, {})
+            for key, g in groups.items():
+                m = mine.get(key)
+                if m is None:
+                    mine[key] = dict(g)
+                else:
+                    m['count'] += g['count']
+                    m['milliseconds'] += g['milliseconds']
+                    m['unit_price'] += g['unit_price']
+        for name, hll in other.distinct.items():
+            self.distinct.setdefault(name, HyperLogLog(p=hll.p)).merge(hll)
+        for name, sketch in other.quantiles.items():
+            self.quantiles.setdefault(name, QuantileSketch(sketch.relative_accuracy)).merge(sketch)
+        self.sources |= other.sources
+        return self
+
+    def summary(self):
+        """Dashboard-friendly view: totals, distinct estimates, quantiles and top groups."""
+        return {
+            'row_count': self.row_count,
+            'duration_ms_total': self.duration_ms_total,
+            'price_total': round(self.price_total, 2),
+            'distinct': {name: hll.estimate() for name, hll in self.distinct.items()},
+            'quantiles': {
+                name: {f'p{int(q * 100)}': sketch.quantile(q) for q in SUMMARY_QUANTILES}
+                for name, sketch in self.quantiles.items()
+            },
+            'album_counts': {k: g['count'] for k, g in self.groups.get('album', {}).items()}
+        }
+
+    def to_dict(self):
+        return {
+            'version': 1,
+            'row_count': self.row_count,
+            'duration_ms_total': self.duration_ms_total,
+            'price_total': self.price_total,
+            'groups': self.groups,
+            'distinct': {name: hll.to_dict() for name, hll in self.distinct.items()},
+            'quantiles': {name: s.to_dict() for name, s in self.quantiles.items()},
+            'sources': sorted(self.sources),
+            'summary': self.summary()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        agg = cls()
+        agg.row_count = data['row_count']
+        agg.duration_ms_total = data['duration_ms_total']
+        agg.price_total = data['price_total']
+        agg.groups = data['groups']
+        agg.distinct = {name: HyperLogLog.from_dict(d) for name, d in data['distinct'].items()}
+        agg.quantiles = {name: QuantileSketch.from_dict(d) for name, d in data['quantiles'].items()}
+        agg.sources = set(data.get('sources', []))
+        return agg
+
+
+def build_partial(rows, source):
+    """Aggregate an iterable of processed rows from ``source`` into a PartialAggregate."""
+    agg = PartialAggregate()
+    for row in rows:
+        agg.add(row)
+    agg.sources.add(source)
+    return agg
+
+
+def merge_all(partials):
+    """Merge any number of partials/rollups into a new aggregate."""
+    out = PartialAggregate()
+    for p in partials:
+        out.merge(p)
+    return out
+
+
+def rollup_windows(timestamp):
+    """Hourly and daily window ids for a pipeline timestamp like ``2025-10-28T12-15-52Z``."""
+    day, _, rest = timestamp.partition('T')
+    hour = rest[:2] if rest[:2].isdigit() else '00'
+    return f'{day}T{hour}', day
@@ -1,4 +1,146 @@
+import os
+import sys
+import json
+import logging
+from datetime import datetime
+
+# Shared modules are bundled next to the handler by scripts/package_lambda.sh;
+# when running from the source tree pick them up from src/shared instead.
+_SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared')
+if os.path.isdir(_SHARED_DIR) and _SHARED_DIR not in sys.path:
+    sys.path.append(_SHARED_DIR)
+
+from resource_manager import RESOURCES
+from metrics import Metrics, add_totals, stage, timed_reader
+from s3_events import parse_records
+from json_stream import PayloadReader
+from object_store import open_store, update_json
+from aggregates import INPUT_COLUMNS, PartialAggregate, build_partial, rollup_windows
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+# Environment variables expected:
+# PROCESSED_BUCKET: default source bucket when an event record has no bucket name
+# ANALYTICS_BUCKET: destination for partial aggregates and rollups (local fallback: LOCAL_UPLOAD_DIR)
+#
+# Layout in the analytics bucket:
+#   analytics/partials/<processed key>.json      one mergeable partial per processed file
+#   analytics/rollups/hourly/<YYYY-MM-DDTHH>.json
+#   analytics/rollups/daily/<YYYY-MM-DD>.json
+
+PROCESSED_BUCKET = os.environ.get('PROCESSED_BUCKET', '')
+ANALYTICS_BUCKET = os.environ.get('ANALYTICS_BUCKET', '')
+
+# Stage timings (download, aggregate, rollup) as EMF metrics; see shared/metrics.py
+METRICS = Metrics('analytics')
+
+
+def boto3_client(service_name):
+    # Cached across warm invocations by the shared resource manager
+    return RESOURCES.client(service_name)
+
+
+def partial_key(key):
+    base = key[len('processed/'):] if key.startswith('processed/') else key
+    base = base.rsplit('.', 1)[0] if '.' in base.rsplit('/', 1)[-1] else base
+    return f'analytics/partials/{base}.json'
+
+
+def _window_timestamp(meta, key):
+    """Pick the time the data belongs to: fetch time, then processing time, then the key, then now."""
+    for candidate in (meta.get('fetched_at'), meta.get('processed_at')):
+        if candidate:
+            return str(candidate)
+    parts = key.split('/')
+    if len(parts) > 2 and 'T' in parts[1]:
+        return parts[1]
+    return datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+
+
+def merge_into_rollup(store, key, partial, window):
+    """Merge ``partial`` into the rollup at ``key`` with a conditional read-modify-write."""
+    def update(current):
+        rollup = PartialAggregate.from_dict(current) if current else PartialAggregate()
+        doc = rollup.merge(partial).to_dict()
+        doc['window'] = window
+        doc['updated_at'] = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+        return doc
+    return update_json(store, key, update)
+
+
+def process_object(s3, store, bucket, key):
+    """Build the partial aggregate for one processed file and merge it into its rollups."""
+    with stage('download'):
+        resp = s3.get_object(Bucket=bucket, Key=key)
+    reader = PayloadReader(
+        timed_reader(resp['Body']),
+        key=key,
+        content_type=resp.get('ContentType'),
+        metadata=resp.get('Metadata'),
+        columns=INPUT_COLUMNS
+    )
+    source = f's3://{bucket}/{key}'
+    with stage('aggregate') as t:
+        partial = build_partial(reader, source)
+        t.add(rows=partial.row_count)
+    add_totals(rows=partial.row_count)
+
+    hourly, daily = rollup_windows(_window_timestamp(reader.meta, key))
+    out_key = partial_key(key)
+    doc = partial.to_dict()
+    doc['window'] = hourly
+    with stage('rollup'):
+        store.put(out_key, json.dumps(doc).encode('utf-8'))
+        hourly_doc = merge_into_rollup(store, f'analytics/rollups/hourly/{hourly}.json', partial, hourly)
+        merge_into_rollup(store, f'analytics/rollups/daily/{daily}.json', partial, daily)
+    return {
+        'status': 'ok',
+        'input': source,
+        'partial_path': store.path(out_key),
+        'rows': partial.row_count,
+        'hourly': hourly,
+        'daily': daily,
+        'hourly_rows': hourly_doc['row_count']
+    }
+
+
+@METRICS.instrument
 def lambda_handler(event, context):
-    # Minimal placeholder analytics handler
-    print("Analytics lambda invoked. Event:", event)
-    return {"status": "analytics"}
+    """Aggregate processed files into mergeable partials and hourly/daily rollups.
+
+    Each processed file is read once; its partial is stored and merged into
+    the rollups, so dashboards never rescan processed/.
+    """
+    logger.info('Analytics lambda invoked')
+    records = parse_records(event)
+    if not records:
+        logger.error('No S3 records found in event')
+        return {'status': 'error', 'message': 'no records in event'}
+
+    s3 = boto3_client('s3')
+    store = open_store(s3 if ANALYTICS_BUCKET else None, ANALYTICS_BUCKET)
+    results = []
+    for bucket, key in records:
+        bucket = bucket or PROCESSED_BUCKET
+        if not key or key.rsplit('/', 1)[-1].startswith('_'):
+            results.append({'status': 'skipped', 'input': key})
+            continue
+        try:
+            result = process_object(s3, store, bucket, key)
+        except Exception as e:
+            logger.exception(f'Error aggregating s3://{bucket}/{key}')
+            results.append({'status': 'error', 'input': f's3://{bucket}/{key}', 'error': str(e)})
+            continue
+        logger.info(f"Aggregated {result['input']}: {result['rows']} rows into {result['hourly']} / {result['daily']}")
+        results.append(result)
+
+    errors = sum(1 for r in results if r['status'] == 'error')
+    if not errors:
+        status = 'ok'
+    elif errors == len(results):
+        status = 'error'
+    else:
+        status = 'partial'
+    return {'status': status, 'results': results}
@@ -0,0 +1,135 @@
+import math
+import base64
+import hashlib
+
+# Mergeable sketches used by the analytics partial aggregates.
+#
+# Both sketches merge associatively and commutatively, so per-file partials can
+# be folded into hourly/daily rollups in any order without re-reading rows.
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """HyperLogLog distinct-count estimator (2**p one-byte registers, ~1.04/sqrt(2**p) error)."""
+
+    def __init__(self, p=12, registers=None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    def add(self, value):
+        if value is None:
+            return
+        x = _hash64(value)
+        idx = x >> (64 - self.p)
+        rest = (x << self.p) & ((1 << 64) - 1)
+        # Rank of the first 1 bit in the remaining 64 - p bits
+        rank = 64 - rest.bit_length() + 1 if rest else (64 - self.p) + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError('Cannot merge HyperLogLog sketches with different precision')
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_dict(self):
+        return {'p': self.p, 'registers': base64.b64encode(bytes(self.registers)).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(p=data['p'], registers=base64.b64decode(data['registers']))
+
+
+class QuantileSketch:
+    """Relative-error quantile sketch over non-negative values with logarithmic buckets (DDSketch style).
+
+    Any quantile is returned within ``relative_accuracy`` of the true value.
+    Merging adds bucket counts, so it is exact with respect to the sketches.
+    """
+
+    def __init__(self, relative_accuracy=0.01, buckets=None, zero_count=0, count=0, min_value=None, max_value=None):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = dict(buckets or {})
+        self.zero_count = zero_count
+        self.count = count
+        self.min = min_value
+        self.max = max_value
+
+    def add(self, value):
+        if value is None:
+            return
+        value = float(value)
+        if value < 0:
+            raise ValueError('QuantileSketch only supports non-negative values')
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if value == 0:
+            self.zero_count += 1
+            return
+        idx = int(math.ceil(math.log(value) / self._log_gamma))
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge quantile sketches with different accuracy')
+        for idx, n in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if rank < seen:
+                value = 2 * self.gamma ** idx / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'buckets': {str(k): v for k, v in self.buckets.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'min': self.min,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            relative_accuracy=data['relative_accuracy'],
+            buckets={int(k): v for k, v in data['buckets'].items()},
+            zero_count=data['zero_count'],
+            count=data['count'],
+            min_value=data['min'],
+            max_value=data['max']
+        )
@@ -0,0 +1,273 @@
+import re
+import json
+import uuid
+import zlib
+from contextlib import closing
+from datetime import datetime
+
+from json_stream import PayloadReader
+from key_layout import partition_of, split_key, table_of
+from object_store import update_json
+
+# Small-file compaction for the raw/ and processed/ prefixes.
+#
+# Objects under <prefix><timestamp>/... are grouped into time partitions
+# (hour or day of the timestamp) and, for multi-table ingestion keys
+# (<prefix><timestamp>/<table>/...), by table. Each group's rows are rewritten
+# as gzip NDJSON objects of roughly ``target_bytes`` each, so tables are never
+# mixed in one output:
+#
+#   compacted/<prefix><partition>/[<table>/]part-<run_id>-NNNNN.ndjson.gz
+#   compacted/<prefix><partition>/[<table>/]_manifest.json
+#
+# The manifest is the commit point. It is updated with a conditional write and
+# lists every compacted object with the source keys it replaces; sources are
+# deleted only after the manifest has been committed. A run that fails before
+# the commit leaves unreferenced part files (ignored by readers); a run that
+# fails after it leaves sources that the next run recognizes from the manifest
+# and deletes. Re-running is therefore always safe.
+#
+# Partitioned ingestion runs (raw/<timestamp>/<run>/part-NNNNN.* plus a run
+# _manifest.json listing those keys) are never compacted, so the run manifest
+# keeps pointing at objects that exist. Their processed counterparts have no
+# manifest and are compacted like any other object.
+
+COMPACTED_PREFIX = 'compacted/'
+MANIFEST_NAME = '_manifest.json'
+GZIP_NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+class CompactionConflict(Exception):
+    """Another run committed some of the same sources first."""
+
+
+def _scope(prefix, partition, table=None):
+    return f'{prefix}{partition}/{table}/' if table else f'{prefix}{partition}/'
+
+
+def manifest_key(prefix, partition, table=None):
+    return f'{COMPACTED_PREFIX}{_scope(prefix, partition, table)}{MANIFEST_NAME}'
+
+
+def load_manifest(store, prefix, partition, table=None):
+    current = store.get(manifest_key(prefix, partition, table))
+    return json.loads(current[0]) if current else None
+
+
+def replaced_sources(manifest):
+    """Every source key already folded into a compacted object."""
+    if not manifest:
+        return set()
+    return {src for obj in manifest['objects'] for src in obj['sources']}
+
+
+# Object names of partitioned ingestion runs (see ingestion extract_partitioned)
+_RUN_PART = re.compile(r'^part-\d{5}\.')
+# Prefixes where those runs write their run manifests
+RUN_MANIFEST_PREFIXES = ('raw/',)
+
+
+def _split_dir(key):
+    sep = '/' if '/' in key else '_'
+    return key.rsplit(sep, 1) if sep in key else ('', key)
+
+
+def partitioned_run_dirs(keys):
+    """Directories holding a partitioned run manifest (``.../<run>/_manifest.json``)."""
+    dirs = set()
+    for key in keys:
+        sep = '/' if '/' in key else '_'
+        if key.endswith(sep + MANIFEST_NAME):
+            dirs.add(key[:-len(MANIFEST_NAME) - 1])
+    return dirs
+
+
+def object_table(key, prefix):
+    """Table of a data key (see key_layout.table_of); a partitioned run's directory is not a table."""
+    parsed = split_key(key, prefix)
+    if parsed and _RUN_PART.match(parsed[1].rsplit('/', 1)[-1]):
+        # <table>/<run>/part-NNNNN.* or <run>/part-NNNNN.*
+        parts = parsed[1].split('/')
+        return parts[0] if len(parts) > 2 else None
+    return table_of(key, prefix)
+
+
+def group_partitions(listing, prefix, granularity='hour'):
+    """Group ``(key, size)`` pairs into ``{(partition, table): [(key, size), ...]}``.
+
+    ``table`` is the table component of multi-table keys and None for
+    single-query keys.
+
+    Under RUN_MANIFEST_PREFIXES, objects of partitioned ingestion runs are left
+    out: a directory with a run manifest, or part-NNNNN objects whose run has
+    not written its manifest yet.
+    """
+    listing = list(listing)
+    runs = prefix in RUN_MANIFEST_PREFIXES
+    run_dirs = partitioned_run_dirs(key for key, _ in listing) if runs else set()
+    groups = {}
+    for key, size in listing:
+        parsed = split_key(key, prefix)
+        if parsed is None:
+            continue
+        if runs:
+            directory, name = _split_dir(key)
+            if directory in run_dirs or _RUN_PART.match(name):
+                continue
+        group = (partition_of(parsed[0], granularity), object_table(key, prefix))
+        groups.setdefault(group, []).append((key, size))
+    return groups
+
+
+class _GzipPart:
+    """One compacted output object: rows are NDJSON-encoded and gzip-compressed on the fly."""
+
+    def __init__(self, store, key):
+        self.key = key
+        self.writer = store.writer(key, content_type=GZIP_NDJSON_CONTENT_TYPE)
+        self.path = self.writer.path
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self.rows = 0
+        self.raw_bytes = 0
+        self.bytes = 0
+        self.sources = []
+
+    def _emit(self, data):
+        if data:
+            self.writer.write(data)
+            self.bytes += len(data)
+
+    def write_rows(self, rows, batch=1000):
+        pending = []
+        for row in rows:
+            pending.append(json.dumps(row, default=str))
+            if len(pending) >= batch:
+                self._write_lines(pending)
+                pending = []
+        if pending:
+            self._write_lines(pending)
+
+    def _write_lines(self, lines):
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        self.rows += len(lines)
+        self.raw_bytes += len(data)
+        self._emit(self._gzip.compress(data))
+
+    def close(self):
+        self._emit(self._gzip.flush())
+        self.writer.close()
+        return {
+            'key': self.key,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'uncompressed_bytes': self.raw_bytes,
+            'sources': self.sources
+        }
+
+
+def compact_partition(store, prefix, partition, objects, target_bytes, small_bytes, min_files=2, run_id=None, on_commit=None,
+                      table=None):
+    """Compact the small objects of one partition (of one ``table`` for multi-table keys).
+
+    ``objects`` are the ``(key, size)`` pairs listed for the partition. When
+    given, ``on_commit(manifest_objects)`` runs after the manifest commit and
+    before the sources are deleted (and again for committed objects whose
+    sources are still present), so it must be idempotent. Returns a result dict
+    with ``status`` ``compacted``, ``skipped`` or ``conflict``.
+    """
+    run_id = run_id or uuid.uuid4().hex[:12]
+    manifest = load_manifest(store, prefix, partition, table)
+    done = replaced_sources(manifest)
+
+    # Finish the cleanup of an earlier run that committed but did not delete
+    cleaned = [key for key, _ in objects if key in done]
+    if cleaned and on_commit:
+        leftover = set(cleaned)
+        on_commit([obj for obj in manifest['objects'] if leftover.intersection(obj['sources'])])
+    for key in cleaned:
+        store.delete(key)
+
+    pending = sorted(key for key, size in objects if key not in done and size < small_bytes)
+    result = {'prefix': prefix, 'partition': partition, 'run_id': run_id, 'cleaned': len(cleaned)}
+    if table:
+        result['table'] = table
+    if len(pending) < min_files:
+        return dict(result, status='skipped', sources=len(pending))
+
+    written = []
+    part = None
+    try:
+        for key in pending:
+            if part is None:
+                part = _GzipPart(store, f'{COMPACTED_PREFIX}{_scope(prefix, partition, table)}part-{run_id}-{len(written):05d}.ndjson.gz')
+            with closing(store.open(key)) as body:
+                part.write_rows(PayloadReader(body, key=key))
+            part.sources.append(key)
+            # Roll over at source boundaries so each source lives in exactly one output
+            if part.bytes >= target_bytes:
+                written.append(part.close())
+                part = None
+        if part is not None:
+            written.append(part.close())
+            part = None
+
+        committed_at = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+        for obj in written:
+            obj['run_id'] = run_id
+            obj['compacted_at'] = committed_at
+
+        def commit(current):
+            manifest = current or {'version': 1, 'prefix': prefix, 'partition': partition, 'objects': []}
+            if table:
+                manifest['table'] = table
+            overlap = replaced_sources(manifest).intersection(pending)
+            if overlap:
+                raise CompactionConflict(f'{len(overlap)} sources already compacted by another run')
+            manifest['objects'].extend(written)
+            manifest['updated_at'] = committed_at
+            return manifest
+
+        update_json(store, manifest_key(prefix, partition, table), commit)
+    except Exception as e:
+        if part is not None:
+            part.writer.abort()
+        for obj in written:
+            store.delete(obj['key'])
+        if isinstance(e, CompactionConflict):
+            return dict(result, status='conflict', error=str(e))
+        raise
+
+    if on_commit:
+        on_commit(written)
+    for key in pending:
+        store.delete(key)
+    return dict(
+        result,
+        status='compacted',
+        sources=len(pending),
+        outputs=[store.path(obj['key']) for obj in written],
+        rows=sum(obj['rows'] for obj in written),
+        bytes=sum(obj['bytes'] for obj in written)
+    )
+
+
+def partition_objects(store, prefix, partition, table=None):
+    """Keys to read for a consistent view of one partition (of one ``table``).
+
+    Compacted objects from the manifest plus any data file the manifest does
+    not cover yet. Safe to call at any point of a compaction run.
+    """
+    manifest = load_manifest(store, prefix, partition, table)
+    done = replaced_sources(manifest)
+    keys = [obj['key'] for obj in manifest['objects']] if manifest else []
+    for key, _ in store.list(f'{prefix}{partition}'):
+        if key not in done and split_key(key, prefix) is not None and object_table(key, prefix) == table:
+            keys.append(key)
+    return keys
+
+
+def iter_partition_rows(store, prefix, partition, table=None):
+    """Yield every row of a partition, reading compacted and uncompacted objects alike."""
+    for key in partition_objects(store, prefix, partition, table):
+        with closing(store.open(key)) as body:
+            yield from PayloadReader(body, key=key)
@@ -0,0 +1,115 @@
+import os
+import sys
+import logging
+from datetime import datetime
+
+# Shared modules are bundled next to the handler by scripts/package_lambda.sh;
+# when running from the source tree pick them up from src/shared instead.
+_SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared')
+if os.path.isdir(_SHARED_DIR) and _SHARED_DIR not in sys.path:
+    sys.path.append(_SHARED_DIR)
+
+from resource_manager import RESOURCES
+from object_store import open_store
+from key_layout import partition_end
+from file_index import INDEXED_PREFIXES, build_entry, replace_entries
+from compaction import compact_partition, group_partitions
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+# Environment variables expected:
+# RAW_BUCKET / PROCESSED_BUCKET: buckets holding raw/ and processed/ (empty: LOCAL_UPLOAD_DIR)
+# COMPACTION_PREFIXES: comma separated prefixes to compact (default raw/,processed/)
+# COMPACTION_GRANULARITY: time partition of the timestamp directories, hour or day
+# COMPACTION_TARGET_BYTES: compressed size at which a compacted object is closed (default 128 MiB)
+# COMPACTION_SMALL_BYTES: only objects below this size are compacted (default 32 MiB)
+# COMPACTION_MIN_FILES: skip partitions with fewer small objects than this
+# COMPACTION_INCLUDE_OPEN: also compact partitions whose time window has not closed yet
+
+RAW_BUCKET = os.environ.get('RAW_BUCKET', '')
+PROCESSED_BUCKET = os.environ.get('PROCESSED_BUCKET', '')
+COMPACTION_PREFIXES = [p for p in os.environ.get('COMPACTION_PREFIXES', 'raw/,processed/').split(',') if p]
+COMPACTION_GRANULARITY = os.environ.get('COMPACTION_GRANULARITY', 'hour')
+COMPACTION_TARGET_BYTES = int(os.environ.get('COMPACTION_TARGET_BYTES', 128 * 1024 * 1024))
+COMPACTION_SMALL_BYTES = int(os.environ.get('COMPACTION_SMALL_BYTES', 32 * 1024 * 1024))
+COMPACTION_MIN_FILES = int(os.environ.get('COMPACTION_MIN_FILES', 2))
+COMPACTION_INCLUDE_OPEN = os.environ.get('COMPACTION_INCLUDE_OPEN', '').lower() in ('1', 'true', 'yes')
+
+
+def boto3_client(service_name):
+    # Cached across warm invocations by the shared resource manager
+    return RESOURCES.client(service_name)
+
+
+def bucket_for(prefix):
+    return PROCESSED_BUCKET if prefix.startswith('processed') else RAW_BUCKET
+
+
+def reindex(store, prefix, partition):
+    """Commit hook: swap the file-index entries of compacted sources for the compacted object."""
+    def on_commit(objects):
+        for obj in objects:
+            entry = build_entry(obj['key'], obj['rows'], obj['bytes'], {}, compacted_at=obj.get('compacted_at'))
+            replace_entries(store, prefix, obj['sources'], entry, partition)
+    return on_commit
+
+
+def compact_prefix(store, prefix, partitions=None, include_open=False, now=None):
+    """Compact every (or the selected) partition under ``prefix``; one result per partition and table."""
+    now = now or datetime.utcnow()
+    groups = group_partitions(store.list(prefix), prefix, COMPACTION_GRANULARITY)
+    results = []
+    for partition, table in sorted(groups, key=lambda group: (group[0], group[1] or '')):
+        scope = f'{prefix}{partition}' + (f'/{table}' if table else '')
+        base = {'prefix': prefix, 'partition': partition}
+        if table:
+            base['table'] = table
+        if partitions and partition not in partitions:
+            continue
+        if not include_open and partition_end(partition) >= now:
+            results.append(dict(base, status='open'))
+            continue
+        try:
+            result = compact_partition(
+                store, prefix, partition, groups[(partition, table)],
+                target_bytes=COMPACTION_TARGET_BYTES,
+                small_bytes=COMPACTION_SMALL_BYTES,
+                min_files=COMPACTION_MIN_FILES,
+                on_commit=reindex(store, prefix, partition) if prefix in INDEXED_PREFIXES else None,
+                table=table
+            )
+        except Exception as e:
+            logger.exception(f'Compaction of {scope} failed')
+            result = dict(base, status='error', error=str(e))
+        logger.info(f"{scope}: {result['status']}")
+        results.append(result)
+    return results
+
+
+def lambda_handler(event, context):
+    """Compact small raw/processed objects into target-sized gzip NDJSON objects.
+
+    Meant to run on a schedule. The event may narrow the run with ``prefixes``
+    and ``partitions`` and set ``include_open`` to compact the current window.
+    """
+    event = event or {}
+    prefixes = event.get('prefixes') or COMPACTION_PREFIXES
+    partitions = set(event.get('partitions') or [])
+    include_open = bool(event.get('include_open', COMPACTION_INCLUDE_OPEN))
+
+    results = []
+    for prefix in prefixes:
+        bucket = bucket_for(prefix)
+        store = open_store(boto3_client('s3') if bucket else None, bucket)
+        results.extend(compact_prefix(store, prefix, partitions, include_open))
+
+    errors = sum(1 for r in results if r['status'] == 'error')
+    if not errors:
+        status = 'ok'
+    elif errors == len(results):
+        status = 'error'
+    else:
+        status = 'partial'
+    return {'status': status, 'results': results}
@@ -1,19 +1,32 @@
 import os
+import sys
 import json
+import time
 import logging
-import sqlite3
+import itertools
+from contextlib import contextmanager
 from datetime import datetime
 import uuid
 
-# Lazy-import boto3 only when needed for S3 operations
-_boto3 = None
+# Shared modules are bundled next to the handler by scripts/package_lambda.sh;
+# when running from the source tree pick them up from src/shared instead.
+_SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared')
+if os.path.isdir(_SHARED_DIR) and _SHARED_DIR not in sys.path:
+    sys.path.append(_SHARED_DIR)
+
+from resource_manager import RESOURCES
+from metrics import Metrics, add_totals, stage, timed_iter, timed_writer
+from snapshot_cache import SnapshotCache
+from streaming import NDJSON_CONTENT_TYPE, LocalFileWriter, S3MultipartWriter, SpoolWriter, encode_ndjson
+from columnar import COLUMNAR_CONTENT_TYPE, COLUMNAR_FORMAT, COLUMNAR_SUFFIX, FORMAT_METADATA_KEY, ColumnarWriter, encode_columnar, is_columnar
+from partitioned import MANIFEST_NAME, bounds_query, build_manifest, partition_query, run_partitions, split_ranges
+from watermark import WatermarkStore, advance, build_incremental_query, new_state, watermark_id
+from content_digest import DIGEST_METADATA_KEY, DIGEST_STATE_PREFIX, RowDigest, digest_rows, digest_state, extract_id
+from job_spec import JOB_SETTINGS, SINGLE_QUERY_KEY_LAYOUT, load_job_spec, render_key, run_jobs
+
+# boto3 is imported lazily by the resource manager and clients are reused across warm invocations
 def boto3_client(service_name):
-    global _boto3
-    if _boto3 is None:
-        import boto3 as _b
-        _boto3 = _b
-    return _boto3.client(service_name)
-import tempfile
+    return RESOURCES.client(service_name)
 
 # Lazy import for boto3 only when needed
 
@@ -27,6 +40,22 @@ logger.setLevel(logging.INFO)
 # For postgres: DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
 # For sqlite: DB_PATH (path to .db file)
 # RAW_BUCKET
+# INGEST_MODE: 'batch' (default, single JSON object) or 'stream' (chunked NDJSON + multipart upload)
+# INGEST_CHUNK_SIZE: rows fetched and encoded per chunk in stream mode
+# S3_PART_SIZE: multipart part size in bytes (min 5 MiB)
+# INCREMENTAL_COLUMN: output column of INGEST_QUERY used as high-water mark (enables incremental mode)
+# INCREMENTAL_BATCH_LIMIT: optional max rows per incremental run
+# INGEST_STATE_DIR: local watermark directory used when RAW_BUCKET is empty
+# PARTITION_COLUMN: numeric output column to split the extract on (enables partitioned mode)
+# PARTITION_COUNT: number of key ranges; PARTITION_CONCURRENCY: parallel DB connections
+# SNAPSHOT_CACHE_DIR / SNAPSHOT_CACHE_MAX_BYTES: /tmp cache for S3-hosted sqlite snapshots
+# SNAPSHOT_DOWNLOAD_CONCURRENCY / SNAPSHOT_DOWNLOAD_CHUNK_SIZE: ranged download settings
+# PAYLOAD_FORMAT: 'json' (default; JSON envelope / NDJSON) or 'columnar' (compressed columnar .colz objects)
+# CHANGE_DETECTION: 'true' to skip the upload when the rows hash the same as the query's last extract
+#   (batch and stream modes; the digest lives next to the watermarks under _state/digests/)
+# INGEST_JOB_SPEC / INGEST_JOB_SPEC_FILE: multi-table job spec as JSON or a JSON file (see job_spec.py);
+#   an event with "tables" is used as the spec instead
+# INGEST_JOB_CONCURRENCY: tables extracted in parallel when the spec sets no "concurrency"
 
 DB_TYPE = os.environ.get('DB_TYPE', 'postgres').lower()
 DB_HOST = os.environ.get('DB_HOST')
@@ -40,10 +69,119 @@ DB_S3_KEY = os.environ.get('DB_S3_KEY')
 RAW_BUCKET = os.environ.get('RAW_BUCKET', os.environ.get('RAW_S3_BUCKET', ''))
 DB_S3_BUCKET = os.environ.get('DB_S3_BUCKET', '')
 DB_S3_KEY = os.environ.get('DB_S3_KEY', '')
+INGEST_MODE = os.environ.get('INGEST_MODE', 'batch').lower()
+INGEST_CHUNK_SIZE = int(os.environ.get('INGEST_CHUNK_SIZE', 1000))
+S3_PART_SIZE = int(os.environ.get('S3_PART_SIZE', 8 * 1024 * 1024))
+INCREMENTAL_COLUMN = os.environ.get('INCREMENTAL_COLUMN', '')
+INCREMENTAL_BATCH_LIMIT = int(os.environ.get('INCREMENTAL_BATCH_LIMIT', 0))
+INGEST_STATE_DIR = os.environ.get('INGEST_STATE_DIR', 'build/state')
+PARTITION_COLUMN = os.environ.get('PARTITION_COLUMN', '')
+PARTITION_COUNT = int(os.environ.get('PARTITION_COUNT', 4))
+PARTITION_CONCURRENCY = int(os.environ.get('PARTITION_CONCURRENCY', PARTITION_COUNT))
+PAYLOAD_FORMAT = os.environ.get('PAYLOAD_FORMAT', 'json').lower()
+CHANGE_DETECTION = os.environ.get('CHANGE_DETECTION', 'false').strip().lower() in ('1', 'true', 'yes')
+INGEST_JOB_SPEC = os.environ.get('INGEST_JOB_SPEC', '')
+INGEST_JOB_SPEC_FILE = os.environ.get('INGEST_JOB_SPEC_FILE', '')
+INGEST_JOB_CONCURRENCY = int(os.environ.get('INGEST_JOB_CONCURRENCY', 4))
+
+# Survives across warm invocations, so an unchanged snapshot costs a single HEAD request
+SNAPSHOT_CACHE = SnapshotCache(
+    cache_dir=os.environ.get('SNAPSHOT_CACHE_DIR', '/tmp/db_snapshots'),
+    max_bytes=int(os.environ.get('SNAPSHOT_CACHE_MAX_BYTES', 400 * 1024 * 1024)),
+    max_concurrency=int(os.environ.get('SNAPSHOT_DOWNLOAD_CONCURRENCY', 8)),
+    chunk_size=int(os.environ.get('SNAPSHOT_DOWNLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+)
+
+# Stage timings (snapshot, query, serialize, upload) as EMF metrics; see shared/metrics.py
+METRICS = Metrics('ingestion')
 
 # Minimal contract:
-# Input: event (not used for scheduled run) and context
-# Output: dict with status and uploaded S3 key
+# Input: event (a job spec when it has "tables", otherwise unused for scheduled runs) and context
+# Output: dict with status and uploaded S3 key, or per-table results for a job spec
+
+def _resolve_sqlite_path():
+    """Return a local filesystem path for the configured SQLite DB, downloading it from S3 if needed."""
+    # Work with a local variable here to avoid UnboundLocalError when
+    # assigning; support either a direct DB_PATH or separate S3 bucket/key variables
+    db_path = DB_PATH
+    if not db_path:
+        if DB_S3_BUCKET and DB_S3_KEY:
+            db_path = f's3://{DB_S3_BUCKET}/{DB_S3_KEY}'
+        else:
+            raise RuntimeError('DB_PATH must be set for sqlite DB_TYPE (or set DB_S3_BUCKET and DB_S3_KEY)')
+
+    # If db_path is an S3 URI, fetch it through the /tmp snapshot cache so sqlite3 can open it.
+    if not db_path.startswith('s3://'):
+        return db_path
+
+    # parse s3://bucket/key
+    try:
+        s3 = boto3_client('s3')
+    except ImportError:
+        raise RuntimeError('boto3 is required to download DB from S3')
+
+    parts = db_path[5:].split('/', 1)
+    if len(parts) != 2:
+        raise RuntimeError('Invalid S3 path for DB_PATH')
+    bucket, key = parts
+    try:
+        return SNAPSHOT_CACHE.fetch(s3, bucket, key)
+    except Exception as e:
+        # Provide helpful error
+        raise RuntimeError(f'Failed to download DB from S3 {db_path}: {e}')
+
+
+def _import_psycopg2():
+    # Import psycopg2 lazily so local sqlite-only tests don't require it
+    try:
+        import psycopg2
+        import psycopg2.extras
+    except Exception as e:
+        raise RuntimeError('psycopg2 is required for Postgres DB_TYPE but is not installed') from e
+    return psycopg2
+
+
+def _connect_postgres():
+    psycopg2 = _import_psycopg2()
+    return psycopg2.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        connect_timeout=10
+    )
+
+
+def _connect_sqlite(path):
+    # Imported here so Postgres deployments never load the sqlite3 extension at init
+    import sqlite3
+    # Pooled connections may be used from a different worker thread than the one
+    # that opened them; the resource manager guarantees exclusive checkout.
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+@contextmanager
+def db_connection():
+    """Check out a DB connection from the shared resource manager.
+
+    Connections stay open between warm invocations and are liveness-checked
+    before reuse. SQLite connections are keyed by the file's inode and mtime so a
+    freshly downloaded snapshot never reuses a handle to the old file.
+    """
+    if DB_TYPE == 'sqlite':
+        path = _resolve_sqlite_path()
+        st = os.stat(path)
+        key = ('sqlite', os.path.abspath(path), st.st_ino, st.st_mtime_ns)
+        with RESOURCES.connection(key, lambda: _connect_sqlite(path)) as conn:
+            yield conn
+    else:
+        key = ('postgres', DB_HOST, DB_PORT, DB_NAME, DB_USER)
+        with RESOURCES.connection(key, _connect_postgres) as conn:
+            yield conn
+
 
 def query_db(query, params=None, fetch_size=1000):
     """Connects to the DB (Postgres or SQLite), runs a query and returns rows as list of dicts.
@@ -52,84 +190,213 @@ def query_db(query, params=None, fetch_size=1000):
       - Postgres via psycopg2 (default)
       - SQLite via sqlite3 when DB_TYPE=sqlite and DB_PATH is set
     """
-    if DB_TYPE == 'sqlite':
-        # Work with a local variable here to avoid UnboundLocalError when
-        # assigning; support either a direct DB_PATH or separate S3 bucket/key variables
-        db_path = DB_PATH
-        if not db_path:
-            if DB_S3_BUCKET and DB_S3_KEY:
-                db_path = f's3://{DB_S3_BUCKET}/{DB_S3_KEY}'
-            else:
-                raise RuntimeError('DB_PATH must be set for sqlite DB_TYPE (or set DB_S3_BUCKET and DB_S3_KEY)')
-
-        # If db_path is an S3 URI, download it to /tmp so sqlite3 can open it.
-        local_path = db_path
-        if db_path.startswith('s3://'):
-            # parse s3://bucket/key
-            try:
-                import boto3
-            except Exception:
-                raise RuntimeError('boto3 is required to download DB from S3')
-
-            s3 = boto3.client('s3')
-            parts = db_path[5:].split('/', 1)
-            if len(parts) != 2:
-                raise RuntimeError('Invalid S3 path for DB_PATH')
-            bucket, key = parts
-            fd, tmp_local = tempfile.mkstemp(prefix='chinook_', suffix='.db')
-            os.close(fd)
-            try:
-                s3.download_file(bucket, key, tmp_local)
-            except Exception as e:
-                # Provide helpful error
-                raise RuntimeError(f'Failed to download DB from S3 {db_path}: {e}')
-            local_path = tmp_local
-        conn = None
-        try:
-            conn = sqlite3.connect(local_path)
-            conn.row_factory = sqlite3.Row
+    with db_connection() as conn, stage('query') as t:
+        if DB_TYPE == 'sqlite':
             cur = conn.cursor()
             cur.execute(query, params or ())
             rows = [dict(r) for r in cur.fetchall()]
             cur.close()
-            return rows
-        finally:
-            if conn:
-                conn.close()
-    else:
-        # Import psycopg2 lazily so local sqlite-only tests don't require it
-        try:
-            import psycopg2
-            import psycopg2.extras
-        except Exception as e:
-            raise RuntimeError('psycopg2 is required for Postgres DB_TYPE but is not installed') from e
-
-        conn = None
-        try:
-            conn = psycopg2.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                dbname=DB_NAME,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                connect_timeout=10
-            )
+        else:
+            psycopg2 = _import_psycopg2()
             cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
             cur.execute(query, params or ())
             rows = cur.fetchall()
             cur.close()
-            return rows
-        finally:
-            if conn:
-                conn.close()
+            # End the read transaction before the connection goes back to the pool
+            conn.rollback()
+        t.add(rows=len(rows))
+        return rows
+
+
+def iter_query_chunks(query, params=None, chunk_size=None):
+    """Run a query and yield rows as lists of dicts, at most ``chunk_size`` rows at a time.
+
+    Only one chunk is materialised at any point:
+      - SQLite uses ``cursor.fetchmany``
+      - Postgres uses a psycopg2 named (server-side) cursor so the result set
+        stays on the server and is transferred ``chunk_size`` rows at a time
+    """
+    chunk_size = chunk_size or INGEST_CHUNK_SIZE
+    with db_connection() as conn:
+        if DB_TYPE == 'sqlite':
+            cur = conn.cursor()
+        else:
+            psycopg2 = _import_psycopg2()
+            # Named cursors only live inside a transaction; psycopg2 opens one implicitly.
+            cur = conn.cursor(name=f'ingest_{uuid.uuid4().hex}', cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.itersize = chunk_size
+        cur.execute(query, params or ())
+        while True:
+            batch = cur.fetchmany(chunk_size)
+            if not batch:
+                break
+            yield [dict(r) for r in batch]
+        cur.close()
+        if DB_TYPE != 'sqlite':
+            conn.rollback()
+
+
+def open_raw_writer(bucket, key, s3=None, content_type=NDJSON_CONTENT_TYPE, metadata=None):
+    """Open a streaming writer for ``key``: S3 multipart when a bucket is set, else a local file."""
+    if not bucket:
+        out_dir = os.environ.get('LOCAL_UPLOAD_DIR', 'build/local_uploads')
+        return LocalFileWriter(out_dir, key)
+    return S3MultipartWriter(s3 or boto3_client('s3'), bucket, key, part_size=S3_PART_SIZE, content_type=content_type,
+                             metadata=metadata)
+
+
+def raw_suffix(streamed, payload_format=None):
+    """Object suffix for raw payloads in ``payload_format`` (default: the configured PAYLOAD_FORMAT)."""
+    if (payload_format or PAYLOAD_FORMAT) == COLUMNAR_FORMAT:
+        return COLUMNAR_SUFFIX
+    return '.ndjson' if streamed else '.json'
+
+
+def _write_rows(chunks, writer, key, columnar, hasher=None, watermark_column=None):
+    """Encode row chunks into ``writer``; returns ``(row_count, watermark)``."""
+    row_count = 0
+    mark = None
+    if columnar:
+        parts = key.split('/')
+        encoder = ColumnarWriter(writer, meta={'fetched_at': parts[1]} if len(parts) > 2 else None)
+    for chunk in chunks:
+        # Upload time inside the writer is counted under 'upload', not 'serialize'
+        with stage('serialize', rows=len(chunk)):
+            if columnar:
+                if hasher:
+                    hasher.update(chunk)
+                encoder.write_rows(chunk)
+            else:
+                data = encode_ndjson(chunk)
+                if hasher:
+                    # The NDJSON encoding is exactly what the digest hashes
+                    hasher.update_encoded(data, len(chunk))
+                writer.write(data)
+        row_count += len(chunk)
+        if watermark_column:
+            mark = advance(mark, chunk, watermark_column)
+    if columnar:
+        with stage('serialize'):
+            encoder.close()
+    return row_count, mark
+
+
+def stream_query_to_s3(query, bucket, key, params=None, chunk_size=None, watermark_column=None, skip_empty=False, s3=None,
+                       digest=False, previous_digest=None):
+    """Stream query results as NDJSON to S3 (or the local fallback).
+
+    Keys ending in ``.colz`` are written in the columnar format instead, with
+    ``fetched_at`` taken from the ``raw/<timestamp>/...`` key. When ``watermark_column`` is given the largest value seen in that column is
+    returned as ``watermark``. With ``skip_empty`` no object is written if the
+    query returns no rows (``s3_path`` is then None).
+
+    With ``digest`` (or a ``previous_digest``) the rows are hashed as they are
+    encoded (see content_digest.py) into a local spool (SpoolWriter), so the
+    digest is known before the upload is created and goes into its metadata,
+    for multipart uploads too. If it equals ``previous_digest`` nothing is
+    uploaded and ``unchanged`` is True.
+
+    Returns a dict with the destination path, row_count, bytes, parts, watermark, digest and unchanged.
+    """
+    chunks = timed_iter(iter_query_chunks(query, params=params, chunk_size=chunk_size), 'query')
+    first = next(chunks, None)
+    if first is None and skip_empty:
+        return {'s3_path': None, 'row_count': 0, 'bytes': 0, 'parts': 0, 'watermark': None, 'digest': None, 'unchanged': False}
+    chunks = itertools.chain([first], chunks) if first is not None else iter(())
+
+    columnar = is_columnar(key)
+    content_type = COLUMNAR_CONTENT_TYPE if columnar else NDJSON_CONTENT_TYPE
+    if not (digest or previous_digest):
+        with timed_writer(open_raw_writer(bucket, key, s3=s3, content_type=content_type)) as writer:
+            row_count, mark = _write_rows(chunks, writer, key, columnar, watermark_column=watermark_column)
+        value = None
+    else:
+        hasher = RowDigest()
+        with SpoolWriter() as spool:
+            row_count, mark = _write_rows(chunks, spool, key, columnar, hasher, watermark_column)
+            value = hasher.hexdigest()
+            if value == previous_digest:
+                return {
+                    's3_path': None,
+                    'row_count': row_count,
+                    'bytes': 0,
+                    'parts': 0,
+                    'watermark': mark,
+                    'digest': value,
+                    'unchanged': True
+                }
+            metadata = {DIGEST_METADATA_KEY: value}
+            with timed_writer(open_raw_writer(bucket, key, s3=s3, content_type=content_type, metadata=metadata)) as writer:
+                spool.copy_to(writer)
+    return {
+        's3_path': writer.path,
+        'row_count': row_count,
+        'bytes': writer.bytes_written,
+        'parts': writer.part_count,
+        'watermark': mark,
+        'digest': value,
+        'unchanged': False
+    }
+
+
+def extract_partitioned(query, bucket, run_prefix, column, count, concurrency, params=None, watermark_column=None,
+                        payload_format=None, chunk_size=None):
+    """Extract ``query`` as ``count`` key ranges of ``column`` using ``concurrency`` connections.
 
+    Each range is streamed to ``<run_prefix>part-NNNNN.ndjson``; once every
+    partition succeeded a manifest listing them is written to
+    ``<run_prefix>_manifest.json``. Returns a dict with the manifest path (None
+    on failure), total row_count, watermark and the per-partition results.
+    """
+    placeholder = '?' if DB_TYPE == 'sqlite' else '%s'
+    params = tuple(params or ())
+    bounds = query_db(bounds_query(query, column), params)[0]
+    ranges = split_ranges(bounds['lo'], bounds['hi'], count)
+
+    # Resolve the client once; it is thread-safe and shared by every partition
+    s3 = boto3_client('s3') if bucket else None
+
+    def extract(index, lo, hi, inclusive):
+        sql, range_params = partition_query(query, column, lo, hi, inclusive, placeholder)
+        key = f'{run_prefix}part-{index:05d}{raw_suffix(streamed=True, payload_format=payload_format)}'
+        return stream_query_to_s3(sql, bucket, key, params=params + range_params, chunk_size=chunk_size, watermark_column=watermark_column, s3=s3)
+
+    results = run_partitions(ranges, extract, concurrency)
+    failed = [r for r in results if 'error' in r]
+    marks = [r['watermark'] for r in results if r.get('watermark') is not None]
+    summary = {
+        'manifest_path': None,
+        'row_count': sum(r.get('row_count', 0) for r in results),
+        'watermark': max(marks) if marks else None,
+        'partitions': results
+    }
+    if failed:
+        return summary
+
+    fetched_at = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+    run_id = run_prefix.rstrip('/').rsplit('/', 1)[-1]
+    manifest = build_manifest(run_id, fetched_at, column, results)
+    summary['manifest_path'] = upload_json_to_s3(bucket, f'{run_prefix}{MANIFEST_NAME}', manifest)
+    return summary
 
-def upload_json_to_s3(bucket, key, data):
+
+def upload_json_to_s3(bucket, key, data, metadata=None):
     """Upload JSON to S3 if bucket provided, otherwise write locally for dev/test.
 
-    Returns the s3:// path or local file path.
+    A ``.colz`` key selects the columnar format for a ``{"rows": [...]}``
+    envelope; the object is then tagged with the format in its content type
+    and user metadata. Extra user ``metadata`` is only sent to S3. Returns the
+    s3:// path or local file path.
     """
-    body = json.dumps(data, default=str, indent=None)
+    extra = {'Metadata': dict(metadata)} if metadata else {}
+    with stage('serialize', rows=len(data.get('rows') or ())) as t:
+        if is_columnar(key):
+            body = encode_columnar(data)
+            extra['ContentType'] = COLUMNAR_CONTENT_TYPE
+            extra.setdefault('Metadata', {})[FORMAT_METADATA_KEY] = COLUMNAR_FORMAT
+        else:
+            body = json.dumps(data, default=str, indent=None).encode('utf-8')
+        t.add(bytes=len(body))
 
     if not bucket:
         # Local fallback: write to a local file under build/local_uploads
@@ -138,28 +405,235 @@ def upload_json_to_s3(bucket, key, data):
         # sanitize key into a path
         safe_key = key.replace('/', '_')
         out_path = os.path.join(out_dir, safe_key)
-        with open(out_path, 'wb') as f:
-            f.write(body.encode('utf-8'))
+        with stage('upload', bytes=len(body)), open(out_path, 'wb') as f:
+            f.write(body)
         return out_path
 
-    # Lazy import boto3 so tests/dev runs without boto3 installed don't fail
-    import boto3
-    s3 = boto3.client('s3')
-    s3.put_object(Bucket=bucket, Key=key, Body=body.encode('utf-8'))
+    s3 = boto3_client('s3')
+    with stage('upload', bytes=len(body)):
+        s3.put_object(Bucket=bucket, Key=key, Body=body, **extra)
     return f's3://{bucket}/{key}'
 
 
+def default_query():
+    """INGEST_QUERY, or a sample query for the configured DB type."""
+    # Simple example query - override in real deployment
+    if os.environ.get('INGEST_QUERY'):
+        return os.environ.get('INGEST_QUERY')
+    # sensible defaults per DB type
+    if DB_TYPE == 'sqlite':
+        # Chinook sample DB - select track name and album title
+        return (
+            "SELECT Track.Name AS track_name, Album.Title AS album_title, Track.Milliseconds, Track.Bytes "
+            "FROM Track JOIN Album ON Track.AlbumId = Album.AlbumId LIMIT 500"
+        )
+    return "SELECT * FROM public.data LIMIT 100"
+
+
+def job_settings(job):
+    """Ingestion settings for ``job``: its own values where given, else the environment's."""
+    settings = {
+        'mode': INGEST_MODE,
+        'payload_format': PAYLOAD_FORMAT,
+        'chunk_size': INGEST_CHUNK_SIZE,
+        'incremental_column': INCREMENTAL_COLUMN,
+        'incremental_batch_limit': INCREMENTAL_BATCH_LIMIT,
+        'partition_column': PARTITION_COLUMN,
+        'partition_count': PARTITION_COUNT,
+        'partition_concurrency': PARTITION_CONCURRENCY,
+        'change_detection': CHANGE_DETECTION
+    }
+    settings.update({k: v for k, v in job.items() if k in JOB_SETTINGS})
+    return settings
+
+
+def run_job(job, now):
+    """Extract ``job['query']`` to the raw bucket under its key layout and return the result.
+
+    ``job`` is a normalized job spec entry (see job_spec.py); settings it does
+    not give come from the environment. Incremental, change detection,
+    partitioned, stream and batch runs behave exactly as for a single
+    INGEST_QUERY deployment. Failures are reported as ``status: error``.
+    """
+    settings = job_settings(job)
+    query = job['query']
+    incremental = settings['incremental_column']
+    partition = settings['partition_column']
+
+    params = None
+    state_id = None
+    watermark_store = None
+    previous_mark = None
+    if incremental:
+        state_id = watermark_id(query, incremental)
+        watermark_store = WatermarkStore(RAW_BUCKET, s3=boto3_client('s3') if RAW_BUCKET else None, local_dir=INGEST_STATE_DIR)
+        try:
+            state = watermark_store.load(state_id)
+        except Exception as e:
+            logger.exception('Failed to load watermark state')
+            return {'status': 'error', 'message': f'Failed to load watermark state: {e}'}
+        previous_mark = state.get('value') if state else None
+        placeholder = '?' if DB_TYPE == 'sqlite' else '%s'
+        query, params = build_incremental_query(query, incremental, previous_mark, placeholder=placeholder, limit=settings['incremental_batch_limit'])
+        logger.info(f'Incremental run on {incremental} from watermark {previous_mark!r}')
+
+    # Incremental runs only fetch new rows already; partitioned runs upload parts before the digest is known
+    digest_store = None
+    previous = None
+    if settings['change_detection'] and not incremental and not partition:
+        digest_id = extract_id(query)
+        digest_store = WatermarkStore(RAW_BUCKET, s3=boto3_client('s3') if RAW_BUCKET else None, local_dir=INGEST_STATE_DIR, prefix=DIGEST_STATE_PREFIX)
+        try:
+            previous = digest_store.load(digest_id)
+        except Exception as e:
+            logger.exception('Failed to load digest state')
+            return {'status': 'error', 'message': f'Failed to load digest state: {e}'}
+    previous_digest = previous.get('digest') if previous else None
+
+    try:
+        digest = None
+        unchanged = False
+        if partition:
+            run_prefix = render_key(job['key'], job['name'], now) + '/'
+            result = extract_partitioned(
+                query, RAW_BUCKET, run_prefix, partition,
+                settings['partition_count'], settings['partition_concurrency'],
+                params=params,
+                watermark_column=incremental or None,
+                payload_format=settings['payload_format'],
+                chunk_size=settings['chunk_size']
+            )
+            failed = [p for p in result['partitions'] if 'error' in p]
+            if failed:
+                # Partitions that did succeed stay in place; no manifest means the run is incomplete
+                msg = f'{len(failed)} of {len(result["partitions"])} partitions failed'
+                logger.error(f'{msg}: {failed}')
+                return {'status': 'error', 'message': msg, 'partitions': result['partitions']}
+            logger.info(f"Extracted {result['row_count']} rows in {len(result['partitions'])} partitions, manifest {result['manifest_path']}")
+            s3_path, row_count, mark = result['manifest_path'], result['row_count'], result['watermark']
+        elif settings['mode'] == 'stream':
+            key = render_key(job['key'], job['name'], now, raw_suffix(streamed=True, payload_format=settings['payload_format']))
+            result = stream_query_to_s3(
+                query, RAW_BUCKET, key,
+                params=params,
+                chunk_size=settings['chunk_size'],
+                watermark_column=incremental or None,
+                skip_empty=bool(incremental),
+                digest=digest_store is not None,
+                previous_digest=previous_digest
+            )
+            if not result['unchanged']:
+                logger.info(f"Streamed {result['row_count']} rows ({result['bytes']} bytes, {result['parts']} parts) to {result['s3_path']}")
+            s3_path, row_count, mark = result['s3_path'], result['row_count'], result['watermark']
+            digest, unchanged = result['digest'], result['unchanged']
+        else:
+            rows = query_db(query, params)
+            logger.info(f'Fetched {len(rows)} rows from DB')
+            row_count = len(rows)
+            mark = advance(None, rows, incremental) if incremental else None
+
+            if digest_store is not None:
+                with stage('serialize'):
+                    digest = digest_rows(rows)
+                unchanged = digest == previous_digest
+
+            if (not rows and incremental) or unchanged:
+                # Nothing past the watermark, or the same rows as last time: don't write a raw object
+                s3_path = None
+            else:
+                # Build a small manifest and upload
+                key = render_key(job['key'], job['name'], now, raw_suffix(streamed=False, payload_format=settings['payload_format']))
+
+                payload = {
+                    'fetched_at': now,
+                    'row_count': row_count,
+                    'rows': rows
+                }
+
+                s3_path = upload_json_to_s3(RAW_BUCKET, key, payload, metadata={DIGEST_METADATA_KEY: digest} if digest else None)
+                logger.info(f'Uploaded raw payload to {s3_path}')
+
+        add_totals(rows=row_count)
+        if unchanged:
+            logger.info(f"Extract unchanged since {previous.get('updated_at')} ({digest}); skipped the upload")
+            return {
+                'status': 'unchanged',
+                's3_path': None,
+                'row_count': row_count,
+                'digest': digest,
+                'previous_path': previous.get('s3_path')
+            }
+        result = {
+            'status': 'ok',
+            's3_path': s3_path,
+            'row_count': row_count
+        }
+        if digest_store is not None:
+            digest_store.save(digest_id, digest_state(digest, s3_path, row_count))
+            result['digest'] = digest
+        if incremental:
+            # Only move the watermark once the rows behind it are safely uploaded
+            if mark is not None:
+                watermark_store.save(state_id, new_state(incremental, mark, s3_path, row_count))
+            result['watermark'] = mark if mark is not None else previous_mark
+        return result
+
+    except Exception as e:
+        logger.exception('Error during ingestion')
+        return { 'status': 'error', 'message': str(e) }
+
+
+def ingest_tables(spec, now):
+    """Run every job of a normalized job spec, up to its concurrency at a time.
+
+    Tables share the pooled DB connections and the cached S3 client, and all
+    use the same run timestamp. Each table reports its own result and timing;
+    a failing table never stops the others.
+    """
+    concurrency = spec['concurrency'] or INGEST_JOB_CONCURRENCY
+    if RAW_BUCKET:
+        # Build the shared client before the workers start
+        boto3_client('s3')
+
+    def run(job):
+        started = time.perf_counter()
+        result = run_job(job, now)
+        result = dict({'name': job['name']}, **result)
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        logger.info(f"Table {job['name']}: {result['status']}, {result.get('row_count', 0)} rows in {result['seconds']}s")
+        return result
+
+    results = run_jobs(spec['jobs'], run, concurrency)
+    errors = sum(1 for r in results if r['status'] == 'error')
+    if not errors:
+        status = 'ok'
+    elif errors == len(results):
+        status = 'error'
+    else:
+        status = 'partial'
+    return {
+        'status': status,
+        'fetched_at': now,
+        'row_count': sum(r.get('row_count', 0) for r in results),
+        'tables': results
+    }
+
+
+@METRICS.instrument
 def lambda_handler(event, context):
     logger.info('Starting ingestion lambda')
     # Validate configuration depending on DB type. RAW_BUCKET is optional for local testing.
     if DB_TYPE == 'sqlite':
-        # If DB_S3_BUCKET/KEY are provided, download the DB to /tmp and update DB_PATH
+        # If DB_S3_BUCKET/KEY are provided, fetch the DB through the /tmp snapshot cache and update DB_PATH
         if DB_S3_BUCKET and DB_S3_KEY:
             try:
-                tmp_path = '/tmp/chinook.db'
-                logger.info(f'Downloading sqlite DB from s3://{DB_S3_BUCKET}/{DB_S3_KEY} to {tmp_path}')
-                s3 = boto3_client('s3')
-                s3.download_file(DB_S3_BUCKET, DB_S3_KEY, tmp_path)
+                downloads = SNAPSHOT_CACHE.downloads
+                with stage('snapshot'):
+                    tmp_path = SNAPSHOT_CACHE.fetch(boto3_client('s3'), DB_S3_BUCKET, DB_S3_KEY)
+                if SNAPSHOT_CACHE.downloads > downloads:
+                    logger.info(f'Downloaded sqlite DB from s3://{DB_S3_BUCKET}/{DB_S3_KEY} to {tmp_path}')
+                else:
+                    logger.info(f'Reusing cached sqlite DB {tmp_path} (ETag unchanged)')
                 # set DB_PATH for this invocation
                 global DB_PATH
                 DB_PATH = tmp_path
@@ -178,43 +652,18 @@ def lambda_handler(event, context):
             logger.error(msg)
             return {'status': 'error', 'message': msg}
 
-    # Simple example query - override in real deployment
-    if os.environ.get('INGEST_QUERY'):
-        query = os.environ.get('INGEST_QUERY')
-    else:
-        # sensible defaults per DB type
-        if DB_TYPE == 'sqlite':
-            # Chinook sample DB - select track name and album title
-            query = os.environ.get('INGEST_QUERY') or (
-                "SELECT Track.Name AS track_name, Album.Title AS album_title, Track.Milliseconds, Track.Bytes "
-                "FROM Track JOIN Album ON Track.AlbumId = Album.AlbumId LIMIT 500"
-            )
-        else:
-            query = os.environ.get('INGEST_QUERY') or "SELECT * FROM public.data LIMIT 100"
-
     try:
-        rows = query_db(query)
-        logger.info(f'Fetched {len(rows)} rows from DB')
-
-        # Build a small manifest and upload
-        now = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
-        key = f'raw/{now}/{uuid.uuid4()}.json'
-
-        payload = {
-            'fetched_at': now,
-            'row_count': len(rows),
-            'rows': rows
-        }
-
-        s3_path = upload_json_to_s3(RAW_BUCKET, key, payload)
-        logger.info(f'Uploaded raw payload to {s3_path}')
-
-        return {
-            'status': 'ok',
-            's3_path': s3_path,
-            'row_count': len(rows)
-        }
-
+        spec = load_job_spec(event, INGEST_JOB_SPEC, INGEST_JOB_SPEC_FILE)
     except Exception as e:
-        logger.exception('Error during ingestion')
-        return { 'status': 'error', 'message': str(e) }
+        msg = f'Invalid job spec: {e}'
+        logger.error(msg)
+        return {'status': 'error', 'message': msg}
+
+    now = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+    if spec is not None:
+        result = ingest_tables(spec, now)
+    else:
+        result = run_job({'name': 'query', 'query': default_query(), 'key': SINGLE_QUERY_KEY_LAYOUT}, now)
+    if result['status'] != 'error':
+        logger.info(f'Resource cache stats: {RESOURCES.stats()}')
+    return result
@@ -0,0 +1,160 @@
+import re
+import json
+import uuid
+
+# Multi-table job specs for the ingestion Lambda.
+#
+# A spec lists the tables (or queries) one invocation extracts, each with its
+# own raw key layout and, optionally, its own ingestion settings:
+#
+#   {
+#     "concurrency": 4,
+#     "defaults": {"mode": "stream"},
+#     "tables": [
+#       {"name": "track", "table": "Track", "incremental_column": "TrackId"},
+#       {"name": "album", "table": "Album", "key": "raw/{timestamp}/{name}/{date}/{uuid}{suffix}"},
+#       {"name": "sales", "query": "SELECT ... FROM InvoiceLine JOIN Invoice ...", "mode": "batch"}
+#     ]
+#   }
+#
+# Settings left out of a table fall back to "defaults" and then to the
+# handler's environment variables. The spec is taken from the invocation event
+# (when it has "tables"), else from INGEST_JOB_SPEC (JSON) or
+# INGEST_JOB_SPEC_FILE (path to a JSON file).
+#
+# Key layouts are str.format templates with {name}, {timestamp}, {date},
+# {uuid} and {suffix}; they must start with raw/{timestamp}/{name}/ because
+# the file index and compaction read the extraction time from the second key
+# component, and the table name in the third picks each object's projection in
+# the processing stage (PROJECTION_SPECS) and keeps compaction from mixing
+# tables (compacted/raw/<partition>/<table>/).
+
+DEFAULT_KEY_LAYOUT = 'raw/{timestamp}/{name}/{uuid}{suffix}'
+# Layout of the classic single INGEST_QUERY deployment
+SINGLE_QUERY_KEY_LAYOUT = 'raw/{timestamp}/{uuid}{suffix}'
+KEY_LAYOUT_PREFIX = 'raw/{timestamp}/{name}/'
+
+# Per-table settings, named after the environment variables they override
+JOB_SETTINGS = {
+    'mode': str,
+    'payload_format': str,
+    'chunk_size': int,
+    'incremental_column': str,
+    'incremental_batch_limit': int,
+    'partition_column': str,
+    'partition_count': int,
+    'partition_concurrency': int,
+    'change_detection': bool
+}
+
+_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9-]*$')
+_TABLE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$')
+
+
+class JobSpecError(ValueError):
+    """The job spec is malformed."""
+
+
+def load_job_spec(event=None, env_value=None, path=None):
+    """Return the normalized job spec from the event, a JSON string or a JSON file (in that order), or None."""
+    if isinstance(event, dict) and 'tables' in event:
+        return normalize_job_spec(event)
+    if env_value:
+        return normalize_job_spec(json.loads(env_value))
+    if path:
+        with open(path) as f:
+            return normalize_job_spec(json.load(f))
+    return None
+
+
+def render_key(layout, name, timestamp, suffix=''):
+    return layout.format(name=name, timestamp=timestamp, date=timestamp[:10], uuid=uuid.uuid4(), suffix=suffix)
+
+
+def _check_layout(name, layout):
+    if not layout.startswith(KEY_LAYOUT_PREFIX):
+        raise JobSpecError(f'table {name!r}: key layout must start with {KEY_LAYOUT_PREFIX!r}, got {layout!r}')
+    try:
+        key = render_key(layout, name, '2000-01-01T00-00-00Z', '.json')
+    except (KeyError, IndexError, ValueError) as e:
+        raise JobSpecError(f'table {name!r}: bad key layout {layout!r}: {e}')
+    if '_' in key or '//' in key:
+        # '_' marks manifests/state and is the separator of flattened local keys (see shared/key_layout.py)
+        raise JobSpecError(f'table {name!r}: key layout {layout!r} produces keys like {key!r}; avoid "_" and empty components')
+
+
+def _settings(name, values):
+    out = {}
+    for option, value in values.items():
+        if option not in JOB_SETTINGS:
+            raise JobSpecError(f'table {name!r}: unknown setting {option!r}')
+        kind = JOB_SETTINGS[option]
+        if kind is bool:
+            out[option] = value if isinstance(value, bool) else str(value).strip().lower() in ('1', 'true', 'yes')
+        else:
+            out[option] = kind(value)
+    return out
+
+
+def normalize_job_spec(spec):
+    """Validate ``spec`` and return ``{"concurrency", "jobs": [...]}``.
+
+    Each job is a dict with ``name``, ``query``, ``key`` (the key layout) and
+    the settings given for it or in ``defaults``. Raises JobSpecError on
+    unknown fields, duplicate names, missing queries or bad key layouts.
+    """
+    if not isinstance(spec, dict) or not isinstance(spec.get('tables'), list) or not spec['tables']:
+        raise JobSpecError('job spec needs a non-empty "tables" list')
+    unknown = set(spec) - {'tables', 'defaults', 'concurrency', 'key'}
+    if unknown:
+        raise JobSpecError(f'unknown job spec fields: {sorted(unknown)}')
+    defaults = _settings('defaults', spec.get('defaults') or {})
+    default_layout = spec.get('key') or DEFAULT_KEY_LAYOUT
+
+    jobs = []
+    seen = set()
+    for entry in spec['tables']:
+        if isinstance(entry, str):
+            entry = {'table': entry}
+        entry = dict(entry)
+        table = entry.pop('table', None)
+        query = entry.pop('query', None)
+        name = entry.pop('name', None) or (table.lower().replace('.', '-').replace('_', '-') if table else None)
+        if not name or not _NAME.match(name):
+            raise JobSpecError(f'every table needs a name of letters, digits and dashes (no "_"), got {name!r}')
+        if name in seen:
+            raise JobSpecError(f'duplicate table name {name!r}')
+        seen.add(name)
+        if bool(table) == bool(query):
+            raise JobSpecError(f'table {name!r}: give exactly one of "table" or "query"')
+        if table and not _TABLE.match(table):
+            raise JobSpecError(f'table {name!r}: invalid table identifier {table!r}')
+        layout = entry.pop('key', None) or default_layout
+        _check_layout(name, layout)
+        job = {'name': name, 'query': query or f'SELECT * FROM {table}', 'key': layout}
+        job.update(defaults)
+        job.update(_settings(name, entry))
+        jobs.append(job)
+
+    concurrency = spec.get('concurrency')
+    return {'concurrency': int(concurrency) if concurrency else None, 'jobs': jobs}
+
+
+def run_jobs(jobs, run, concurrency):
+    """Call ``run(job)`` for every job with up to ``concurrency`` threads.
+
+    ``run`` is expected to report failures in its result; an exception still
+    only fails its own job. Results are returned in job order.
+    """
+    def guarded(job):
+        try:
+            return run(job)
+        except Exception as e:
+            return {'name': job['name'], 'status': 'error', 'message': str(e)}
+
+    workers = max(1, min(int(concurrency), len(jobs)))
+    if workers == 1:
+        return [guarded(job) for job in jobs]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(guarded, jobs))
@@ -1,9 +1,12 @@
 import os
+import sys
 import json
 
 # Local runner for ingestion lambda using Chinook SQLite DB
 # Usage: set environment variables or edit defaults below and run:
 # python src/ingestion_lambda/local_run.py
+# or pass a multi-table job spec (see job_spec.py) to extract several tables:
+# python src/ingestion_lambda/local_run.py src/ingestion_lambda/chinook_tables.json
 
 # Defaults for local testing - set these BEFORE importing the handler so the module
 # picks up the correct environment at import time.
@@ -16,5 +19,9 @@ os.environ.setdefault('RAW_BUCKET', '')
 from handler import lambda_handler
 
 if __name__ == '__main__':
-    result = lambda_handler({}, None)
+    event = {}
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            event = json.load(f)
+    result = lambda_handler(event, None)
     print(json.dumps(result, indent=2, default=str))
@@ -0,0 +1,106 @@
+import os
+import shutil
+import hashlib
+import threading
+
+# ETag-validated /tmp cache for the S3-hosted SQLite snapshot.
+#
+# Each snapshot version is stored as <cache_dir>/<hash of bucket/key>-<etag>.db.
+# A warm container only issues a HEAD request to learn the current ETag; the
+# object is downloaded again only when the ETag changed, with concurrent ranged
+# GETs that all carry IfMatch for that ETag, so a snapshot replaced mid-download
+# fails the fetch instead of mixing two versions under the old ETag's name.
+# (s3transfer's download_file does not accept IfMatch in ExtraArgs.) Superseded versions of the same object are deleted and
+# the whole directory is kept under a byte budget, evicting least recently used
+# files first.
+
+
+def _safe_etag(etag):
+    return ''.join(c for c in etag if c.isalnum() or c == '-')
+
+
+class SnapshotCache:
+    def __init__(self, cache_dir='/tmp/db_snapshots', max_bytes=400 * 1024 * 1024,
+                 max_concurrency=8, chunk_size=8 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.downloads = 0
+
+    def _download(self, s3, bucket, key, etag, size, tmp_path):
+        """Write ``size`` bytes of the ``etag`` version of the object to ``tmp_path`` with ranged GETs."""
+        if_match = f'"{etag}"'
+        with open(tmp_path, 'wb') as f:
+            f.truncate(size)
+        if size <= self.chunk_size:
+            body = s3.get_object(Bucket=bucket, Key=key, IfMatch=if_match)['Body']
+            with open(tmp_path, 'r+b') as f:
+                shutil.copyfileobj(body, f, 1024 * 1024)
+            return
+
+        def fetch(start):
+            end = min(start + self.chunk_size, size) - 1
+            body = s3.get_object(Bucket=bucket, Key=key, Range=f'bytes={start}-{end}', IfMatch=if_match)['Body']
+            with open(tmp_path, 'r+b') as f:
+                f.seek(start)
+                shutil.copyfileobj(body, f, 1024 * 1024)
+
+        starts = range(0, size, self.chunk_size)
+        # Only a cold cache miss needs the pool; keep it out of the warm path
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(starts)))) as pool:
+            for _ in pool.map(fetch, starts):
+                pass
+
+    def _prefix(self, bucket, key):
+        return hashlib.sha1(f'{bucket}/{key}'.encode('utf-8')).hexdigest()[:16]
+
+    def fetch(self, s3, bucket, key):
+        """Return a local path holding the current version of ``s3://bucket/key``."""
+        head = s3.head_object(Bucket=bucket, Key=key)
+        etag = head['ETag'].strip('"')
+        prefix = self._prefix(bucket, key)
+        path = os.path.join(self.cache_dir, f'{prefix}-{_safe_etag(etag)}.db')
+        with self._lock:
+            if os.path.isfile(path):
+                self.hits += 1
+                # Refresh the timestamp so LRU eviction keeps the snapshot in use
+                os.utime(path)
+                return path
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f'{path}.partial'
+            try:
+                # IfMatch pins every range to the version we just HEADed
+                self._download(s3, bucket, key, etag, head['ContentLength'], tmp_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, path)
+            self.downloads += 1
+            self._evict(keep=path, prefix=prefix)
+            return path
+
+    def _evict(self, keep, prefix):
+        """Delete older versions of this object, then LRU files until the budget is met."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            p = os.path.join(self.cache_dir, name)
+            if p == keep or name.endswith('.partial'):
+                continue
+            if name.startswith(f'{prefix}-'):
+                os.remove(p)
+                continue
+            st = os.stat(p)
+            entries.append((st.st_mtime, st.st_size, p))
+
+        total = os.path.getsize(keep) + sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(p)
+            total -= size
@@ -0,0 +1,135 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+from decimal import Decimal
+
+# High-water-mark state for incremental ingestion.
+#
+# Each (query, column) pair gets a small JSON state object holding the largest
+# value of the incremental column that has been successfully uploaded. It lives
+# in the raw bucket under _state/ (outside raw/ so it never triggers processing)
+# or, when no bucket is configured, in a local directory.
+
+STATE_PREFIX = '_state/watermarks/'
+
+
+def watermark_id(query, column):
+    """Stable identifier for the watermark of ``column`` within ``query``."""
+    digest = hashlib.sha256(f'{column}\n{query.strip()}'.encode('utf-8')).hexdigest()
+    return digest[:16]
+
+
+def is_missing_key_error(exc):
+    """True if ``exc`` is the S3 error returned for an object that does not exist."""
+    code = getattr(exc, 'response', {}).get('Error', {}).get('Code')
+    return code in ('NoSuchKey', '404', 'NotFound')
+
+
+class WatermarkStore:
+    """Load and save watermark state in S3 (``bucket`` set) or under ``local_dir``."""
+
+    def __init__(self, bucket, s3=None, local_dir='build/state', prefix=STATE_PREFIX):
+        self.bucket = bucket
+        self.s3 = s3
+        self.local_dir = local_dir
+        self.prefix = prefix
+
+    def _key(self, state_id):
+        return f'{self.prefix}{state_id}.json'
+
+    def _local_path(self, state_id):
+        return os.path.join(self.local_dir, self._key(state_id).replace('/', '_'))
+
+    def load(self, state_id):
+        """Return the stored state dict, or None if no watermark has been recorded yet."""
+        if not self.bucket:
+            path = self._local_path(state_id)
+            if not os.path.isfile(path):
+                return None
+            with open(path) as f:
+                return json.load(f)
+        try:
+            resp = self.s3.get_object(Bucket=self.bucket, Key=self._key(state_id))
+        except Exception as e:
+            if is_missing_key_error(e):
+                return None
+            raise
+        return json.loads(resp['Body'].read())
+
+    def save(self, state_id, state):
+        body = json.dumps(state, default=str).encode('utf-8')
+        if not self.bucket:
+            path = self._local_path(state_id)
+            os.makedirs(self.local_dir, exist_ok=True)
+            tmp_path = path + '.partial'
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            return path
+        key = self._key(state_id)
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType='application/json')
+        return f's3://{self.bucket}/{key}'
+
+
+def build_incremental_query(query, column, mark, placeholder='?', limit=None):
+    """Wrap ``query`` so it only returns rows with ``column`` past ``mark``.
+
+    Rows are ordered by ``column`` so an optional ``limit`` takes the oldest
+    pending rows first and later runs pick up where this one stopped. The
+    batch always ends on a value boundary: rows tying with the last of the
+    ``limit`` rows are included too (so a batch may exceed ``limit``), since
+    the next run only asks for rows strictly past the new mark. The wrapped
+    query must expose ``column`` in its select list and should not carry its
+    own LIMIT.
+
+    Returns ``(sql, params)``.
+    """
+    source = query.strip().rstrip(';')
+    after = f' WHERE {column} > {placeholder}' if mark is not None else ''
+    params = (mark,) if mark is not None else ()
+    sql = f'SELECT * FROM ({source}) AS _src{after}'
+    if limit:
+        # Upper bound: the column value of the limit-th pending row
+        bound = (f'SELECT MAX({column}) FROM (SELECT {column} FROM ({source}) AS _src{after} '
+                 f'ORDER BY {column} LIMIT {int(limit)}) AS _batch')
+        sql += f' {"AND" if after else "WHERE"} {column} <= ({bound})'
+        params += params
+    sql += f' ORDER BY {column}'
+    return sql, params
+
+
+def normalize_mark(value):
+    """Convert a column value into a JSON-friendly, order-preserving watermark value.
+
+    Numbers stay numeric; timestamps and other values are stored as strings, which
+    compare correctly for ISO-formatted datetimes and are accepted back as query
+    parameters by both sqlite3 and psycopg2.
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return str(value)
+
+
+def advance(mark, rows, column):
+    """Return the new high-water mark after ``rows`` (the max of ``mark`` and each row's ``column``)."""
+    for r in rows:
+        value = r.get(column)
+        if value is None:
+            continue
+        value = normalize_mark(value)
+        if mark is None or value > mark:
+            mark = value
+    return mark
+
+
+def new_state(column, mark, s3_path, row_count):
+    return {
+        'column': column,
+        'value': mark,
+        's3_path': s3_path,
+        'row_count': row_count,
+        'updated_at': datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+    }
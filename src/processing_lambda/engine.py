@@ -0,0 +1,26 @@
+# Bounded concurrent runner for the records of one processing invocation.
+#
+# Each record is handled end to end (S3 read -> transform -> S3 write) by one
+# worker, so the network waits of one record overlap with the reads, writes and
+# transforms of the others. A failing record is reported in its own result and
+# never stops the rest.
+
+
+def run_records(items, process, concurrency):
+    """Apply ``process(item)`` to every item with at most ``concurrency`` threads.
+
+    Returns one result dict per item, in input order. Exceptions become
+    ``{'status': 'error', 'error': <message>}`` results.
+    """
+    def run(item):
+        try:
+            return process(item)
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+
+    if len(items) <= 1 or concurrency <= 1:
+        return [run(item) for item in items]
+    # S3 notifications usually carry one record, so the pool is imported only when it is needed
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as pool:
+        return list(pool.map(run, items))
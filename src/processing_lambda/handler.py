@@ -1,163 +1,343 @@
 import os
+import sys
 import json
 import logging
 from datetime import datetime
 
+# Shared modules are bundled next to the handler by scripts/package_lambda.sh;
+# when running from the source tree pick them up from src/shared instead.
+_SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared')
+if os.path.isdir(_SHARED_DIR) and _SHARED_DIR not in sys.path:
+    sys.path.append(_SHARED_DIR)
+
+from resource_manager import RESOURCES
+from metrics import Metrics, add_totals, stage, timed_reader, timed_writer
+from engine import run_records
+from s3_events import parse_records
+from projection import compile_projection, load_spec, load_specs, source_columns
+from json_stream import PayloadReader
+from streaming import JSON_CONTENT_TYPE, LocalFileWriter, S3MultipartWriter, SpoolWriter
+from object_store import open_store
+from key_layout import split_key, table_of
+from file_index import DEFAULT_STATS_COLUMNS, ColumnStats, add_entry, build_entry
+from columnar import COLUMNAR_CONTENT_TYPE, COLUMNAR_FORMAT, COLUMNAR_SUFFIX, ColumnarWriter
+from content_digest import DIGEST_METADATA_KEY, RowDigest, find_processed, mark_processed
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-def lambda_handler(event, context):
-    """Processing lambda triggered by S3 event for raw payloads.
+# Environment variables expected:
+# RAW_BUCKET: default source bucket when an event record has no bucket name
+# PROCESSED_BUCKET: destination for transformed rows (processed/...)
+# ANALYTICS_BUCKET: destination for per-file album summaries (analytics/..._summary.json)
+# PROCESSING_CONCURRENCY: max records processed in parallel per invocation
+# PROCESSING_WRITE_BATCH: processed rows encoded per write to the output stream
+# PROJECTION_SPEC / PROJECTION_SPEC_FILE: JSON projection spec (see projection.py); defaults to the Chinook track columns
+# PROJECTION_SPECS / PROJECTION_SPECS_FILE: JSON {"<table>": projection spec} for multi-table ingestion
+#   (raw/<timestamp>/<table>/...); when set, objects of tables without a spec are skipped
+# PROCESSING_STATS_COLUMNS: comma separated processed columns whose min/max/null counts go into the file index
+# PAYLOAD_FORMAT: format of processed outputs, 'json' (default, JSON envelope) or 'columnar' (.colz)
+# CHANGE_DETECTION: 'true' to skip raw objects whose content digest was already processed
+#   (markers under _state/processed-digests/ in the processed bucket)
+# Empty bucket names fall back to local files under LOCAL_UPLOAD_DIR.
+
+RAW_BUCKET = os.environ.get('RAW_BUCKET', '')
+PROCESSED_BUCKET = os.environ.get('PROCESSED_BUCKET', '')
+ANALYTICS_BUCKET = os.environ.get('ANALYTICS_BUCKET', '')
+PROCESSING_CONCURRENCY = int(os.environ.get('PROCESSING_CONCURRENCY', 8))
+PROCESSING_WRITE_BATCH = int(os.environ.get('PROCESSING_WRITE_BATCH', 1000))
+S3_PART_SIZE = int(os.environ.get('S3_PART_SIZE', 8 * 1024 * 1024))
+PROJECTION_SPEC = load_spec(os.environ.get('PROJECTION_SPEC'), os.environ.get('PROJECTION_SPEC_FILE'))
+PROJECTION_SPECS = load_specs(os.environ.get('PROJECTION_SPECS'), os.environ.get('PROJECTION_SPECS_FILE'))
+PAYLOAD_FORMAT = os.environ.get('PAYLOAD_FORMAT', 'json').lower()
+CHANGE_DETECTION = os.environ.get('CHANGE_DETECTION', 'false').strip().lower() in ('1', 'true', 'yes')
+PROCESSING_STATS_COLUMNS = [c for c in os.environ.get('PROCESSING_STATS_COLUMNS', ','.join(DEFAULT_STATS_COLUMNS)).split(',') if c]
+
+# Stage timings (download, transform, upload, index, summary) as EMF metrics; see shared/metrics.py
+METRICS = Metrics('processing')
+
+
+def boto3_client(service_name):
+    # Cached across warm invocations by the shared resource manager
+    return RESOURCES.client(service_name)
+
 
-    It downloads the raw JSON produced by the ingestion lambda, selects a
-    subset of fields (track_name, album_title, composer, milliseconds, unitprice),
-    and writes a transformed JSON to the analytics bucket.
+def open_payload(s3, bucket, key, spec=None):
+    """Open a raw payload for row-by-row reading (JSON envelope, NDJSON or columnar).
+
+    The S3 body is consumed incrementally, so only the current row (or block,
+    for columnar payloads) is decoded in memory regardless of the object size.
+    Columnar payloads only decode the columns the projection can use.
     """
-    import os
-    import json
-    import logging
-
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-
-    _boto3 = None
-    def boto3_client(service_name):
-        global _boto3
-        if _boto3 is None:
-            import boto3 as _b
-            _boto3 = _b
-        return _boto3.client(service_name)
-
-    def lambda_handler(event, context):
-        """Read raw payload from S3 (written by ingestion), simplify rows to track_name and album_title,
-        write processed payload to processed bucket and write analytics summary (counts per album) to analytics bucket.
-        Expects env vars: RAW_BUCKET, PROCESSED_BUCKET, ANALYTICS_BUCKET
-        """
-        logger.info('Processing lambda invoked')
-        raw_bucket = os.environ.get('RAW_BUCKET', '')
-        processed_bucket = os.environ.get('PROCESSED_BUCKET', '')
-        analytics_bucket = os.environ.get('ANALYTICS_BUCKET', '')
-
-        # Extract S3 key from event (support S3 event records)
-        try:
-            record = event.get('Records', [event])[0]
-            s3_info = record.get('s3', {})
-            bucket = s3_info.get('bucket', {}).get('name', raw_bucket)
-            key = s3_info.get('object', {}).get('key')
-        except Exception:
-            logger.exception('Failed to parse event')
-            return {'status': 'error', 'message': 'invalid event'}
+    with stage('download'):
+        resp = s3.get_object(Bucket=bucket, Key=key)
+    return PayloadReader(
+        timed_reader(resp['Body']),
+        key=key,
+        content_type=resp.get('ContentType'),
+        metadata=resp.get('Metadata'),
+        columns=source_columns(spec or PROJECTION_SPEC)
+    )
 
-        if not key:
-            logger.error('S3 object key not found in event')
-            return {'status': 'error', 'message': 'no key in event'}
 
-        # Read object from S3
-        try:
-            s3 = boto3_client('s3')
-            resp = s3.get_object(Bucket=bucket, Key=key)
-            body = resp['Body'].read()
-            payload = json.loads(body)
-        except Exception as e:
-            logger.exception('Failed to read raw payload from s3')
-            return {'status': 'error', 'message': str(e)}
-
-        rows = payload.get('rows', [])
-        # Simplify rows
-        processed_rows = []
-        album_counts = {}
-        for r in rows:
-            track = {
-                'track_name': r.get('track_name') or r.get('Name') or r.get('name'),
-                'album_title': r.get('album_title') or r.get('Title') or r.get('Album')
-            }
-            processed_rows.append(track)
-            album = track['album_title'] or 'UNKNOWN'
-            album_counts[album] = album_counts.get(album, 0) + 1
-
-        # Upload processed payload
-        now_key = key.replace('raw/', 'processed/')
-        processed_payload = {'processed_at': payload.get('fetched_at'), 'row_count': len(processed_rows), 'rows': processed_rows}
-        try:
-            if processed_bucket:
-                s3.put_object(Bucket=processed_bucket, Key=now_key, Body=json.dumps(processed_payload).encode('utf-8'))
-                processed_path = f's3://{processed_bucket}/{now_key}'
-            else:
-                # local fallback
-                out_dir = os.environ.get('LOCAL_UPLOAD_DIR', 'build/local_uploads')
-                os.makedirs(out_dir, exist_ok=True)
-                out_path = os.path.join(out_dir, now_key.replace('/', '_'))
-                with open(out_path, 'wb') as f:
-                    f.write(json.dumps(processed_payload).encode('utf-8'))
-                processed_path = out_path
-        except Exception as e:
-            logger.exception('Failed to upload processed payload')
-            return {'status': 'error', 'message': str(e)}
+def write_json(s3, bucket, key, payload):
+    """Write ``payload`` as JSON to S3, or under LOCAL_UPLOAD_DIR when no bucket is set."""
+    body = json.dumps(payload, default=str).encode('utf-8')
+    if not bucket:
+        out_dir = os.environ.get('LOCAL_UPLOAD_DIR', 'build/local_uploads')
+        os.makedirs(out_dir, exist_ok=True)
+        out_path = os.path.join(out_dir, key.replace('/', '_'))
+        with open(out_path, 'wb') as f:
+            f.write(body)
+        return out_path
+    s3.put_object(Bucket=bucket, Key=key, Body=body)
+    return f's3://{bucket}/{key}'
 
-        # Upload analytics summary
-        analytics_key = now_key.replace('processed/', 'analytics/').replace('.json', '_summary.json')
-        analytics_payload = {'generated_from': key, 'album_counts': album_counts}
-        try:
-            if analytics_bucket:
-                s3.put_object(Bucket=analytics_bucket, Key=analytics_key, Body=json.dumps(analytics_payload).encode('utf-8'))
-                analytics_path = f's3://{analytics_bucket}/{analytics_key}'
-            else:
-                out_dir = os.environ.get('LOCAL_UPLOAD_DIR', 'build/local_uploads')
-                os.makedirs(out_dir, exist_ok=True)
-                out_path = os.path.join(out_dir, analytics_key.replace('/', '_'))
-                with open(out_path, 'wb') as f:
-                    f.write(json.dumps(analytics_payload).encode('utf-8'))
-                analytics_path = out_path
-        except Exception as e:
-            logger.exception('Failed to upload analytics payload')
-            return {'status': 'error', 'message': str(e)}
 
-        logger.info(f'Wrote processed payload to {processed_path} and analytics to {analytics_path}')
-        return {'status': 'ok', 'processed_path': processed_path, 'analytics_path': analytics_path, 'rows': len(processed_rows)}
+def open_writer(s3, bucket, key, content_type=JSON_CONTENT_TYPE):
+    """Streaming writer for ``key``: S3 multipart when a bucket is set, else a local file."""
+    if not bucket:
+        return LocalFileWriter(os.environ.get('LOCAL_UPLOAD_DIR', 'build/local_uploads'), key)
+    return S3MultipartWriter(s3, bucket, key, part_size=S3_PART_SIZE, content_type=content_type)
 
-    s3 = boto3.client('s3')
-    analytics_bucket = os.environ.get('ANALYTICS_BUCKET')
-    if not analytics_bucket:
-        raise RuntimeError('ANALYTICS_BUCKET environment variable must be set')
 
-    records = event.get('Records', []) if isinstance(event, dict) else []
-    # We'll process each record and write one transformed file per input
-    results = []
-    for rec in records:
-        try:
-            s3_info = rec.get('s3', {})
-            bucket = s3_info.get('bucket', {}).get('name')
-            key = s3_info.get('object', {}).get('key')
-            if not bucket or not key:
-                logger.warning('Skipping record with missing bucket/key')
-                continue
-
-            obj = s3.get_object(Bucket=bucket, Key=key)
-            body = obj['Body'].read()
-            payload = json.loads(body)
-            rows = payload.get('rows', [])
-
-            # Transform: select fields and rename
-            transformed = []
-            for r in rows:
-                transformed.append({
-                    'track_id': r.get('TrackId') or r.get('track_id') or r.get('TrackID'),
-                    'track_name': r.get('Name') or r.get('track_name') or r.get('name'),
-                    'album_title': r.get('Title') or r.get('album_title') or r.get('AlbumTitle'),
-                    'composer': r.get('Composer'),
-                    'milliseconds': r.get('Milliseconds'),
-                    'unit_price': r.get('UnitPrice') or r.get('Unit_Price')
-                })
-
-            now = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
-            out_key = f'analytics/{now}/{key.split("/")[-1]}'
-            out_body = json.dumps({'processed_at': now, 'row_count': len(transformed), 'rows': transformed}, default=str)
-            s3.put_object(Bucket=analytics_bucket, Key=out_key, Body=out_body.encode('utf-8'))
-            results.append({'input': f's3://{bucket}/{key}', 'output': f's3://{analytics_bucket}/{out_key}', 'rows': len(transformed)})
+def _dumps(obj):
+    return json.dumps(obj, default=str)
+
+
+def project_rows(reader, spec, album_counts, stats=None, digest=None):
+    """Yield the processed rows of ``reader``, counting albums and feeding ``stats`` on the way.
+
+    The projection is compiled against the first row's columns. Raw rows are
+    fed to ``digest`` (a RowDigest) when given.
+    """
+    extract = None
+    for r in reader:
+        if digest is not None:
+            digest.add(r)
+        if extract is None:
+            extract = compile_projection(spec, r.keys())
+        track = extract(r)
+        album = track.get('album_title') or 'UNKNOWN'
+        album_counts[album] = album_counts.get(album, 0) + 1
+        if stats is not None:
+            stats.add(track)
+        yield track
+
+
+def stream_transform(reader, writer, processed_at, spec=None, stats=None, digest=None):
+    """Transform rows from ``reader`` straight into a processed JSON envelope on ``writer``.
+
+    Produces ``{"processed_at", "fetched_at", "rows": [...], "row_count"}``; the
+    header is written when the first row arrives so ``fetched_at`` from the raw
+    envelope is already known, and row_count goes last. Rows are encoded in
+    batches of PROCESSING_WRITE_BATCH. Processed rows are also fed to
+    ``stats`` (a ColumnStats) and raw rows to ``digest`` when given.
+    Returns ``(row_count, album_counts)``.
+    """
+    spec = spec or PROJECTION_SPEC
+    album_counts = {}
+    row_count = 0
+    batch = []
+
+    def header():
+        return (
+            '{"processed_at": ' + _dumps(processed_at) +
+            ', "fetched_at": ' + _dumps(reader.meta.get('fetched_at')) +
+            ', "rows": ['
+        )
+
+    for track in project_rows(reader, spec, album_counts, stats, digest):
+        if not row_count:
+            batch.append(header())
+        batch.append((', ' if row_count else '') + _dumps(track))
+        row_count += 1
+        if len(batch) >= PROCESSING_WRITE_BATCH:
+            writer.write(''.join(batch).encode('utf-8'))
+            batch = []
+
+    if not row_count:
+        batch.append(header())
+    batch.append('], "row_count": ' + str(row_count) + '}')
+    writer.write(''.join(batch).encode('utf-8'))
+    return row_count, album_counts
 
+
+def stream_transform_columnar(reader, writer, processed_at, spec=None, stats=None, digest=None):
+    """Columnar counterpart of ``stream_transform``: same meta and rows, encoded with columnar.ColumnarWriter."""
+    spec = spec or PROJECTION_SPEC
+    album_counts = {}
+    encoder = ColumnarWriter(writer, meta={'processed_at': processed_at})
+    for track in project_rows(reader, spec, album_counts, stats, digest):
+        if 'fetched_at' not in encoder.meta:
+            # Known once the first raw row has been read; the header goes out with the first block
+            encoder.meta['fetched_at'] = reader.meta.get('fetched_at')
+        encoder.add(track)
+    encoder.meta.setdefault('fetched_at', reader.meta.get('fetched_at'))
+    return encoder.close(), album_counts
+
+
+def projection_for(key):
+    """The projection spec for a raw key, or None when its table has none.
+
+    Without PROJECTION_SPECS every object uses PROJECTION_SPEC (single-query
+    deployments). With it, objects are routed by the table component of
+    their key, so a table is never forced through another table's columns.
+    """
+    if PROJECTION_SPECS is None:
+        return PROJECTION_SPEC
+    return PROJECTION_SPECS.get(table_of(key))
+
+
+def output_keys(key):
+    """Map a raw key to its processed and analytics summary keys."""
+    base = key[len('raw/'):] if key.startswith('raw/') else key
+    base = base.rsplit('.', 1)[0] if '.' in base.rsplit('/', 1)[-1] else base
+    suffix = COLUMNAR_SUFFIX if PAYLOAD_FORMAT == COLUMNAR_FORMAT else '.json'
+    return f'processed/{base}{suffix}', f'analytics/{base}_summary.json'
+
+
+def process_object(s3, bucket, key):
+    """Read one raw object, transform it and write the processed payload and album summary.
+
+    Rows are streamed from the raw object through its table's projection
+    (see projection_for) into the processed object, so memory use does not grow with the input size.
+
+    With CHANGE_DETECTION, inputs whose content digest was already processed
+    are skipped. Only objects tagged with a digest by ingestion are skipped
+    before any row is read. For untagged objects the digest is computed over
+    the raw rows as they are read (for columnar inputs, the columns the
+    projection reads) while the output goes to a local spool; it is checked
+    before anything is written, and a duplicate writes no processed object,
+    summary, index entry or upload at all.
+    """
+    source = f's3://{bucket}/{key}'
+    spec = projection_for(key)
+    if spec is None:
+        logger.info(f'Skipping {source}: no projection for table {table_of(key)!r}')
+        return {'status': 'skipped', 'input': source, 'reason': f'no projection for table {table_of(key)!r}'}
+    reader = open_payload(s3, bucket, key, spec=spec)
+    processed_key, analytics_key = output_keys(key)
+    processed_at = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+    store = open_store(s3 if PROCESSED_BUCKET else None, PROCESSED_BUCKET)
+
+    digest = reader.metadata.get(DIGEST_METADATA_KEY) if CHANGE_DETECTION else None
+    hasher = RowDigest() if CHANGE_DETECTION and not digest else None
+    if digest:
+        seen = find_processed(store, digest)
+        if seen:
+            reader.close()
+            return _duplicate_result(source, digest, seen)
+
+    stats = ColumnStats(PROCESSING_STATS_COLUMNS)
+    if PAYLOAD_FORMAT == COLUMNAR_FORMAT:
+        transform, content_type = stream_transform_columnar, COLUMNAR_CONTENT_TYPE
+    else:
+        transform, content_type = stream_transform, JSON_CONTENT_TYPE
+    # Body reads and part uploads are timed as 'download'/'upload'; the rest is parse + transform + encode
+    with stage('transform') as t:
+        if hasher:
+            # The digest is only known after the last row: spool the output and check before writing it
+            with SpoolWriter() as spool:
+                row_count, album_counts = transform(reader, spool, processed_at, spec=spec, stats=stats, digest=hasher)
+                digest = hasher.hexdigest()
+                seen = find_processed(store, digest)
+                if seen:
+                    return _duplicate_result(source, digest, seen)
+                with timed_writer(open_writer(s3, PROCESSED_BUCKET, processed_key, content_type=content_type)) as writer:
+                    spool.copy_to(writer)
+        else:
+            with timed_writer(open_writer(s3, PROCESSED_BUCKET, processed_key, content_type=content_type)) as writer:
+                row_count, album_counts = transform(reader, writer, processed_at, spec=spec, stats=stats, digest=hasher)
+        t.add(rows=row_count)
+    processed_path = writer.path
+    add_totals(rows=row_count, bytes=writer.bytes_written)
+
+    # Register the object in the processed/ file index so readers can prune by column stats
+    parsed = split_key(processed_key, 'processed/')
+    data_time = reader.meta.get('fetched_at') or (parsed[0] if parsed else processed_at)
+    entry = build_entry(
+        processed_key, row_count, writer.bytes_written, stats.to_dict(),
+        time_range={'min': data_time, 'max': data_time}, processed_at=processed_at
+    )
+    with stage('index'):
+        add_entry(store, 'processed/', entry)
+
+    analytics_payload = {'generated_from': key, 'album_counts': album_counts}
+    with stage('summary'):
+        analytics_path = write_json(s3, ANALYTICS_BUCKET, analytics_key, analytics_payload)
+
+    if digest:
+        # Recorded last so a failure above leaves the input eligible for a retry
+        with stage('index'):
+            mark_processed(store, digest, source, processed_path)
+
+    result = {
+        'status': 'ok',
+        'input': source,
+        'processed_path': processed_path,
+        'analytics_path': analytics_path,
+        'rows': row_count
+    }
+    if digest:
+        result['digest'] = digest
+    return result
+
+
+def _duplicate_result(source, digest, seen):
+    logger.info(f"Skipping {source}: content {digest} already processed from {seen.get('input')}")
+    return {
+        'status': 'skipped',
+        'input': source,
+        'reason': 'duplicate content',
+        'digest': digest,
+        'duplicate_of': seen.get('input')
+    }
+
+
+@METRICS.instrument
+def lambda_handler(event, context):
+    """Process every raw object referenced by an S3/EventBridge event.
+
+    Records are processed concurrently (up to PROCESSING_CONCURRENCY); each one
+    is transformed into a processed payload plus an album-count summary in a
+    single pass over its rows. Results are reported per record and a failing
+    record does not affect the others.
+    """
+    logger.info('Processing lambda invoked')
+    records = parse_records(event)
+    if not records:
+        logger.error('No S3 records found in event')
+        return {'status': 'error', 'message': 'no records in event'}
+
+    s3 = boto3_client('s3')
+
+    def process(record):
+        bucket, key = record
+        bucket = bucket or RAW_BUCKET
+        if not key:
+            logger.warning('Skipping record with missing key')
+            return {'status': 'skipped', 'input': None, 'reason': 'no key in record'}
+        if key.rsplit('/', 1)[-1].startswith('_'):
+            # Run manifests (e.g. _manifest.json from partitioned ingestion) are not row payloads
+            logger.info(f'Skipping manifest object {key}')
+            return {'status': 'skipped', 'input': f's3://{bucket}/{key}', 'reason': 'manifest'}
+        try:
+            result = process_object(s3, bucket, key)
         except Exception as e:
-            logger.exception('Error processing record')
-            results.append({'error': str(e)})
+            logger.exception(f'Error processing s3://{bucket}/{key}')
+            return {'status': 'error', 'input': f's3://{bucket}/{key}', 'error': str(e)}
+        if result['status'] == 'ok':
+            logger.info(f"Processed {result['input']}: {result['rows']} rows -> {result['processed_path']}")
+        return result
 
-    return {'status': 'ok', 'results': results}
+    results = run_records(records, process, PROCESSING_CONCURRENCY)
+    errors = sum(1 for r in results if r['status'] == 'error')
+    if not errors:
+        status = 'ok'
+    elif errors == len(results):
+        status = 'error'
+    else:
+        status = 'partial'
+    return {'status': status, 'results': results}
@@ -0,0 +1,146 @@
+import json
+from functools import partial
+
+# Declarative column projection for the processing transform.
+#
+# A spec maps each output column to the source column aliases it may come from
+# (first match wins) and an optional type. The spec is resolved once per input
+# file against the columns the file actually has and compiled into a row
+# extractor that is a single dict display of direct ``row[column]`` lookups
+# (generated source, like collections.namedtuple does), instead of a chain of
+# dict.get calls per field. Because resolution picks the column that exists
+# rather than the first truthy value, 0, 0.0 and '' are preserved.
+#
+# Spec format (JSON, ordered):
+#   {"track_id": {"aliases": ["TrackId", "track_id"], "type": "int"},
+#    "composer": ["Composer", "composer"]}
+
+DEFAULT_SPEC = {
+    'track_id': {'aliases': ['TrackId', 'track_id', 'TrackID'], 'type': 'int'},
+    'track_name': {'aliases': ['Name', 'track_name', 'name']},
+    'album_title': {'aliases': ['Title', 'album_title', 'AlbumTitle', 'Album']},
+    'composer': {'aliases': ['Composer', 'composer']},
+    'milliseconds': {'aliases': ['Milliseconds', 'milliseconds'], 'type': 'int'},
+    'unit_price': {'aliases': ['UnitPrice', 'Unit_Price', 'unit_price'], 'type': 'float'}
+}
+
+_TRUE = frozenset(('true', 't', 'yes', 'y', '1'))
+_FALSE = frozenset(('false', 'f', 'no', 'n', '0'))
+
+
+def parse_bool(value):
+    """Parse the usual boolean spellings: true/false, t/f, yes/no, y/n, 1/0 (strings or numbers).
+
+    bool() would turn every non-empty string, including "false" and "0", into True.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in _TRUE:
+            return True
+        if text in _FALSE:
+            return False
+    raise ValueError(f'not a boolean: {value!r}')
+
+
+COERCIONS = {
+    'int': int,
+    'float': float,
+    'str': str,
+    'bool': parse_bool
+}
+# Result type of each converter, for the already-converted fast path
+_RESULT_TYPES = {parse_bool: bool}
+
+
+def normalize_spec(spec):
+    """Return the spec as a list of ``(output, aliases, coerce)`` tuples, validating types."""
+    columns = []
+    for name, entry in spec.items():
+        if isinstance(entry, (list, tuple)):
+            entry = {'aliases': list(entry)}
+        aliases = entry.get('aliases') or [name]
+        type_name = entry.get('type')
+        if type_name is not None and type_name not in COERCIONS:
+            raise ValueError(f'Unknown type {type_name!r} for projected column {name!r}')
+        columns.append((name, list(aliases), COERCIONS.get(type_name)))
+    return columns
+
+
+def load_spec(env_value=None, path=None):
+    """Load the projection spec from a JSON string, a JSON file, or fall back to DEFAULT_SPEC."""
+    if env_value:
+        return normalize_spec(json.loads(env_value))
+    if path:
+        with open(path) as f:
+            return normalize_spec(json.load(f))
+    return normalize_spec(DEFAULT_SPEC)
+
+
+def load_specs(env_value=None, path=None):
+    """Load per-table projection specs (``{"<table>": spec, ...}``) from JSON, or None when unset."""
+    if env_value:
+        specs = json.loads(env_value)
+    elif path:
+        with open(path) as f:
+            specs = json.load(f)
+    else:
+        return None
+    return {table: normalize_spec(spec) for table, spec in specs.items()}
+
+
+def source_columns(spec):
+    """Every input column the spec may read, so columnar readers can skip the rest."""
+    return {alias for _, aliases, _ in spec for alias in aliases}
+
+
+def resolve(spec, columns):
+    """Map each output column to the first alias present in ``columns`` (None if absent)."""
+    available = set(columns)
+    return [next((a for a in aliases if a in available), None) for _, aliases, _ in spec]
+
+
+def _coerce(fn, value):
+    if value is None or (value == '' and fn is not str):
+        return None
+    return fn(value)
+
+
+def _row_expressions(spec, sources, lookup, namespace):
+    items = []
+    for i, ((name, _, fn), src) in enumerate(zip(spec, sources)):
+        if src is None:
+            expr = 'None'
+        elif fn is None:
+            expr = lookup.format(src=repr(src))
+        else:
+            namespace[f'_t{i}'] = _RESULT_TYPES.get(fn, fn)
+            namespace[f'_c{i}'] = partial(_coerce, fn)
+            # Only call the converter when the value is not already of the target type
+            expr = f'(_v if (_v := {lookup.format(src=repr(src))}) is None or _v.__class__ is _t{i} else _c{i}(_v))'
+        items.append(f'{name!r}: {expr}')
+    return '{' + ', '.join(items) + '}'
+
+
+def compile_projection(spec, columns):
+    """Compile ``spec`` for an input with the given ``columns`` into ``extract(row) -> dict``.
+
+    Rows missing one of the resolved columns (heterogeneous NDJSON) fall back to
+    ``dict.get`` for that row, yielding None for the absent values.
+    """
+    sources = resolve(spec, columns)
+    namespace = {}
+    fast = _row_expressions(spec, sources, 'r[{src}]', namespace)
+    slow = _row_expressions(spec, sources, 'r.get({src})', namespace)
+    source = (
+        'def extract(r):\n'
+        '    try:\n'
+        f'        return {fast}\n'
+        '    except KeyError:\n'
+        f'        return {slow}\n'
+    )
+    exec(source, namespace)
+    return namespace['extract']
@@ -0,0 +1,321 @@
+import io
+import sys
+import json
+import zlib
+import struct
+from array import array
+from decimal import Decimal
+
+# Compressed columnar payload format ("colz") used between pipeline stages as
+# an alternative to the JSON envelope.
+#
+#   MAGIC
+#   frame: header JSON    {"version": 1, "meta": {...}, "columns": [names of the first block]}
+#   frame: block header   {"rows": n, "columns": [{"name", "enc", "codec", "len", "nulls", ...}]}
+#          column chunks  one per block header column, ``len`` bytes each
+#   ...
+#   frame: end            {"end": true, "row_count": n, "meta": {...}}
+#
+# A frame is a little-endian uint32 length followed by that many bytes. Each
+# column chunk is encoded by type and compressed on its own (zlib), so a
+# reader that only needs some columns skips the bytes of the others without
+# decompressing them. Encodings:
+#   i64 / f64  stdlib ``array`` of int64/float64 (plus a validity byte per row when there are nulls)
+#   dec        Decimal as int64 scaled by 10**scale (values come back with the block's common scale)
+#   bool       one byte per row: 0, 1, or 2 for null
+#   dict       low-cardinality strings: JSON dictionary + index array (B/H/I)
+#   str        JSON list of strings
+#   json       anything else, as a JSON list (``default=str``, like the JSON envelope)
+# Datetimes and dates are stored as ``str(value)``, matching the JSON envelope.
+# A key missing from some rows of a block decodes as null in those rows.
+
+MAGIC = b'PCOL\x01'
+COLUMNAR_SUFFIX = '.colz'
+COLUMNAR_CONTENT_TYPE = 'application/x-pipeline-columnar'
+# S3 user metadata (x-amz-meta-payload-format) naming the payload format
+FORMAT_METADATA_KEY = 'payload-format'
+COLUMNAR_FORMAT = 'columnar'
+DEFAULT_BLOCK_ROWS = 8192
+
+_LEN = struct.Struct('<I')
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+_SWAP = sys.byteorder != 'little'
+
+
+def is_columnar(key='', content_type=None, metadata=None):
+    """Whether an object is a columnar payload, judging by key suffix, content type or S3 metadata."""
+    if key.endswith(COLUMNAR_SUFFIX):
+        return True
+    if (content_type or '').startswith(COLUMNAR_CONTENT_TYPE):
+        return True
+    return (metadata or {}).get(FORMAT_METADATA_KEY) == COLUMNAR_FORMAT
+
+
+def _frame(data):
+    return _LEN.pack(len(data)) + data
+
+
+def _array_bytes(typecode, values):
+    arr = array(typecode, values)
+    if _SWAP and arr.itemsize > 1:
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _array_values(typecode, data):
+    arr = array(typecode)
+    arr.frombytes(data)
+    if _SWAP and arr.itemsize > 1:
+        arr.byteswap()
+    return arr.tolist()
+
+
+def _index_typecode(size):
+    if size <= 0xFF:
+        return 'B'
+    if size <= 0xFFFF:
+        return 'H'
+    return 'I'
+
+
+def _with_validity(values, nulls, fill, typecode):
+    if not nulls:
+        return _array_bytes(typecode, values)
+    validity = bytes(0 if v is None else 1 for v in values)
+    return validity + _array_bytes(typecode, [fill if v is None else v for v in values])
+
+
+def _decimal_scale(values):
+    scale = 0
+    for v in values:
+        if v is not None:
+            if not v.is_finite():
+                return None
+            scale = max(scale, -v.as_tuple().exponent)
+    return scale
+
+
+def encode_column(values):
+    """Encode one column of a block. Returns ``(descriptor, raw_bytes)`` before compression."""
+    nulls = 0
+    kinds = set()
+    for v in values:
+        if v is None:
+            nulls += 1
+        else:
+            kinds.add(v.__class__)
+    desc = {'nulls': nulls}
+    n = len(values)
+
+    if not kinds:
+        return dict(desc, enc='null'), b''
+    if kinds == {bool}:
+        return dict(desc, enc='bool'), bytes(2 if v is None else int(v) for v in values)
+    if kinds == {int} and all(_INT64_MIN <= v <= _INT64_MAX for v in values if v is not None):
+        return dict(desc, enc='i64'), _with_validity(values, nulls, 0, 'q')
+    if kinds == {float}:
+        return dict(desc, enc='f64'), _with_validity(values, nulls, 0.0, 'd')
+    if kinds == {Decimal}:
+        scale = _decimal_scale(values)
+        if scale is not None:
+            scaled = [None if v is None else int(v.scaleb(scale)) for v in values]
+            if all(_INT64_MIN <= v <= _INT64_MAX for v in scaled if v is not None):
+                return dict(desc, enc='dec', scale=scale), _with_validity(scaled, nulls, 0, 'q')
+    if all(k is str or hasattr(k, 'isoformat') for k in kinds):
+        strings = [v if v is None or v.__class__ is str else str(v) for v in values]
+        positions = {}
+        for s in strings:
+            if s not in positions:
+                positions[s] = len(positions)
+        if len(positions) <= max(n // 2, 1):
+            dictionary = json.dumps(list(positions)).encode('utf-8')
+            typecode = _index_typecode(len(positions))
+            indices = _array_bytes(typecode, [positions[s] for s in strings])
+            return dict(desc, enc='dict', index=typecode), _frame(dictionary) + indices
+        return dict(desc, enc='str'), json.dumps(strings).encode('utf-8')
+    return dict(desc, enc='json'), json.dumps(values, default=str).encode('utf-8')
+
+
+def decode_column(desc, data, n):
+    """Inverse of ``encode_column`` for a block of ``n`` rows."""
+    enc = desc['enc']
+    nulls = desc.get('nulls', 0)
+    if enc == 'null':
+        return [None] * n
+    if enc == 'bool':
+        return [None if b == 2 else bool(b) for b in data]
+    if enc in ('i64', 'f64', 'dec'):
+        validity = data[:n] if nulls else None
+        values = _array_values('d' if enc == 'f64' else 'q', data[n:] if nulls else data)
+        if enc == 'dec':
+            scale = -desc['scale']
+            values = [Decimal(v).scaleb(scale) for v in values]
+        if validity is not None:
+            values = [v if ok else None for v, ok in zip(values, validity)]
+        return values
+    if enc == 'dict':
+        size = _LEN.unpack_from(data)[0]
+        dictionary = json.loads(data[_LEN.size:_LEN.size + size])
+        return list(map(dictionary.__getitem__, _array_values(desc['index'], data[_LEN.size + size:])))
+    if enc in ('str', 'json'):
+        return json.loads(data)
+    raise ValueError(f'Unknown column encoding {enc!r}')
+
+
+class ColumnarWriter:
+    """Encode dict rows into the columnar format on a byte writer (anything with ``write``).
+
+    Rows are buffered ``block_rows`` at a time. The header (with ``meta``) is
+    written together with the first block, so ``meta`` may still be filled in
+    until then; ``close(meta)`` adds trailing metadata such as counts.
+    """
+
+    def __init__(self, out, meta=None, block_rows=DEFAULT_BLOCK_ROWS, level=6):
+        self.out = out
+        self.meta = dict(meta or {})
+        self.block_rows = block_rows
+        self.level = level
+        self.row_count = 0
+        self._names = []
+        self._rows = []
+        self._started = False
+
+    def add(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.block_rows:
+            self._flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def _start(self):
+        header = {'version': 1, 'meta': self.meta, 'columns': list(self._names)}
+        self.out.write(MAGIC + _frame(json.dumps(header, default=str).encode('utf-8')))
+        self._started = True
+
+    def _flush(self):
+        rows, self._rows = self._rows, []
+        # Keep the column order stable across blocks; later blocks may add columns
+        seen = set(self._names)
+        for row in rows:
+            if len(row) != len(seen) or not seen.issuperset(row):
+                for name in row:
+                    if name not in seen:
+                        seen.add(name)
+                        self._names.append(name)
+        if not self._started:
+            self._start()
+        if not rows:
+            return
+        descs = []
+        chunks = []
+        for name in self._names:
+            desc, raw = encode_column([r.get(name) for r in rows])
+            packed = zlib.compress(raw, self.level)
+            if len(packed) < len(raw):
+                desc['codec'], raw = 'zlib', packed
+            else:
+                desc['codec'] = 'none'
+            desc['name'] = name
+            desc['len'] = len(raw)
+            descs.append(desc)
+            chunks.append(raw)
+        block = {'rows': len(rows), 'columns': descs}
+        self.out.write(_frame(json.dumps(block).encode('utf-8')) + b''.join(chunks))
+        self.row_count += len(rows)
+
+    def close(self, meta=None):
+        """Write the remaining rows and the end frame. Does not close ``out``."""
+        self._flush()
+        end = {'end': True, 'row_count': self.row_count, 'meta': meta or {}}
+        self.out.write(_frame(json.dumps(end, default=str).encode('utf-8')))
+        return self.row_count
+
+
+class ColumnarReader:
+    """Stream rows from a columnar payload, decoding only ``columns`` when given.
+
+    ``meta`` holds the header metadata right away and the trailing metadata
+    (including ``row_count``) once iteration has finished.
+    """
+
+    format = COLUMNAR_FORMAT
+
+    def __init__(self, body, columns=None):
+        self.body = body
+        self.columns = set(columns) if columns is not None else None
+        if self._read(len(MAGIC)) != MAGIC:
+            raise ValueError('Not a columnar payload')
+        header = json.loads(self._read_frame())
+        self.meta = dict(header.get('meta') or {})
+        self.schema = header.get('columns', [])
+        self._seekable = getattr(body, 'seekable', lambda: False)()
+
+    def _read(self, n):
+        parts = []
+        while n > 0:
+            chunk = self.body.read(n)
+            if not chunk:
+                raise ValueError('Truncated columnar payload')
+            parts.append(chunk)
+            n -= len(chunk)
+        return b''.join(parts)
+
+    def _read_frame(self):
+        return self._read(_LEN.unpack(self._read(_LEN.size))[0])
+
+    def _skip(self, n):
+        if self._seekable:
+            self.body.seek(n, io.SEEK_CUR)
+        else:
+            while n > 0:
+                n -= len(self._read(min(n, 1 << 20)))
+
+    def iter_blocks(self):
+        """Yield ``(names, column_value_lists, row_count)`` per block."""
+        while True:
+            block = json.loads(self._read_frame())
+            if block.get('end'):
+                self.meta.update(block.get('meta') or {})
+                self.meta['row_count'] = block['row_count']
+                return
+            n = block['rows']
+            names = []
+            values = []
+            for desc in block['columns']:
+                if self.columns is not None and desc['name'] not in self.columns:
+                    self._skip(desc['len'])
+                    continue
+                data = self._read(desc['len'])
+                if desc['codec'] == 'zlib':
+                    data = zlib.decompress(data)
+                names.append(desc['name'])
+                values.append(decode_column(desc, data, n))
+            yield names, values, n
+
+    def __iter__(self):
+        for names, values, n in self.iter_blocks():
+            if not names:
+                for _ in range(n):
+                    yield {}
+                continue
+            for row in zip(*values):
+                yield dict(zip(names, row))
+
+
+def encode_columnar(payload, block_rows=DEFAULT_BLOCK_ROWS):
+    """Encode a ``{..., "rows": [...]}`` envelope as columnar bytes (other members become meta)."""
+    out = io.BytesIO()
+    meta = {k: v for k, v in payload.items() if k not in ('rows', 'row_count')}
+    writer = ColumnarWriter(out, meta=meta, block_rows=block_rows)
+    writer.write_rows(payload.get('rows') or [])
+    writer.close()
+    return out.getvalue()
+
+
+def decode_columnar(data, columns=None):
+    """Decode columnar bytes back into an envelope dict with ``rows`` and ``row_count``."""
+    reader = ColumnarReader(io.BytesIO(data), columns=columns)
+    rows = list(reader)
+    return dict(reader.meta, rows=rows)
@@ -0,0 +1,95 @@
+import json
+import hashlib
+from datetime import datetime
+
+from object_store import PreconditionFailed
+
+# Content digests of extracted row sets.
+#
+# Ingestion hashes the rows it streams and skips the upload when the digest
+# matches the previous run of the same query; processing records the digests
+# it has handled and skips raw objects whose content it has already processed.
+#
+# The digest is SHA-256 over the rows encoded as NDJSON (``json.dumps(row,
+# default=str)`` per line), so it does not depend on the payload format, the
+# chunk size or ``fetched_at``. It does depend on row and column order: a query
+# whose row order is not fixed (no ORDER BY) may occasionally hash differently
+# for identical data, which only costs one redundant upload.
+
+DIGEST_METADATA_KEY = 'content-digest'
+DIGEST_STATE_PREFIX = '_state/digests/'
+PROCESSED_DIGEST_PREFIX = '_state/processed-digests/'
+
+
+class RowDigest:
+    """Incremental content digest of a stream of dict rows."""
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.row_count = 0
+
+    def update(self, rows):
+        """Hash a list of rows; returns their NDJSON encoding so callers can reuse it."""
+        data = ''.join(json.dumps(r, default=str) + '\n' for r in rows).encode('utf-8')
+        self.update_encoded(data, len(rows))
+        return data
+
+    def update_encoded(self, data, rows):
+        """Hash ``rows`` rows that are already NDJSON encoded as ``data``."""
+        self._hash.update(data)
+        self.row_count += rows
+
+    def add(self, row):
+        self._hash.update((json.dumps(row, default=str) + '\n').encode('utf-8'))
+        self.row_count += 1
+
+    def hexdigest(self):
+        return f'sha256:{self._hash.hexdigest()}'
+
+
+def digest_rows(rows):
+    """Digest of a complete, in-memory list of rows."""
+    digest = RowDigest()
+    digest.update(rows)
+    return digest.hexdigest()
+
+
+def extract_id(query):
+    """Stable identifier for the stored digest of ``query``'s last uploaded extract."""
+    return hashlib.sha256(query.strip().encode('utf-8')).hexdigest()[:16]
+
+
+def digest_state(digest, s3_path, row_count):
+    return {
+        'digest': digest,
+        's3_path': s3_path,
+        'row_count': row_count,
+        'updated_at': datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+    }
+
+
+def processed_marker_key(digest):
+    algorithm, _, value = digest.partition(':')
+    return f'{PROCESSED_DIGEST_PREFIX}{algorithm}/{value}.json'
+
+
+def find_processed(store, digest):
+    """Return the marker recorded when content ``digest`` was processed, or None."""
+    found = store.get(processed_marker_key(digest))
+    return json.loads(found[0]) if found else None
+
+
+def mark_processed(store, digest, source, processed_path):
+    """Record that content ``digest`` was processed from ``source``; the first writer wins."""
+    marker = {
+        'digest': digest,
+        'input': source,
+        'processed_path': processed_path,
+        'processed_at': datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+    }
+    try:
+        store.put(processed_marker_key(digest), json.dumps(marker).encode('utf-8'), if_none_match=True)
+    except PreconditionFailed:
+        # A concurrent invocation processed the same content first
+        return False
+    return True
@@ -0,0 +1,289 @@
+import json
+import operator
+from contextlib import closing
+
+from json_stream import PayloadReader
+from key_layout import canonical_key, partition_of, split_key
+from object_store import update_json
+
+# Per-partition file index with column statistics, used to prune reads.
+#
+# Every processed object gets an entry in _index/<prefix><partition>.json
+# (hourly partitions of the key timestamp) in the bucket that holds it:
+#
+#   {"version": 1, "prefix": "processed/", "partition": "2025-10-28T12",
+#    "files": {"processed/2025-10-28T12-15-52Z/<uuid>.json": {
+#        "key", "rows", "bytes", "time_range": {"min", "max"},
+#        "columns": {"milliseconds": {"min", "max", "nulls"}, ...}}}}
+#
+# Entries are appended with conditional writes (object_store.update_json), so
+# concurrent writers never drop each other's entries, and re-adding a key
+# replaces its entry. The index lives outside the data prefixes so it never
+# triggers the object-created pipeline. ``select_files``/``scan`` use the
+# statistics to skip objects that cannot contain rows matching a predicate.
+
+INDEX_PREFIX = '_index/'
+# Data prefixes whose writers maintain an index
+INDEXED_PREFIXES = ('processed/',)
+DEFAULT_STATS_COLUMNS = ('track_id', 'milliseconds', 'unit_price')
+INDEX_RETRIES = 25
+
+
+class ColumnStats:
+    """Running min/max/null counts for a fixed set of columns."""
+
+    def __init__(self, columns=DEFAULT_STATS_COLUMNS):
+        self.columns = tuple(columns)
+        self._stats = {c: [None, None, 0] for c in self.columns}
+        # Columns whose values are not mutually comparable get no min/max
+        self._unordered = set()
+
+    def add(self, row):
+        for column in self.columns:
+            value = row.get(column)
+            s = self._stats[column]
+            if value is None:
+                s[2] += 1
+            elif s[0] is None:
+                s[0] = s[1] = value
+            elif column not in self._unordered:
+                try:
+                    if value < s[0]:
+                        s[0] = value
+                    elif value > s[1]:
+                        s[1] = value
+                except TypeError:
+                    self._unordered.add(column)
+
+    def to_dict(self):
+        out = {}
+        for column, (lo, hi, nulls) in self._stats.items():
+            out[column] = {'nulls': nulls} if column in self._unordered else {'min': lo, 'max': hi, 'nulls': nulls}
+        return out
+
+
+def merge_column_stats(a, b):
+    """Combine the ``columns`` stats of two entries (missing min/max means unknown)."""
+    out = {}
+    for column in set(a) & set(b):
+        x, y = a[column], b[column]
+        merged = {'nulls': x['nulls'] + y['nulls']}
+        if 'min' in x and 'min' in y:
+            if x['min'] is None or y['min'] is None:
+                # One side is all null
+                merged['min'] = y['min'] if x['min'] is None else x['min']
+                merged['max'] = y['max'] if x['max'] is None else x['max']
+            else:
+                try:
+                    merged['min'] = min(x['min'], y['min'])
+                    merged['max'] = max(x['max'], y['max'])
+                except TypeError:
+                    pass
+        out[column] = merged
+    return out
+
+
+def build_entry(key, rows, size, columns, time_range=None, **extra):
+    entry = {'key': key, 'rows': rows, 'bytes': size, 'time_range': time_range, 'columns': columns}
+    entry.update(extra)
+    return entry
+
+
+def index_key(prefix, partition):
+    return f'{INDEX_PREFIX}{prefix}{partition}.json'
+
+
+def entry_partition(key, prefix):
+    parsed = split_key(key, prefix)
+    return partition_of(parsed[0]) if parsed else 'unpartitioned'
+
+
+def add_entry(store, prefix, entry, partition=None):
+    """Add (or replace) ``entry`` in its partition index."""
+    partition = partition or entry_partition(entry['key'], prefix)
+
+    def update(doc):
+        doc = doc or {'version': 1, 'prefix': prefix, 'partition': partition, 'files': {}}
+        doc['files'][entry['key']] = entry
+        return doc
+    return update_json(store, index_key(prefix, partition), update, retries=INDEX_RETRIES)
+
+
+def load_index(store, prefix, partition):
+    current = store.get(index_key(prefix, partition))
+    return json.loads(current[0]) if current else None
+
+
+def replace_entries(store, prefix, sources, entry, partition):
+    """Swap the entries of ``sources`` for one entry covering all of them (used by compaction).
+
+    The combined entry is written before the source entries are dropped, and
+    readers ignore entries that another entry lists as ``sources``, so a crash
+    in between never double-counts. Running it again is harmless.
+    """
+    sources = [canonical_key(k, prefix) for k in sources]
+    by_partition = {}
+    for key in sources:
+        by_partition.setdefault(entry_partition(key, prefix), []).append(key)
+
+    found = []
+    indexed = set()
+    for p, keys in by_partition.items():
+        doc = load_index(store, prefix, p) or {'files': {}}
+        hits = [doc['files'][k] for k in keys if k in doc['files']]
+        if hits:
+            indexed.add(p)
+            found.extend(hits)
+    if not found:
+        # Nothing to fold in: either never indexed or already replaced
+        existing = load_index(store, prefix, partition)
+        if existing and entry['key'] in existing['files']:
+            return
+    if len(found) == len(sources):
+        columns = found[0]['columns']
+        for e in found[1:]:
+            columns = merge_column_stats(columns, e['columns'])
+        ranges = [e['time_range'] for e in found]
+        if all(ranges):
+            entry['time_range'] = {'min': min(r['min'] for r in ranges), 'max': max(r['max'] for r in ranges)}
+    else:
+        # Some sources were never indexed: their values are unknown, so nothing can be pruned
+        columns = {}
+    entry['columns'] = columns
+    entry['sources'] = sources
+    add_entry(store, prefix, entry, partition)
+
+    for p in indexed:
+        def drop(doc, keys=by_partition[p]):
+            for k in keys:
+                doc['files'].pop(k, None)
+            return doc
+        update_json(store, index_key(prefix, p), drop, retries=INDEX_RETRIES)
+
+
+def _index_partition(name, prefix):
+    head = f'{INDEX_PREFIX}{prefix}'
+    for form in (head, head.replace('/', '_')):
+        if name.startswith(form) and name.endswith('.json'):
+            return name[len(form):-len('.json')]
+    return None
+
+
+def _window_overlaps(lo, hi, since, until):
+    """Does the timestamp range [lo, hi] overlap [since, until]? Pipeline timestamps sort lexically."""
+    if since is not None and hi is not None and hi < since[:len(hi)]:
+        return False
+    if until is not None and lo is not None and lo > until[:len(lo)]:
+        return False
+    return True
+
+
+def may_match(entry, where):
+    """False only when the entry's statistics prove that no row satisfies every condition in ``where``."""
+    columns = entry.get('columns') or {}
+    for column, op, value in where:
+        stats = columns.get(column)
+        if stats is None:
+            continue
+        if op == 'is_null':
+            if stats['nulls'] == 0:
+                return False
+            continue
+        if 'min' not in stats:
+            continue
+        lo, hi = stats['min'], stats['max']
+        if lo is None:
+            # Every value is null, so no comparison can be true
+            return False
+        try:
+            if op in ('=', '==') and (value < lo or value > hi):
+                return False
+            if op == '!=' and lo == hi == value:
+                return False
+            if op == '<' and not lo < value:
+                return False
+            if op == '<=' and not lo <= value:
+                return False
+            if op == '>' and not hi > value:
+                return False
+            if op == '>=' and not hi >= value:
+                return False
+            if op == 'between' and (value[1] < lo or value[0] > hi):
+                return False
+            if op == 'in' and all(v < lo or v > hi for v in value):
+                return False
+        except TypeError:
+            continue
+    return True
+
+
+_OPS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'between': lambda v, bounds: bounds[0] <= v <= bounds[1],
+    'in': lambda v, values: v in values
+}
+
+
+def row_matches(row, where):
+    """Exact evaluation of ``where`` against one row (null never satisfies a comparison)."""
+    for column, op, value in where:
+        v = row.get(column)
+        if op == 'is_null':
+            if v is not None:
+                return False
+            continue
+        if v is None:
+            return False
+        try:
+            if not _OPS[op](v, value):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+def select_files(store, prefix, where=(), since=None, until=None):
+    """Index entries of objects under ``prefix`` that may hold rows matching ``where``.
+
+    ``where`` is a sequence of ``(column, op, value)`` conditions, all of which
+    must hold; ops are ``= == != < <= > >= between in is_null``. ``since`` and
+    ``until`` are pipeline timestamps bounding the entries' time range. Only
+    the index documents are read, never the data objects.
+    """
+    where = list(where)
+    entries = {}
+    for name, _ in store.list(f'{INDEX_PREFIX}{prefix}'):
+        partition = _index_partition(name, prefix)
+        if partition is None or not _window_overlaps(partition, partition, since, until):
+            continue
+        doc = load_index(store, prefix, partition)
+        if doc:
+            entries.update(doc['files'])
+    replaced = {src for e in entries.values() for src in e.get('sources', ())}
+    selected = []
+    for key in sorted(entries):
+        entry = entries[key]
+        if key in replaced:
+            continue
+        tr = entry.get('time_range') or {}
+        if not _window_overlaps(tr.get('min'), tr.get('max'), since, until):
+            continue
+        if may_match(entry, where):
+            selected.append(entry)
+    return selected
+
+
+def scan(store, prefix, where=(), since=None, until=None):
+    """Yield the rows under ``prefix`` that satisfy ``where``, reading only the objects that may match."""
+    where = list(where)
+    for entry in select_files(store, prefix, where, since, until):
+        with closing(store.open(entry['key'])) as body:
+            for row in PayloadReader(body, key=entry['key']):
+                if row_matches(row, where):
+                    yield row
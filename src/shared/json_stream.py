@@ -0,0 +1,176 @@
+import gzip
+import json
+import codecs
+
+from columnar import ColumnarReader, is_columnar
+
+# Incremental readers for raw/processed payloads.
+#
+# Both formats written by the pipeline are read one row at a time from a
+# file-like body (boto3 StreamingBody, open file, BytesIO):
+#   - NDJSON: one JSON document per line
+#   - the JSON envelope {"fetched_at": ..., "row_count": ..., "rows": [...]}
+# For the envelope, top-level scalar members are decoded into ``meta`` and the
+# ``rows`` array is decoded element by element with json.JSONDecoder.raw_decode,
+# so only the current row (plus one read buffer) is held in memory.
+# Either format may be gzip-compressed (``.gz`` key suffix), as written by the
+# compaction stage. PayloadReader also reads the columnar format (columnar.py).
+
+READ_SIZE = 64 * 1024
+_WS = ' \t\r\n'
+_decoder = json.JSONDecoder()
+
+
+def iter_ndjson(body, read_size=READ_SIZE):
+    """Yield one decoded row per non-empty line of an NDJSON body."""
+    pending = b''
+    while True:
+        chunk = body.read(read_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if pending.strip():
+        yield json.loads(pending)
+
+
+class EnvelopeReader:
+    """Stream the rows of a ``{"...": ..., "rows": [...]}`` payload.
+
+    Iterate over the reader to get rows. Members other than ``rows_key`` are
+    collected in ``meta`` as they are encountered; members that precede the rows
+    array (``fetched_at`` in ingestion payloads) are available as soon as the
+    first row has been yielded, the rest once iteration finishes. A top-level
+    JSON array is treated as a bare list of rows.
+    """
+
+    def __init__(self, body, rows_key='rows', read_size=READ_SIZE):
+        self.body = body
+        self.rows_key = rows_key
+        self.read_size = read_size
+        self.meta = {}
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Read more input; returns False at end of stream."""
+        if self._eof:
+            return False
+        chunk = self.body.read(self.read_size)
+        if not chunk:
+            self._eof = True
+            self._buf = self._buf[self._pos:] + self._utf8.decode(b'', final=True)
+        else:
+            # Drop the consumed prefix so the buffer stays around one read in size
+            self._buf = self._buf[self._pos:] + self._utf8.decode(chunk)
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character ('' at end of input)."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WS:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        c = self._peek()
+        if not c or c not in chars:
+            raise ValueError(f'Malformed payload: expected one of {chars!r}, got {c!r}')
+        self._pos += 1
+        return c
+
+    def _value(self):
+        """Decode the next JSON value, reading more input until it is complete."""
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A value touching the end of the buffer (e.g. the number 12 of 123)
+            # may be truncated; only trust it once more input confirms the end.
+            if end == len(self._buf) and not self._eof:
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def _array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(',]') == ']':
+                return
+
+    def __iter__(self):
+        if self._peek() == '[':
+            yield from self._array()
+            return
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == self.rows_key and self._peek() == '[':
+                yield from self._array()
+            else:
+                self.meta[key] = self._value()
+            if self._expect(',}') == '}':
+                return
+
+
+class PayloadReader:
+    """Row iterator over a raw or processed payload, choosing the format from the key/content type.
+
+    ``metadata`` is the S3 user metadata of the object. ``columns`` limits the
+    columns decoded from columnar payloads; JSON rows are returned whole.
+    """
+
+    def __init__(self, body, key='', content_type=None, metadata=None, columns=None):
+        self.key = key
+        self.metadata = metadata or {}
+        self._body = body
+        if key.endswith('.gz'):
+            body = gzip.GzipFile(fileobj=body, mode='rb')
+            key = key[:-len('.gz')]
+        if is_columnar(key, content_type, metadata):
+            reader = ColumnarReader(body, columns=columns)
+            self.format = reader.format
+            self._rows = iter(reader)
+            self.meta = reader.meta
+        elif key.endswith('.ndjson') or (content_type or '').startswith('application/x-ndjson'):
+            self.format = 'ndjson'
+            self._rows = iter_ndjson(body)
+            # raw/<fetched_at>/... carries the extraction time for NDJSON objects
+            parts = key.split('/')
+            self.meta = {'fetched_at': parts[1]} if len(parts) > 2 else {}
+        else:
+            self.format = 'json'
+            envelope = EnvelopeReader(body)
+            self._rows = iter(envelope)
+            self.meta = envelope.meta
+
+    def __iter__(self):
+        return self._rows
+
+    def close(self):
+        """Release the underlying body without reading the rest of it."""
+        close = getattr(self._body, 'close', None)
+        if close is not None:
+            close()
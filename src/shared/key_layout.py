@@ -0,0 +1,58 @@
+from datetime import datetime
+
+# Key layout shared by the pipeline stages: data objects live under
+# <prefix><timestamp>/<name>, e.g. processed/2025-10-28T12-15-52Z/<uuid>.json.
+# Keys may also come in the flattened form used by the LOCAL_UPLOAD_DIR
+# fallback ('/' replaced by '_'); pipeline timestamps and object names never
+# contain '_', so both forms parse the same way.
+
+
+def split_key(key, prefix):
+    """Return ``(timestamp, rest)`` for ``<prefix><timestamp>/<rest>``, or None for foreign keys.
+
+    Keys with ``_``-prefixed components (manifests, state) are not data files.
+    """
+    sep = '/' if '/' in key else '_'
+    head = prefix.replace('/', sep)
+    if not key.startswith(head):
+        return None
+    timestamp, _, rest = key[len(head):].partition(sep)
+    if not timestamp or not rest or 'T' not in timestamp:
+        return None
+    parts = rest.split(sep)
+    if any(not part or part.startswith('_') for part in parts):
+        return None
+    return timestamp, '/'.join(parts)
+
+
+def table_of(key, prefix='raw/'):
+    """Table name of a multi-table data key ``<prefix><timestamp>/<table>/...``, else None.
+
+    Single-query keys (``<prefix><timestamp>/<uuid>.json``) have no table component.
+    """
+    parsed = split_key(key, prefix)
+    if not parsed or '/' not in parsed[1]:
+        return None
+    return parsed[1].split('/', 1)[0]
+
+
+def canonical_key(key, prefix):
+    """The '/'-separated form of a (possibly flattened) data key."""
+    parsed = split_key(key, prefix)
+    return f'{prefix}{parsed[0]}/{parsed[1]}' if parsed else key
+
+
+def partition_of(timestamp, granularity='hour'):
+    """Partition id for a pipeline timestamp like ``2025-10-28T12-15-52Z``."""
+    day, _, rest = timestamp.partition('T')
+    if granularity == 'day':
+        return day
+    return f'{day}T{rest[:2] if rest[:2].isdigit() else "00"}'
+
+
+def partition_end(partition):
+    """UTC datetime at which the partition's window closes."""
+    if 'T' in partition:
+        start = datetime.strptime(partition, '%Y-%m-%dT%H')
+        return start.replace(minute=59, second=59)
+    return datetime.strptime(partition, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
@@ -0,0 +1,445 @@
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Per-stage timing and throughput metrics in CloudWatch Embedded Metric Format.
+#
+# A handler decorated with ``Metrics(<function>).instrument`` opens one
+# invocation recorder per call; code anywhere below it times its stages with
+#
+#   with stage('query') as t:
+#       rows = query_db(...)
+#       t.add(rows=len(rows))
+#
+# or wraps its streams with ``timed_reader`` / ``timed_writer`` /
+# ``timed_iter``. Stage times are exclusive: a stage opened inside another one
+# is only counted in the inner stage, so the stages of an invocation add up to
+# its instrumented time. Stages running on worker threads are summed.
+#
+# When the invocation ends one EMF JSON line per stage (dimensions Function,
+# Stage) plus one ``Stage=total`` line with the invocation duration, cold
+# start flag and peak RSS is written to stdout, where CloudWatch turns them
+# into metrics. Tests and local tools can pass their own ``sink`` or read the
+# lines back with ``read_emf``.
+#
+# With metrics disabled no recorder is ever active and the helpers above
+# return a shared no-op timer or the wrapped object itself, so the only cost
+# left is one global lookup per call.
+#
+# Environment variables:
+# METRICS_ENABLED: '0'/'false' turns the instrumentation off (default on)
+# METRICS_NAMESPACE: CloudWatch namespace of the metrics (default DataPipeline)
+# METRICS_PROFILE: '1' runs the sampling profiler on every invocation; otherwise
+#   only invocations whose event contains "profile": true are sampled
+# METRICS_PROFILE_INTERVAL_MS: sampling interval (default 5)
+# METRICS_PROFILE_DIR: directory for folded-stack profiles (default /tmp/profiles)
+
+DEFAULT_NAMESPACE = 'DataPipeline'
+TOTAL_STAGE = 'total'
+_FALSE = ('0', 'false', 'no', 'off')
+
+# Function names that already served an invocation in this container
+_WARM = set()
+# Recorder of the invocation in progress (Lambda runs one invocation at a time)
+_ACTIVE = None
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).strip().lower() not in _FALSE
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of ``values`` (0 < q <= 100), None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(-(-q * len(ordered) // 100)))
+    return ordered[rank - 1]
+
+
+def _stdout_sink(doc):
+    sys.stdout.write(json.dumps(doc, default=str, separators=(',', ':')) + '\n')
+    sys.stdout.flush()
+
+
+class _NullStage:
+    """Shared timer returned while no invocation is being recorded."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, rows=0, bytes=0):
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+class StageTimer:
+    __slots__ = ('recorder', 'name', 'rows', 'bytes', 'start', 'child')
+
+    def __init__(self, recorder, name, rows=0, bytes=0):
+        self.recorder = recorder
+        self.name = name
+        self.rows = rows
+        self.bytes = bytes
+
+    def add(self, rows=0, bytes=0):
+        self.rows += rows
+        self.bytes += bytes
+
+    def __enter__(self):
+        self.recorder._stack().append(self)
+        self.child = 0.0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = self.recorder._stack()
+        stack.pop()
+        if stack:
+            stack[-1].child += elapsed
+        self.recorder.record(self.name, elapsed - self.child, self.rows, self.bytes)
+        return False
+
+
+class Invocation:
+    """Stage totals of one invocation: ``{stage: [calls, seconds, rows, bytes]}``."""
+
+    def __init__(self, function, namespace, cold_start, request_id=None):
+        self.function = function
+        self.namespace = namespace
+        self.cold_start = cold_start
+        self.request_id = request_id
+        self.stages = {}
+        self.rows = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.seconds = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def stage(self, name, rows=0, bytes=0):
+        return StageTimer(self, name, rows, bytes)
+
+    def record(self, name, seconds, rows=0, bytes=0):
+        with self._lock:
+            s = self.stages.get(name)
+            if s is None:
+                s = self.stages[name] = [0, 0.0, 0, 0]
+            s[0] += 1
+            s[1] += seconds
+            s[2] += rows
+            s[3] += bytes
+
+    def add_totals(self, rows=0, bytes=0):
+        with self._lock:
+            self.rows += rows
+            self.bytes += bytes
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def _document(self, stage, values, timestamp):
+        metrics = [{'Name': name, 'Unit': unit} for name, (_, unit) in values.items()]
+        doc = {
+            '_aws': {
+                'Timestamp': timestamp,
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [['Function', 'Stage']],
+                    'Metrics': metrics
+                }]
+            },
+            'Function': self.function,
+            'Stage': stage
+        }
+        doc.update((name, value) for name, (value, _) in values.items())
+        if self.request_id:
+            doc['RequestId'] = self.request_id
+        return doc
+
+    def documents(self, timestamp=None):
+        """EMF documents for every stage and the invocation total."""
+        timestamp = timestamp or int(time.time() * 1000)
+        docs = []
+        with self._lock:
+            stages = sorted(self.stages.items())
+            rows, size = self.rows, self.bytes
+        for name, (calls, seconds, stage_rows, stage_bytes) in stages:
+            docs.append(self._document(name, _throughput({
+                'Duration': (round(seconds * 1000, 3), 'Milliseconds'),
+                'Calls': (calls, 'Count')
+            }, seconds, stage_rows, stage_bytes), timestamp))
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self.started
+        values = _throughput({
+            'Duration': (round(seconds * 1000, 3), 'Milliseconds'),
+            'ColdStart': (int(self.cold_start), 'Count')
+        }, seconds, rows, size)
+        memory = peak_rss_mb()
+        if memory is not None:
+            values['PeakMemoryMB'] = (memory, 'Megabytes')
+        docs.append(self._document(TOTAL_STAGE, values, timestamp))
+        return docs
+
+
+def _throughput(values, seconds, rows, size):
+    if rows:
+        values['Rows'] = (rows, 'Count')
+        if seconds > 0:
+            values['RowsPerSecond'] = (round(rows / seconds, 1), 'Count/Second')
+    if size:
+        values['Bytes'] = (size, 'Bytes')
+        if seconds > 0:
+            values['BytesPerSecond'] = (round(size / seconds, 1), 'Bytes/Second')
+    return values
+
+
+class SamplingProfiler:
+    """Sample the Python stacks of all other threads every ``interval`` seconds.
+
+    Samples are kept as folded stacks (``outer;...;inner count``), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _fold(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self.samples[self._fold(frame)] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.samples
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(self.folded())
+        return path
+
+
+class Metrics:
+    """Metrics configuration for one Lambda function; see the module comment."""
+
+    def __init__(self, function, namespace=None, enabled=None, sink=None, profile=None):
+        self.function = function
+        self.namespace = namespace or os.environ.get('METRICS_NAMESPACE', DEFAULT_NAMESPACE)
+        self.enabled = _env_flag('METRICS_ENABLED', '1') if enabled is None else enabled
+        self.profile = _env_flag('METRICS_PROFILE', '0') if profile is None else profile
+        self.profile_interval = float(os.environ.get('METRICS_PROFILE_INTERVAL_MS', 5)) / 1000
+        self.profile_dir = os.environ.get('METRICS_PROFILE_DIR', '/tmp/profiles')
+        self.sink = sink or _stdout_sink
+        # Documents emitted by the most recent invocation
+        self.last = []
+
+    def _profile_requested(self, event):
+        return self.profile or (isinstance(event, dict) and bool(event.get('profile')))
+
+    @contextmanager
+    def invocation(self, event=None, context=None):
+        """Record one invocation; yields the Invocation (None when disabled)."""
+        global _ACTIVE
+        profiler = SamplingProfiler(self.profile_interval).start() if self._profile_requested(event) else None
+        if not self.enabled:
+            try:
+                yield None
+            finally:
+                if profiler is not None:
+                    self._emit_profile(profiler, None, context)
+            return
+
+        cold = self.function not in _WARM
+        _WARM.add(self.function)
+        inv = Invocation(self.function, self.namespace, cold, getattr(context, 'aws_request_id', None))
+        previous, _ACTIVE = _ACTIVE, inv
+        try:
+            yield inv
+        finally:
+            _ACTIVE = previous
+            inv.finish()
+            self.last = inv.documents()
+            for doc in self.last:
+                self.sink(doc)
+            if profiler is not None:
+                self._emit_profile(profiler, inv, context)
+
+    def _emit_profile(self, profiler, inv, context):
+        profiler.stop()
+        request_id = getattr(context, 'aws_request_id', None) or time.strftime('%Y%m%dT%H%M%S')
+        path = profiler.write(os.path.join(self.profile_dir, f'{self.function}-{request_id}.folded'))
+        doc = {
+            'Function': self.function,
+            'profile': {
+                'samples': sum(profiler.samples.values()),
+                'interval_ms': self.profile_interval * 1000,
+                'path': path,
+                'top': profiler.samples.most_common(10)
+            }
+        }
+        self.last.append(doc)
+        self.sink(doc)
+
+    def instrument(self, handler):
+        """Decorator for a ``lambda_handler(event, context)``."""
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            with self.invocation(event, context):
+                return handler(event, context)
+        return wrapper
+
+
+def stage(name, rows=0, bytes=0):
+    """Timer for one stage of the current invocation (a no-op outside of one)."""
+    inv = _ACTIVE
+    if inv is None:
+        return NULL_STAGE
+    return StageTimer(inv, name, rows, bytes)
+
+
+def add_totals(rows=0, bytes=0):
+    """Count rows/bytes towards the invocation total (its Rows/RowsPerSecond)."""
+    inv = _ACTIVE
+    if inv is not None:
+        inv.add_totals(rows, bytes)
+
+
+class _TimedReader:
+    """File-like proxy that times ``read`` calls and counts the bytes returned."""
+
+    def __init__(self, inv, body, name):
+        self._inv = inv
+        self._body = body
+        self._name = name
+
+    def read(self, *args):
+        with StageTimer(self._inv, self._name) as t:
+            data = self._body.read(*args)
+            t.bytes = len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._body, name)
+
+
+class _TimedWriter:
+    """Proxy for the streaming writers that times ``write`` and the final flush on exit."""
+
+    def __init__(self, inv, writer, name):
+        self._inv = inv
+        self._writer = writer
+        self._name = name
+
+    def write(self, data):
+        with StageTimer(self._inv, self._name, bytes=len(data)):
+            return self._writer.write(data)
+
+    def __enter__(self):
+        self._writer.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        with StageTimer(self._inv, self._name):
+            return self._writer.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
+
+
+def timed_reader(body, name='download'):
+    inv = _ACTIVE
+    return body if inv is None else _TimedReader(inv, body, name)
+
+
+def timed_writer(writer, name='upload'):
+    inv = _ACTIVE
+    return writer if inv is None else _TimedWriter(inv, writer, name)
+
+
+def timed_iter(iterable, name):
+    """Time each step of ``iterable``; items with a length (row chunks) count as that many rows."""
+    inv = _ACTIVE
+    if inv is None:
+        return iterable
+    return _timed_iter(inv, iter(iterable), name)
+
+
+def _timed_iter(inv, it, name):
+    while True:
+        with StageTimer(inv, name) as t:
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            t.rows = len(item) if hasattr(item, '__len__') else 1
+        yield item
+
+
+def read_emf(lines):
+    """Parse the EMF documents out of log lines (other lines are ignored)."""
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    docs = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith('{') and '"_aws"' in line:
+            docs.append(json.loads(line))
+    return docs
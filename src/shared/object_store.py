@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import random
+import hashlib
+
+from streaming import MIN_PART_SIZE, LocalFileWriter, S3MultipartWriter
+
+# Small key/value object store over S3 or the LOCAL_UPLOAD_DIR fallback.
+#
+# Both backends expose get/put/list/delete with ETag-based conditional writes,
+# which is what the read-modify-write updates (analytics rollups, manifests)
+# need to stay correct with concurrent writers. The local backend uses the
+# same flattened file naming as the handlers' local fallback
+# (key with '/' replaced by '_') so it sees the files they write.
+
+
+class PreconditionFailed(Exception):
+    """A conditional put lost the race: the object changed (or appeared) since it was read."""
+
+
+def _error_code(exc):
+    return getattr(exc, 'response', {}).get('Error', {}).get('Code')
+
+
+class S3ObjectStore:
+    def __init__(self, s3, bucket):
+        self.s3 = s3
+        self.bucket = bucket
+
+    def path(self, key):
+        return f's3://{self.bucket}/{key}'
+
+    def get(self, key):
+        """Return ``(body_bytes, etag)`` or None if the object does not exist."""
+        try:
+            resp = self.s3.get_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            if _error_code(e) in ('NoSuchKey', '404', 'NotFound'):
+                return None
+            raise
+        return resp['Body'].read(), resp.get('ETag')
+
+    def open(self, key):
+        """Streaming file-like body of the object at ``key``."""
+        return self.s3.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def writer(self, key, content_type='application/json', part_size=MIN_PART_SIZE):
+        """Chunked writer for a (possibly large) object; see streaming.S3MultipartWriter."""
+        return S3MultipartWriter(self.s3, self.bucket, key, part_size=part_size, content_type=content_type)
+
+    def put(self, key, body, if_match=None, if_none_match=False, content_type='application/json'):
+        """Write ``body``; with ``if_match``/``if_none_match`` the write is conditional. Returns the new ETag."""
+        kwargs = {'Bucket': self.bucket, 'Key': key, 'Body': body, 'ContentType': content_type}
+        if if_match:
+            kwargs['IfMatch'] = if_match
+        elif if_none_match:
+            kwargs['IfNoneMatch'] = '*'
+        try:
+            resp = self.s3.put_object(**kwargs)
+        except Exception as e:
+            if _error_code(e) in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+                raise PreconditionFailed(key) from e
+            raise
+        return resp.get('ETag')
+
+    def list(self, prefix):
+        """Yield ``(key, size)`` for every object under ``prefix``."""
+        token = None
+        while True:
+            kwargs = {'Bucket': self.bucket, 'Prefix': prefix}
+            if token:
+                kwargs['ContinuationToken'] = token
+            resp = self.s3.list_objects_v2(**kwargs)
+            for obj in resp.get('Contents', []):
+                yield obj['Key'], obj['Size']
+            if not resp.get('IsTruncated'):
+                return
+            token = resp.get('NextContinuationToken')
+
+    def delete(self, key):
+        self.s3.delete_object(Bucket=self.bucket, Key=key)
+
+
+class LocalObjectStore:
+    """Filesystem-backed store in a single directory, for local runs and tests.
+
+    Conditional writes are serialized with an fcntl lock so concurrent local
+    processes get the same compare-and-swap behaviour as S3.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _file(self, key):
+        return os.path.join(self.root, key.replace('/', '_'))
+
+    def path(self, key):
+        return self._file(key)
+
+    @staticmethod
+    def _etag(body):
+        return f'"{hashlib.md5(body).hexdigest()}"'
+
+    def get(self, key):
+        try:
+            with open(self._file(key), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        return body, self._etag(body)
+
+    def open(self, key):
+        return open(self._file(key), 'rb')
+
+    def writer(self, key, content_type='application/json', part_size=MIN_PART_SIZE):
+        return LocalFileWriter(self.root, key)
+
+    def put(self, key, body, if_match=None, if_none_match=False, content_type='application/json'):
+        import fcntl
+        os.makedirs(self.root, exist_ok=True)
+        target = self._file(key)
+        with open(os.path.join(self.root, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if if_match or if_none_match:
+                current = self.get(key)
+                if if_none_match and current is not None:
+                    raise PreconditionFailed(key)
+                if if_match and (current is None or current[1] != if_match):
+                    raise PreconditionFailed(key)
+            tmp = f'{target}.partial'
+            with open(tmp, 'wb') as f:
+                f.write(body)
+            os.replace(tmp, target)
+        return self._etag(body)
+
+    def list(self, prefix):
+        flat = prefix.replace('/', '_')
+        if not os.path.isdir(self.root):
+            return
+        for name in sorted(os.listdir(self.root)):
+            if name.startswith(flat) and not name.endswith('.partial'):
+                # The flattened name cannot be mapped back to '/' unambiguously;
+                # callers get the flattened form, which get/put/delete accept.
+                yield name, os.path.getsize(os.path.join(self.root, name))
+
+    def delete(self, key):
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+
+def open_store(s3, bucket, local_dir=None):
+    """S3 store when ``bucket`` is set, otherwise the LOCAL_UPLOAD_DIR fallback."""
+    if bucket:
+        return S3ObjectStore(s3, bucket)
+    return LocalObjectStore(local_dir or os.environ.get('LOCAL_UPLOAD_DIR', 'build/local_uploads'))
+
+
+def update_json(store, key, update, retries=10):
+    """Optimistically read-modify-write the JSON document at ``key``.
+
+    ``update(current_or_None)`` returns the new document. The write is
+    conditional on the version that was read; on a lost race the document is
+    re-read and ``update`` is applied again. Returns the written document.
+    """
+    for attempt in range(retries):
+        current = store.get(key)
+        doc = update(json.loads(current[0]) if current else None)
+        body = json.dumps(doc, default=str).encode('utf-8')
+        try:
+            if current:
+                store.put(key, body, if_match=current[1])
+            else:
+                store.put(key, body, if_none_match=True)
+            return doc
+        except PreconditionFailed:
+            time.sleep(random.uniform(0, 0.05 * (attempt + 1)))
+    raise PreconditionFailed(f'{key}: gave up after {retries} conflicting updates')
@@ -0,0 +1,180 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Warm-container cache for DB connections and boto3 clients.
+#
+# Lambda keeps module globals alive between invocations on a warm container,
+# so connections and clients created here are reused instead of paying a
+# TCP+TLS+auth handshake (or client construction) on every invocation.
+# Connections are checked out exclusively, so the same manager can serve a
+# thread pool. Before reuse a connection must pass a liveness check and be
+# younger than ``max_age`` seconds / used fewer than ``max_uses`` times.
+
+
+def default_ping(conn):
+    """Cheap liveness check that works for sqlite3 and psycopg2 connections."""
+    if getattr(conn, 'closed', 0):
+        raise RuntimeError('connection is closed')
+    cur = conn.cursor()
+    try:
+        cur.execute('SELECT 1')
+        cur.fetchone()
+    finally:
+        cur.close()
+    # Don't leave psycopg2 sitting in the implicit transaction opened by the ping
+    if hasattr(conn, 'rollback'):
+        conn.rollback()
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class _PooledConnection:
+    __slots__ = ('conn', 'created_at', 'uses')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.uses = 0
+
+
+class ResourceManager:
+    """Cache boto3 clients and pooled DB connections for the lifetime of the container."""
+
+    def __init__(self, max_age=300, max_uses=1000, ping=default_ping):
+        self.max_age = max_age
+        self.max_uses = max_uses
+        self.ping = ping
+        self._lock = threading.Lock()
+        self._session = None
+        self._clients = {}
+        self._idle = {}
+        self._counters = {
+            'client_hits': 0,
+            'client_creates': 0,
+            'connection_hits': 0,
+            'connection_creates': 0,
+            'reconnects': 0,
+            'liveness_failures': 0,
+            'expired': 0
+        }
+
+    def _count(self, name):
+        self._counters[name] += 1
+
+    def stats(self):
+        """Snapshot of the hit/create/reconnect counters."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['cached_clients'] = len(self._clients)
+            stats['idle_connections'] = sum(len(v) for v in self._idle.values())
+        return stats
+
+    def client(self, service_name, **kwargs):
+        """Return a cached boto3 client for ``service_name`` (created on first use).
+
+        boto3 clients are thread-safe once built, but building them through the
+        default session is not, so creation happens under the manager's lock.
+        """
+        cache_key = (service_name, tuple(sorted(kwargs.items())))
+        with self._lock:
+            client = self._clients.get(cache_key)
+            if client is not None:
+                self._count('client_hits')
+                return client
+            if self._session is None:
+                import boto3
+                self._session = boto3.session.Session()
+            client = self._session.client(service_name, **kwargs)
+            self._clients[cache_key] = client
+            self._count('client_creates')
+            return client
+
+    def _expired(self, pooled, now):
+        return (self.max_age and now - pooled.created_at > self.max_age) or \
+            (self.max_uses and pooled.uses >= self.max_uses)
+
+    def _checkout(self, key, factory):
+        now = time.monotonic()
+        stale = []
+        pooled = None
+        replaced = False
+        with self._lock:
+            # Drop expired idle connections for every key, not just this one, so
+            # keys that are no longer requested don't keep sockets/files open.
+            for k, idle in list(self._idle.items()):
+                keep = []
+                for p in idle:
+                    if self._expired(p, now):
+                        stale.append(p)
+                        replaced = replaced or k == key
+                    else:
+                        keep.append(p)
+                if keep:
+                    self._idle[k] = keep
+                else:
+                    del self._idle[k]
+            self._counters['expired'] += len(stale)
+            if self._idle.get(key):
+                pooled = self._idle[key].pop()
+        for p in stale:
+            _close_quietly(p.conn)
+
+        if pooled is not None:
+            try:
+                self.ping(pooled.conn)
+                with self._lock:
+                    self._count('connection_hits')
+                return pooled
+            except Exception:
+                _close_quietly(pooled.conn)
+                with self._lock:
+                    self._count('liveness_failures')
+                    self._count('reconnects')
+        elif replaced:
+            with self._lock:
+                self._count('reconnects')
+
+        pooled = _PooledConnection(factory())
+        with self._lock:
+            self._count('connection_creates')
+        return pooled
+
+    @contextmanager
+    def connection(self, key, factory):
+        """Check out a connection for ``key``, creating it with ``factory()`` when none is reusable.
+
+        The connection is returned to the pool when the block exits normally and
+        closed when it raises, since its state (e.g. an aborted transaction) is unknown.
+        """
+        pooled = self._checkout(key, factory)
+        pooled.uses += 1
+        try:
+            yield pooled.conn
+        except BaseException:
+            _close_quietly(pooled.conn)
+            raise
+        with self._lock:
+            self._idle.setdefault(key, []).append(pooled)
+
+    def close_all(self):
+        """Close every idle connection and forget cached clients."""
+        with self._lock:
+            idle = [p for conns in self._idle.values() for p in conns]
+            self._idle = {}
+            self._clients = {}
+        for p in idle:
+            _close_quietly(p.conn)
+
+
+# Module-level instance shared by every invocation on this container
+RESOURCES = ResourceManager(
+    max_age=float(os.environ.get('RESOURCE_MAX_AGE', 300)),
+    max_uses=int(os.environ.get('RESOURCE_MAX_USES', 1000))
+)
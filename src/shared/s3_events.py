@@ -0,0 +1,21 @@
+# Helpers for the S3 object-created events that trigger the pipeline stages.
+# Events arrive either as S3 notifications ({"Records": [{"s3": ...}]}, which is
+# also what the EventBridge input transformers in terraform/main.tf produce) or
+# as raw EventBridge "Object Created" events ({"detail": {...}}).
+
+
+def parse_records(event):
+    """Return ``(bucket, key)`` pairs from an S3 notification or EventBridge event.
+
+    Missing bucket names come back as None so the caller can apply a default.
+    """
+    if not isinstance(event, dict):
+        return []
+    if 'detail' in event:
+        detail = event['detail']
+        return [(detail.get('bucket', {}).get('name'), detail.get('object', {}).get('key'))]
+    pairs = []
+    for rec in event.get('Records', [event]):
+        s3_info = rec.get('s3', {})
+        pairs.append((s3_info.get('bucket', {}).get('name'), s3_info.get('object', {}).get('key')))
+    return pairs
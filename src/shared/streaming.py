@@ -0,0 +1,195 @@
+import os
+import json
+import tempfile
+
+# Chunked object writers shared by the streaming ingestion and processing stages.
+#
+# Rows are encoded one chunk at a time and handed to a writer which either
+# buffers them into S3 multipart parts or appends them to a local file, so a
+# handler never holds more than one chunk (plus one part buffer) in memory.
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+JSON_CONTENT_TYPE = 'application/json'
+
+
+def encode_ndjson(rows):
+    """Encode an iterable of dict rows as NDJSON bytes (one JSON document per line)."""
+    return ''.join(json.dumps(r, default=str) + '\n' for r in rows).encode('utf-8')
+
+
+class S3MultipartWriter:
+    """Write a stream of byte chunks to a single S3 object.
+
+    Bytes are buffered until at least ``part_size`` is available and then sent
+    with ``upload_part``. The multipart upload is only created once the first
+    part is full; small objects fall back to a single ``put_object`` on close.
+    User ``metadata`` is sent when the object is created, so entries added to
+    it after the first part went out only reach single-put objects.
+    """
+
+    def __init__(self, s3, bucket, key, part_size=MIN_PART_SIZE, content_type=NDJSON_CONTENT_TYPE, metadata=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(int(part_size), MIN_PART_SIZE)
+        self.content_type = content_type
+        self.metadata = dict(metadata or {})
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    @property
+    def path(self):
+        return f's3://{self.bucket}/{self.key}'
+
+    @property
+    def part_count(self):
+        return len(self._parts)
+
+    def write(self, data):
+        self._buffer.extend(data)
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            chunk = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._upload_part(chunk)
+
+    def _upload_part(self, chunk):
+        if self._upload_id is None:
+            resp = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key, ContentType=self.content_type, **self._extra())
+            self._upload_id = resp['UploadId']
+        part_number = len(self._parts) + 1
+        resp = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=chunk
+        )
+        self._parts.append({'ETag': resp['ETag'], 'PartNumber': part_number})
+
+    def _extra(self):
+        return {'Metadata': self.metadata} if self.metadata else {}
+
+    def close(self):
+        """Flush the remaining buffer and complete the upload. Returns the s3:// path."""
+        if self._upload_id is None:
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), ContentType=self.content_type, **self._extra())
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={'Parts': self._parts}
+            )
+        self._buffer = bytearray()
+        return self.path
+
+    def abort(self):
+        """Discard buffered data and abort any in-flight multipart upload."""
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            self._upload_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+        return False
+
+
+class LocalFileWriter:
+    """Local fallback with the same interface as S3MultipartWriter.
+
+    Writes to ``<out_dir>/<key with '/' replaced by '_'>``, matching the naming
+    used by ``upload_json_to_s3``. Data goes to a ``.partial`` file which is
+    renamed into place on close, so readers never see a half-written object.
+    """
+
+    def __init__(self, out_dir, key):
+        os.makedirs(out_dir, exist_ok=True)
+        self.key = key
+        self.out_path = os.path.join(out_dir, key.replace('/', '_'))
+        self.bytes_written = 0
+        # Accepted for interface parity; local files carry no metadata
+        self.metadata = {}
+        self._tmp_path = self.out_path + '.partial'
+        self._fh = open(self._tmp_path, 'wb')
+
+    @property
+    def path(self):
+        return self.out_path
+
+    @property
+    def part_count(self):
+        return 0
+
+    def write(self, data):
+        self._fh.write(data)
+        self.bytes_written += len(data)
+
+    def close(self):
+        self._fh.close()
+        os.replace(self._tmp_path, self.out_path)
+        return self.out_path
+
+    def abort(self):
+        self._fh.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+        return False
+
+
+class SpoolWriter:
+    """Writer that holds the stream in a local spool until its destination is known.
+
+    Data stays in memory up to ``max_memory`` bytes and then rolls over to a
+    temporary file (under /tmp on Lambda). ``copy_to`` replays it into another
+    writer. Used when the object's metadata depends on its whole content,
+    because S3 takes user metadata when the upload is created.
+    """
+
+    def __init__(self, max_memory=MIN_PART_SIZE):
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self.bytes_written = 0
+
+    def write(self, data):
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def copy_to(self, writer, chunk_size=MIN_PART_SIZE):
+        self._file.seek(0)
+        while True:
+            data = self._file.read(chunk_size)
+            if not data:
+                return
+            writer.write(data)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
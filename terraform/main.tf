@@ -1,4 +1,6 @@
 terraform {
+  # check blocks and startswith() need 1.5
+  required_version = ">= 1.5"
   required_providers {
     aws = {
       source  = "hashicorp/aws"
@@ -43,16 +45,37 @@ resource "aws_s3_bucket" "analytics_data" {
   }
 }
 
-# Layer module: upload build/layer.zip to artifacts bucket and create a Lambda Layer version
-module "db_layer" {
+# Per-function layers: the full dependency layer (scripts/package_layer.sh) pruned to the
+# modules each handler reaches (scripts/coldstart.py build-layer -> build/layers/<function>.zip),
+# so processing and analytics don't carry the DB driver stack into their cold starts
+module "ingestion_layer" {
   source = "./modules/layer"
-  name   = "${var.prefix}-db-drivers"
+  name   = "${var.prefix}-ingestion-deps"
 
-  # For local dev build the zip to build/layer.zip and this module will upload it
-  filename = abspath("${path.root}/../build/layer.zip")
+  filename = abspath("${path.root}/../build/layers/ingestion.zip")
   # If you prefer an existing bucket, set s3_bucket_name instead of creating one here
   create_bucket = true
-  s3_key = "layers/${var.prefix}-db-drivers.zip"
+  s3_key = "layers/${var.prefix}-ingestion-deps.zip"
+}
+
+module "processing_layer" {
+  source = "./modules/layer"
+  name   = "${var.prefix}-processing-deps"
+
+  filename       = abspath("${path.root}/../build/layers/processing.zip")
+  create_bucket  = false
+  s3_bucket_name = module.ingestion_layer.s3_bucket
+  s3_key = "layers/${var.prefix}-processing-deps.zip"
+}
+
+module "analytics_layer" {
+  source = "./modules/layer"
+  name   = "${var.prefix}-analytics-deps"
+
+  filename       = abspath("${path.root}/../build/layers/analytics.zip")
+  create_bucket  = false
+  s3_bucket_name = module.ingestion_layer.s3_bucket
+  s3_key = "layers/${var.prefix}-analytics-deps.zip"
 }
 
 # Placeholder: create Lambda resources by using module or additional resources
@@ -71,8 +94,8 @@ module "ingestion_lambda" {
 
   # Give the function access to put objects into the raw-data bucket
   attach_bucket_arns = [aws_s3_bucket.raw_data.arn]
-  # Attach the created layer
-  layers = module.db_layer.layer_arn != "" ? [module.db_layer.layer_arn] : []
+  # Attach the pruned layer
+  layers = module.ingestion_layer.layer_arn != "" ? [module.ingestion_layer.layer_arn] : []
 
   # Wire S3 notifications for objects created in other buckets to trigger this function
   source_bucket = aws_s3_bucket.raw_data.id
@@ -85,6 +108,8 @@ module "ingestion_lambda" {
     DB_S3_KEY    = "db/chinook.db"
     RAW_BUCKET   = aws_s3_bucket.raw_data.bucket
     INGEST_QUERY = "SELECT Track.TrackId AS TrackId, Track.Name AS Name, Album.Title AS Title, Track.Composer AS Composer, Track.Milliseconds AS Milliseconds, Track.UnitPrice AS UnitPrice FROM Track JOIN Album ON Track.AlbumId = Album.AlbumId LIMIT 500"
+    # Skip the upload when the extract hashes the same as the previous run
+    CHANGE_DETECTION = "true"
   }
 }
 
@@ -97,9 +122,9 @@ module "processing_lambda" {
   handler = "handler.lambda_handler"
   runtime = "python3.11"
 
-  # Will need access to raw and processed buckets during processing
-  attach_bucket_arns = [aws_s3_bucket.raw_data.arn, aws_s3_bucket.processed_data.arn]
-  layers = module.db_layer.layer_arn != "" ? [module.db_layer.layer_arn] : []
+  # Reads raw objects, writes processed payloads and per-file analytics summaries
+  attach_bucket_arns = [aws_s3_bucket.raw_data.arn, aws_s3_bucket.processed_data.arn, aws_s3_bucket.analytics_data.arn]
+  layers = module.processing_layer.layer_arn != "" ? [module.processing_layer.layer_arn] : []
 
   # Trigger on new raw objects
   source_bucket = aws_s3_bucket.raw_data.id
@@ -113,6 +138,8 @@ module "processing_lambda" {
     RAW_BUCKET = aws_s3_bucket.raw_data.bucket
     PROCESSED_BUCKET = aws_s3_bucket.processed_data.bucket
     ANALYTICS_BUCKET = aws_s3_bucket.analytics_data.bucket
+    PROCESSING_CONCURRENCY = "8"
+    CHANGE_DETECTION = "true"
   }
 }
 
@@ -126,7 +153,7 @@ module "analytics_lambda" {
   runtime = "python3.11"
 
   attach_bucket_arns = [aws_s3_bucket.processed_data.arn, aws_s3_bucket.analytics_data.arn]
-  layers = module.db_layer.layer_arn != "" ? [module.db_layer.layer_arn] : []
+  layers = module.analytics_layer.layer_arn != "" ? [module.analytics_layer.layer_arn] : []
 
   # Trigger on new processed objects
   source_bucket = aws_s3_bucket.processed_data.id
@@ -137,10 +164,56 @@ module "analytics_lambda" {
   invoke_principal   = "events.amazonaws.com"
   invoke_source_arn  = aws_cloudwatch_event_rule.processed_to_analytics.arn
   environment = {
+    PROCESSED_BUCKET = aws_s3_bucket.processed_data.bucket
     ANALYTICS_BUCKET = aws_s3_bucket.analytics_data.bucket
   }
 }
 
+module "compaction_lambda" {
+  source = "./modules/lambda"
+  name   = "${var.prefix}-compaction"
+  filename     = abspath("${path.root}/../build/compaction_function.zip")
+  use_filename = true
+
+  handler = "handler.lambda_handler"
+  runtime = "python3.11"
+  timeout     = 900
+  memory_size = 1024
+
+  # Rewrites small raw/ and processed/ objects into compacted/ and deletes the originals
+  attach_bucket_arns = [aws_s3_bucket.raw_data.arn, aws_s3_bucket.processed_data.arn]
+  # Only compaction removes objects
+  extra_s3_actions = ["s3:DeleteObject"]
+
+  # Runs on a schedule rather than on object events
+  invoke_principal  = "events.amazonaws.com"
+  invoke_source_arn = aws_cloudwatch_event_rule.compaction_schedule.arn
+  environment = {
+    RAW_BUCKET       = aws_s3_bucket.raw_data.bucket
+    PROCESSED_BUCKET = aws_s3_bucket.processed_data.bucket
+  }
+}
+
+# Without these, compaction fails after writing the merged object and leaves duplicates behind
+check "compaction_s3_permissions" {
+  assert {
+    condition = alltrue([
+      for action in ["s3:DeleteObject", "s3:AbortMultipartUpload"] : contains(module.compaction_lambda.s3_actions, action)
+    ])
+    error_message = "The compaction Lambda role must be allowed s3:DeleteObject and s3:AbortMultipartUpload."
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "compaction_schedule" {
+  name                = "${var.prefix}-compaction"
+  schedule_expression = "rate(1 hour)"
+}
+
+resource "aws_cloudwatch_event_target" "to_compaction" {
+  rule = aws_cloudwatch_event_rule.compaction_schedule.name
+  arn  = module.compaction_lambda.lambda_arn
+}
+
 # EventBridge rules to route S3 object-created events into the two lambdas.
 resource "aws_cloudwatch_event_rule" "raw_to_processing" {
   name = "${var.prefix}-raw-to-processing"
@@ -21,6 +21,14 @@ resource "aws_iam_role" "this" {
   })
 }
 
+# Every S3 writer streams through multipart uploads and aborts them on failure
+locals {
+  s3_actions = distinct(concat(
+    ["s3:PutObject", "s3:GetObject", "s3:ListBucket", "s3:AbortMultipartUpload"],
+    var.extra_s3_actions
+  ))
+}
+
 # Basic policy for CloudWatch Logs and S3 access (scaffold)
 data "aws_iam_policy_document" "this" {
   statement {
@@ -35,7 +43,7 @@ data "aws_iam_policy_document" "this" {
   dynamic "statement" {
     for_each = var.attach_bucket_arns
     content {
-      actions   = ["s3:PutObject", "s3:GetObject", "s3:ListBucket"]
+      actions   = local.s3_actions
       # Allow access to the bucket itself and all objects under it
       resources = [statement.value, "${statement.value}/*"]
     }
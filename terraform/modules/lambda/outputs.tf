@@ -9,3 +9,8 @@ output "lambda_name" {
 output "role_arn" {
   value = aws_iam_role.this.arn
 }
+
+output "s3_actions" {
+  description = "S3 actions the function's role is granted on attach_bucket_arns"
+  value       = local.s3_actions
+}
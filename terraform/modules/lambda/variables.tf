@@ -72,6 +72,17 @@ variable "attach_bucket_arns" {
   default = []
 }
 
+variable "extra_s3_actions" {
+  description = "S3 actions granted on attach_bucket_arns in addition to Get/Put/List/AbortMultipartUpload, e.g. s3:DeleteObject"
+  type        = list(string)
+  default     = []
+
+  validation {
+    condition     = alltrue([for a in var.extra_s3_actions : startswith(a, "s3:")])
+    error_message = "extra_s3_actions may only contain s3: actions."
+  }
+}
+
 variable "invoke_principal" {
   type    = string
   default = "s3.amazonaws.com"
@@ -0,0 +1,128 @@
+import hashlib
+import importlib.util
+import io
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+DB_PATH = os.path.join(ROOT, 'data/chinook.db')
+
+
+def load_lambda_module(lambda_dir, module='handler'):
+    """Import ``src/<lambda_dir>/<module>.py`` under a unique name.
+
+    Every Lambda ships a top-level ``handler.py``, so they cannot all be
+    imported as ``handler``. The Lambda directory is put on sys.path so the
+    handler's sibling imports resolve the same way they do in the deployed zip.
+    """
+    src_dir = os.path.join(ROOT, 'src', lambda_dir)
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    name = f'{lambda_dir}_{module}'
+    spec = importlib.util.spec_from_file_location(name, os.path.join(src_dir, f'{module}.py'))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+class FakeClientError(Exception):
+    """Mimics botocore's ClientError: the error code lives in ``response['Error']['Code']``."""
+
+    def __init__(self, code, operation):
+        super().__init__(f'An error occurred ({code}) when calling the {operation} operation')
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3:
+    """In-memory stand-in for the subset of the boto3 S3 client the handlers use."""
+
+    def __init__(self):
+        self.objects = {}
+        # (bucket, key) -> ContentType / Metadata given to put_object
+        self.headers = {}
+        self.calls = []
+        self._uploads = {}
+
+    @staticmethod
+    def _etag(body):
+        return f'"{hashlib.md5(body).hexdigest()}"'
+
+    def put_object(self, Bucket, Key, Body=b'', IfMatch=None, IfNoneMatch=None, ContentType=None, Metadata=None, **kwargs):
+        self.calls.append('put_object')
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        current = self.objects.get((Bucket, Key))
+        if IfNoneMatch == '*' and current is not None:
+            raise FakeClientError('PreconditionFailed', 'PutObject')
+        if IfMatch is not None and (current is None or self._etag(current) != IfMatch):
+            raise FakeClientError('PreconditionFailed', 'PutObject')
+        self.objects[(Bucket, Key)] = bytes(Body)
+        self.headers[(Bucket, Key)] = {'ContentType': ContentType, 'Metadata': Metadata or {}}
+        return {'ETag': self._etag(bytes(Body))}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        self.calls.append('get_object')
+        if (Bucket, Key) not in self.objects:
+            raise FakeClientError('NoSuchKey', 'GetObject')
+        body = self.objects[(Bucket, Key)]
+        etag = self._etag(body)
+        if IfMatch is not None and IfMatch != etag:
+            raise FakeClientError('PreconditionFailed', 'GetObject')
+        if Range:
+            start, _, end = Range[len('bytes='):].partition('-')
+            body = body[int(start):int(end) + 1 if end else None]
+        resp = {'Body': io.BytesIO(body), 'ETag': etag, 'ContentLength': len(body)}
+        resp.update(self.headers.get((Bucket, Key), {}))
+        return resp
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.calls.append('head_object')
+        if (Bucket, Key) not in self.objects:
+            raise FakeClientError('404', 'HeadObject')
+        body = self.objects[(Bucket, Key)]
+        return {'ETag': self._etag(body), 'ContentLength': len(body)}
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None, **kwargs):
+        self.calls.append('list_objects_v2')
+        keys = sorted(k for b, k in self.objects if b == Bucket and k.startswith(Prefix))
+        return {
+            'Contents': [{'Key': k, 'Size': len(self.objects[(Bucket, k)])} for k in keys],
+            'IsTruncated': False
+        }
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.calls.append('delete_object')
+        self.objects.pop((Bucket, Key), None)
+        self.headers.pop((Bucket, Key), None)
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, Metadata=None, **kwargs):
+        self.calls.append('create_multipart_upload')
+        upload_id = f'upload-{len(self._uploads) + 1}'
+        self._uploads[upload_id] = {}
+        self.headers[(Bucket, Key)] = {'ContentType': ContentType, 'Metadata': Metadata or {}}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append('upload_part')
+        self._uploads[UploadId][PartNumber] = bytes(Body)
+        return {'ETag': f'"{UploadId}-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append('complete_multipart_upload')
+        parts = self._uploads.pop(UploadId)
+        numbers = [p['PartNumber'] for p in MultipartUpload['Parts']]
+        self.objects[(Bucket, Key)] = b''.join(parts[n] for n in numbers)
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append('abort_multipart_upload')
+        self._uploads.pop(UploadId, None)
+        return {}
+
+
+@pytest.fixture
+def fake_s3():
+    return FakeS3()
@@ -0,0 +1,122 @@
+import json
+import random
+import threading
+
+import pytest
+
+from conftest import load_lambda_module
+
+
+@pytest.fixture(scope='module')
+def modules():
+    load_lambda_module('analytics_lambda')
+    import aggregates
+    import sketches
+    return aggregates, sketches
+
+
+def _rows(start, stop, seed=0):
+    rnd = random.Random(seed)
+    return [
+        {
+            'track_id': i,
+            'album_title': f'album{i % 7}',
+            'composer': None if i % 5 == 0 else f'composer{i % 11}',
+            'milliseconds': rnd.randint(0, 600000),
+            'unit_price': 0.99 if i % 2 else 1.99
+        }
+        for i in range(start, stop)
+    ]
+
+
+def test_hyperloglog_and_quantile_accuracy(modules):
+    _, sketches = modules
+    hll = sketches.HyperLogLog()
+    for i in range(50000):
+        hll.add(f'track-{i}')
+    assert abs(hll.estimate() - 50000) / 50000 < 0.05
+
+    values = sorted(random.Random(1).expovariate(1 / 250000) for _ in range(20000))
+    q = sketches.QuantileSketch(relative_accuracy=0.01)
+    for v in values:
+        q.add(v)
+    for quantile in (0.5, 0.9, 0.99):
+        exact = values[int(quantile * (len(values) - 1))]
+        assert abs(q.quantile(quantile) - exact) / exact < 0.02
+
+
+def test_merge_of_partials_equals_aggregate_of_all_rows(modules):
+    aggregates, _ = modules
+    a = aggregates.build_partial(_rows(0, 500), 'a')
+    b = aggregates.build_partial(_rows(500, 1200, seed=1), 'b')
+    whole = aggregates.build_partial(_rows(0, 500) + _rows(500, 1200, seed=1), 'all')
+
+    merged = aggregates.merge_all([b, a])
+    assert merged.row_count == whole.row_count == 1200
+    assert merged.duration_ms_total == whole.duration_ms_total
+    for name, groups in whole.groups.items():
+        for key, g in groups.items():
+            m = merged.groups[name][key]
+            assert (m['count'], m['milliseconds']) == (g['count'], g['milliseconds'])
+            assert m['unit_price'] == pytest.approx(g['unit_price'])
+    assert merged.distinct['track_id'].registers == whole.distinct['track_id'].registers
+    assert merged.quantiles['milliseconds'].buckets == whole.quantiles['milliseconds'].buckets
+    assert merged.summary()['distinct']['album'] == 7
+
+
+def test_serialization_round_trip_and_idempotent_merge(modules):
+    aggregates, _ = modules
+    a = aggregates.build_partial(_rows(0, 100), 'a')
+    restored = aggregates.PartialAggregate.from_dict(json.loads(json.dumps(a.to_dict())))
+    rollup = aggregates.merge_all([restored])
+    rollup.merge(a)  # same source again, e.g. a retried invocation
+    assert rollup.row_count == 100
+    assert rollup.summary() == a.summary()
+
+
+def test_rollup_windows(modules):
+    aggregates, _ = modules
+    assert aggregates.rollup_windows('2025-10-28T12-15-52Z') == ('2025-10-28T12', '2025-10-28')
+
+
+def test_handler_updates_rollups_without_rescanning(monkeypatch, fake_s3):
+    handler = load_lambda_module('analytics_lambda')
+    monkeypatch.setattr(handler, 'ANALYTICS_BUCKET', 'analytics')
+    monkeypatch.setattr(handler, 'boto3_client', lambda name: fake_s3)
+    for name, rows in (('a', _rows(0, 300)), ('b', _rows(300, 500))):
+        payload = {'processed_at': 'x', 'fetched_at': '2025-10-28T12-15-52Z', 'rows': rows, 'row_count': len(rows)}
+        fake_s3.put_object(Bucket='processed', Key=f'processed/2025-10-28T12-15-52Z/{name}.json', Body=json.dumps(payload))
+
+    event = lambda name: {'Records': [{'s3': {'bucket': {'name': 'processed'}, 'object': {'key': f'processed/2025-10-28T12-15-52Z/{name}.json'}}}]}
+    assert handler.lambda_handler(event('a'), None)['status'] == 'ok'
+    fake_s3.calls.clear()
+    res = handler.lambda_handler(event('b'), None)
+    assert res['results'][0]['hourly_rows'] == 500
+    # Only the new file is read; rollups are updated from their stored state
+    assert fake_s3.calls.count('get_object') == 3
+    handler.lambda_handler(event('b'), None)
+
+    hourly = json.loads(fake_s3.objects[('analytics', 'analytics/rollups/hourly/2025-10-28T12.json')])
+    daily = json.loads(fake_s3.objects[('analytics', 'analytics/rollups/daily/2025-10-28.json')])
+    assert hourly['row_count'] == daily['row_count'] == 500
+    assert hourly['summary']['distinct']['album'] == 7
+    assert ('analytics', 'analytics/partials/2025-10-28T12-15-52Z/b.json') in fake_s3.objects
+
+
+def test_update_json_serializes_concurrent_writers(tmp_path):
+    load_lambda_module('analytics_lambda')
+    from object_store import LocalObjectStore, update_json
+
+    store = LocalObjectStore(str(tmp_path))
+
+    def bump(doc):
+        doc = doc or {'n': 0}
+        doc['n'] += 1
+        return doc
+
+    threads = [threading.Thread(target=lambda: [update_json(store, 'analytics/counter.json', bump, retries=100) for _ in range(10)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert json.loads(store.get('analytics/counter.json')[0]) == {'n': 40}
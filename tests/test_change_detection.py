@@ -0,0 +1,161 @@
+import json
+import shutil
+import sqlite3
+
+import pytest
+
+from conftest import DB_PATH, load_lambda_module
+
+QUERY = "SELECT TrackId, Name, UnitPrice FROM Track ORDER BY TrackId"
+
+
+def _event(*keys, bucket='raw'):
+    return {'Records': [{'s3': {'bucket': {'name': bucket}, 'object': {'key': k}}} for k in keys]}
+
+
+def _raw_keys(fake_s3):
+    return sorted(k for b, k in fake_s3.objects if b == 'raw' and k.startswith('raw/'))
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'chinook.db')
+    shutil.copyfile(DB_PATH, path)
+    return path
+
+
+@pytest.fixture
+def ingestion(monkeypatch, tmp_path, fake_s3, db_path):
+    handler = load_lambda_module('ingestion_lambda')
+    monkeypatch.setattr(handler, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(handler, 'DB_PATH', db_path)
+    monkeypatch.setattr(handler, 'RAW_BUCKET', 'raw')
+    monkeypatch.setattr(handler, 'CHANGE_DETECTION', True)
+    monkeypatch.setattr(handler, 'boto3_client', lambda name: fake_s3)
+    monkeypatch.setenv('INGEST_QUERY', QUERY)
+    return handler
+
+
+@pytest.fixture
+def processing(monkeypatch, fake_s3):
+    handler = load_lambda_module('processing_lambda')
+    monkeypatch.setattr(handler, 'PROCESSED_BUCKET', 'processed')
+    monkeypatch.setattr(handler, 'ANALYTICS_BUCKET', 'analytics')
+    monkeypatch.setattr(handler, 'CHANGE_DETECTION', True)
+    monkeypatch.setattr(handler, 'boto3_client', lambda name: fake_s3)
+    return handler
+
+
+@pytest.mark.parametrize('mode', ['batch', 'stream'])
+def test_unchanged_extract_is_not_uploaded(ingestion, monkeypatch, fake_s3, db_path, mode):
+    monkeypatch.setattr(ingestion, 'INGEST_MODE', mode)
+
+    first = ingestion.lambda_handler({}, None)
+    assert first['status'] == 'ok'
+    assert first['digest'].startswith('sha256:')
+    assert _raw_keys(fake_s3) == [first['s3_path'].split('/', 3)[3]]
+    assert fake_s3.headers[('raw', _raw_keys(fake_s3)[0])]['Metadata']['content-digest'] == first['digest']
+
+    second = ingestion.lambda_handler({}, None)
+    assert second['status'] == 'unchanged'
+    assert second['s3_path'] is None
+    assert second['digest'] == first['digest']
+    assert second['previous_path'] == first['s3_path']
+    assert second['row_count'] == first['row_count']
+    assert len(_raw_keys(fake_s3)) == 1
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE Track SET UnitPrice = 1.29 WHERE TrackId = 7")
+    conn.commit()
+    conn.close()
+    third = ingestion.lambda_handler({}, None)
+    assert third['status'] == 'ok'
+    assert third['digest'] != first['digest']
+    assert len(_raw_keys(fake_s3)) == 2
+
+
+def test_digest_is_independent_of_mode_and_format(ingestion, monkeypatch, fake_s3):
+    digests = set()
+    for mode, payload_format in (('batch', 'json'), ('stream', 'json'), ('stream', 'columnar'), ('batch', 'columnar')):
+        monkeypatch.setattr(ingestion, 'INGEST_MODE', mode)
+        monkeypatch.setattr(ingestion, 'PAYLOAD_FORMAT', payload_format)
+        monkeypatch.setattr(ingestion, 'INGEST_CHUNK_SIZE', 97 if mode == 'stream' else 1000)
+        result = ingestion.lambda_handler({}, None)
+        digests.add(result['digest'])
+    assert len(digests) == 1
+    # Only the first run wrote an object
+    assert len(_raw_keys(fake_s3)) == 1
+
+
+def test_multipart_extract_carries_digest_and_unchanged_uploads_nothing(ingestion, monkeypatch, fake_s3):
+    import streaming
+    monkeypatch.setattr(streaming, 'MIN_PART_SIZE', 16 * 1024)
+    monkeypatch.setattr(ingestion, 'S3_PART_SIZE', 16 * 1024)
+    monkeypatch.setattr(ingestion, 'INGEST_MODE', 'stream')
+    monkeypatch.setattr(ingestion, 'INGEST_CHUNK_SIZE', 100)
+
+    first = ingestion.lambda_handler({}, None)
+    assert first['status'] == 'ok'
+    assert fake_s3.calls.count('upload_part') > 1
+    # The digest is known before CreateMultipartUpload, so the completed object carries it
+    (key,) = _raw_keys(fake_s3)
+    assert fake_s3.headers[('raw', key)]['Metadata'] == {'content-digest': first['digest']}
+
+    fake_s3.calls.clear()
+    second = ingestion.lambda_handler({}, None)
+    assert second['status'] == 'unchanged'
+    assert 'upload_part' not in fake_s3.calls and 'create_multipart_upload' not in fake_s3.calls
+    assert _raw_keys(fake_s3) == [key]
+
+
+def test_processing_skips_content_it_already_processed(ingestion, processing, monkeypatch, fake_s3):
+    monkeypatch.setattr(ingestion, 'INGEST_MODE', 'stream')
+    first = ingestion.lambda_handler({}, None)
+    key = first['s3_path'].split('/', 3)[3]
+    # Same rows again under another key: one carrying the digest, one without metadata
+    fake_s3.put_object(Bucket='raw', Key='raw/t/copy.ndjson', Body=fake_s3.objects[('raw', key)],
+                       Metadata={'content-digest': first['digest']})
+    fake_s3.put_object(Bucket='raw', Key='raw/t/bare.ndjson', Body=fake_s3.objects[('raw', key)])
+
+    res = processing.lambda_handler(_event(key), None)
+    assert res['status'] == 'ok'
+    assert res['results'][0]['digest'] == first['digest']
+
+    writes = fake_s3.calls.count('put_object')
+    res = processing.lambda_handler(_event('raw/t/copy.ndjson', 'raw/t/bare.ndjson'), None)
+    assert res['status'] == 'ok'
+    assert [r['status'] for r in res['results']] == ['skipped', 'skipped']
+    assert {r['duplicate_of'] for r in res['results']} == {f's3://raw/{key}'}
+    # Neither duplicate wrote a processed object, summary or index entry
+    assert fake_s3.calls.count('put_object') == writes
+    assert not [k for b, k in fake_s3.objects if b == 'processed' and k.startswith('processed/t/')]
+
+
+def test_untagged_duplicate_is_checked_before_any_output(ingestion, processing, monkeypatch, fake_s3):
+    import streaming
+    monkeypatch.setattr(streaming, 'MIN_PART_SIZE', 16 * 1024)
+    monkeypatch.setattr(processing, 'S3_PART_SIZE', 16 * 1024)
+    monkeypatch.setattr(ingestion, 'INGEST_MODE', 'stream')
+    first = ingestion.lambda_handler({}, None)
+    key = first['s3_path'].split('/', 3)[3]
+    fake_s3.put_object(Bucket='raw', Key='raw/t/bare.ndjson', Body=fake_s3.objects[('raw', key)])
+    res = processing.lambda_handler(_event(key), None)
+    assert res['results'][0]['status'] == 'ok'
+    # Large enough to be a multipart output, and its metadata carries no digest
+    assert 'upload_part' in fake_s3.calls
+
+    fake_s3.calls.clear()
+    res = processing.lambda_handler(_event('raw/t/bare.ndjson'), None)
+    assert res['results'][0]['status'] == 'skipped'
+    assert not {'put_object', 'create_multipart_upload', 'upload_part', 'abort_multipart_upload'} & set(fake_s3.calls)
+
+
+def test_processing_without_change_detection_reprocesses(processing, monkeypatch, fake_s3):
+    monkeypatch.setattr(processing, 'CHANGE_DETECTION', False)
+    body = json.dumps({'fetched_at': '2025-10-28T12-00-00Z', 'rows': [{'TrackId': 1, 'Name': 'a', 'Title': 'x'}]})
+    fake_s3.put_object(Bucket='raw', Key='raw/t/a.json', Body=body)
+    fake_s3.put_object(Bucket='raw', Key='raw/t/b.json', Body=body)
+
+    res = processing.lambda_handler(_event('raw/t/a.json', 'raw/t/b.json'), None)
+    assert [r['status'] for r in res['results']] == ['ok', 'ok']
+    assert not [k for b, k in fake_s3.objects if k.startswith('_state/')]
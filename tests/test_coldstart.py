@@ -0,0 +1,111 @@
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+import coldstart
+
+
+def _write(path, text=''):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+@pytest.fixture
+def layer(tmp_path):
+    """A small stand-in for build/layer/python with a boto3-like package and a DB driver."""
+    root = tmp_path / 'layer' / 'python'
+    _write(root / 'boto3' / '__init__.py', 'from boto3 import session\n')
+    _write(root / 'boto3' / 'session.py', (
+        'import os, json\n'
+        'class Session:\n'
+        '    def client(self, name):\n'
+        "        with open(os.path.join(os.path.dirname(__file__), 'data', name, 'service.json')) as f:\n"
+        '            return json.load(f)\n'
+    ))
+    _write(root / 'boto3' / 'unused.py', 'raise ImportError\n')
+    _write(root / 'boto3' / 'data' / 's3' / 'service.json', '{}')
+    _write(root / 'boto3' / 'data' / 's3' / 'paginators.json', '{}')
+    _write(root / 'boto3' / 'data' / 'ec2' / 'service.json', '{}')
+    _write(root / 'boto3' / 'tests' / 'test_session.py')
+    _write(root / 'boto3-1.0.dist-info' / 'RECORD', 'boto3/__init__.py,,\nboto3-1.0.dist-info/RECORD,,\n')
+    _write(root / 'fakedb' / '__init__.py')
+    _write(root / 'fakedb' / 'tests' / 'test_db.py')
+    _write(root / 'fakedb.libs' / 'libpq.so.5', 'elf')
+    _write(root / 'fakedb-2.0.dist-info' / 'RECORD', 'fakedb/__init__.py,,\n')
+    return root
+
+
+def test_parse_importtime():
+    text = (
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       120 |        120 |     _json\n'
+        'import time:       300 |        420 |   json\n'
+        'import time:      1000 |       1420 | handler\n'
+    )
+    rows = coldstart.parse_importtime(text)
+    assert [(r['name'], r['depth']) for r in rows] == [('_json', 2), ('json', 1), ('handler', 0)]
+    assert rows[-1]['cumulative_us'] == 1420
+
+
+@pytest.mark.parametrize('lambda_dir', ['processing_lambda', 'analytics_lambda'])
+def test_processing_and_analytics_do_not_load_db_drivers(lambda_dir):
+    report = coldstart.profile(lambda_dir)
+    names = {row['name'] for row in report['modules']}
+    assert 'handler' in names and 'metrics' in names
+    assert not names & {'sqlite3', 'psycopg2', 'sqlalchemy', 'concurrent.futures'}
+    assert report['by_origin_ms']['function'] > 0
+
+
+def test_ingestion_defers_sqlite_until_connect():
+    names = {row['name'] for row in coldstart.profile('ingestion_lambda')['modules']}
+    assert 'sqlite3' not in names
+
+
+def test_trace_and_pruned_layer(layer, tmp_path):
+    report = coldstart.profile('processing_lambda', layer=str(layer), clients=['s3'])
+    trace = report['trace']
+    assert set(trace['modules']) == {'boto3', 'boto3.session'}
+    assert trace['files'] == [os.path.join('boto3', 'data', 's3', 'service.json')]
+    assert report['by_origin_ms']['layer'] > 0
+
+    out = tmp_path / 'layers' / 'processing'
+    result = coldstart.build_layer([trace], str(layer), str(out))
+    kept = {os.path.relpath(os.path.join(d, f), out / 'python') for d, _, fs in os.walk(out / 'python') for f in fs if not f.endswith('.pyc')}
+    assert kept == {
+        os.path.join('boto3', '__init__.py'),
+        os.path.join('boto3', 'session.py'),
+        os.path.join('boto3', 'data', 's3', 'service.json'),
+        os.path.join('boto3', 'data', 's3', 'paginators.json'),
+        os.path.join('boto3-1.0.dist-info', 'RECORD')
+    }
+    assert result['removed'] == ['fakedb']
+    assert result['packages']['fakedb'] == {'before': result['packages']['fakedb']['before'], 'after': 0}
+    assert os.path.isfile(result['zip'])
+    assert any(f.endswith('.pyc') for _, _, fs in os.walk(out / 'python') for f in fs)
+
+    # A driver only reached with another configuration is kept whole on request, tests excluded
+    required = coldstart.select_layer_files(str(layer), [trace], require=['fakedb'])
+    assert os.path.join('fakedb', '__init__.py') in required
+    assert os.path.join('fakedb.libs', 'libpq.so.5') in required
+    assert os.path.join('fakedb', 'tests', 'test_db.py') not in required
+
+
+def test_relative_layer_path(layer, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    report = coldstart.profile('processing_lambda', layer=os.path.join('layer', 'python'), clients=['s3'])
+    assert set(report['trace']['modules']) == {'boto3', 'boto3.session'}
+    assert report['by_origin_ms']['layer'] > 0
+
+
+def test_bench_compares_before_and_after(layer, tmp_path):
+    trace = coldstart.profile('analytics_lambda', layer=str(layer), clients=['s3'])['trace']
+    coldstart.build_layer([trace], str(layer), str(tmp_path / 'layers' / 'analytics'), compile=False, make_zip=False)
+    (result,) = coldstart.bench(['analytics_lambda'], runs=2, layer=str(layer), pruned_layers=str(tmp_path / 'layers'), clients=['s3'])
+    assert result['function'] == 'analytics'
+    assert result['after']['layer_bytes'] < result['before']['layer_bytes']
+    assert result['before']['init_p50_ms'] > 0 and result['after']['init_p50_ms'] > 0
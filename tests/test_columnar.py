@@ -0,0 +1,122 @@
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from conftest import DB_PATH, load_lambda_module
+
+QUERY = (
+    "SELECT Track.TrackId AS TrackId, Track.Name AS Name, Album.Title AS Title, Track.Composer AS Composer, "
+    "Track.Milliseconds AS Milliseconds, Track.UnitPrice AS UnitPrice "
+    "FROM Track JOIN Album ON Track.AlbumId = Album.AlbumId ORDER BY Track.TrackId"
+)
+
+
+@pytest.fixture(scope='module')
+def columnar():
+    load_lambda_module('processing_lambda')
+    import columnar
+    return columnar
+
+
+class _Stream(io.RawIOBase):
+    """Non-seekable body, like a boto3 StreamingBody."""
+
+    def __init__(self, data):
+        self._buf = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        return self._buf.read(n)
+
+
+def test_round_trip_of_every_encoding(columnar):
+    rows = [
+        {'id': i, 'price': Decimal('0.99') if i % 2 else Decimal('1.5'), 'ratio': i / 7, 'flag': i % 3 == 0,
+         'album': f'album{i % 4}', 'name': f'track {i}', 'composer': None if i % 5 else 'Bach',
+         'at': datetime(2025, 10, 28, 12, i % 60), 'tags': [i, 'x'] if i % 2 else {'k': i}}
+        for i in range(1000)
+    ]
+    rows[3]['id'] = None
+    rows[7]['ratio'] = None
+    rows[9]['flag'] = None
+    rows[999]['late'] = 'only here'
+    payload = {'fetched_at': '2025-10-28T12-00-00Z', 'rows': rows}
+
+    data = columnar.encode_columnar(payload, block_rows=256)
+    decoded = columnar.decode_columnar(data)
+    expected = json.loads(json.dumps(rows, default=str))
+    assert decoded['row_count'] == 1000
+    assert decoded['fetched_at'] == '2025-10-28T12-00-00Z'
+    assert [r['id'] for r in decoded['rows']] == [r['id'] for r in rows]
+    assert [r['price'] for r in decoded['rows']] == [r['price'] for r in rows]
+    assert decoded['rows'][999]['late'] == 'only here'
+    # Everything else matches what the JSON envelope would have carried
+    for got, want in zip(decoded['rows'], expected):
+        got.pop('price'), want.pop('price')
+        # A column missing from some rows of a block decodes as null in those rows
+        assert {k: v for k, v in got.items() if k in want or v is not None} == want
+    assert len(data) < len(json.dumps(payload, default=str)) / 4
+
+
+def test_reader_decodes_only_requested_columns(columnar):
+    rows = [{'a': i, 'b': f'v{i}', 'c': i * 0.5} for i in range(5000)]
+    data = columnar.encode_columnar({'rows': rows}, block_rows=1000)
+    reader = columnar.ColumnarReader(_Stream(data), columns={'c'})
+    assert list(reader) == [{'c': r['c']} for r in rows]
+    assert reader.meta['row_count'] == 5000
+
+
+@pytest.mark.parametrize('key, content_type, metadata', [
+    ('raw/t/x.colz', None, None),
+    ('raw/t/x.bin', 'application/x-pipeline-columnar', None),
+    ('raw/t/x.bin', None, {'payload-format': 'columnar'}),
+])
+def test_payload_reader_negotiates_format(columnar, key, content_type, metadata):
+    from json_stream import PayloadReader
+    data = columnar.encode_columnar({'fetched_at': 'T', 'rows': [{'TrackId': 1}, {'TrackId': 2}]})
+    reader = PayloadReader(io.BytesIO(data), key=key, content_type=content_type, metadata=metadata)
+    assert list(reader) == [{'TrackId': 1}, {'TrackId': 2}]
+    assert reader.format == 'columnar'
+    assert reader.meta['fetched_at'] == 'T'
+
+
+def test_columnar_pipeline_end_to_end(monkeypatch, tmp_path, fake_s3):
+    ingestion = load_lambda_module('ingestion_lambda')
+    monkeypatch.setattr(ingestion, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(ingestion, 'DB_PATH', DB_PATH)
+    monkeypatch.setattr(ingestion, 'RAW_BUCKET', 'raw')
+    monkeypatch.setattr(ingestion, 'PAYLOAD_FORMAT', 'columnar')
+    monkeypatch.setattr(ingestion, 'boto3_client', lambda name: fake_s3)
+    monkeypatch.setenv('INGEST_QUERY', QUERY)
+    res = ingestion.lambda_handler({}, None)
+    raw_key = res['s3_path'][len('s3://raw/'):]
+    assert raw_key.endswith('.colz')
+    assert fake_s3.headers[('raw', raw_key)]['Metadata'] == {'payload-format': 'columnar'}
+
+    processing = load_lambda_module('processing_lambda')
+    monkeypatch.setattr(processing, 'PROCESSED_BUCKET', 'processed')
+    monkeypatch.setattr(processing, 'ANALYTICS_BUCKET', 'analytics')
+    monkeypatch.setattr(processing, 'PAYLOAD_FORMAT', 'columnar')
+    monkeypatch.setattr(processing, 'boto3_client', lambda name: fake_s3)
+    event = {'Records': [{'s3': {'bucket': {'name': 'raw'}, 'object': {'key': raw_key}}}]}
+    out = processing.lambda_handler(event, None)['results'][0]
+    assert out['rows'] == res['row_count']
+    processed_key = out['processed_path'][len('s3://processed/'):]
+    assert processed_key.endswith('.colz')
+
+    import columnar
+    payload = columnar.decode_columnar(fake_s3.objects[('processed', processed_key)])
+    assert payload['fetched_at'] == raw_key.split('/')[1]
+    assert payload['rows'][0]['track_id'] == 1
+    assert isinstance(payload['rows'][0]['unit_price'], float)
+
+    analytics = load_lambda_module('analytics_lambda')
+    monkeypatch.setattr(analytics, 'ANALYTICS_BUCKET', 'analytics')
+    monkeypatch.setattr(analytics, 'boto3_client', lambda name: fake_s3)
+    event = {'Records': [{'s3': {'bucket': {'name': 'processed'}, 'object': {'key': processed_key}}}]}
+    assert analytics.lambda_handler(event, None)['results'][0]['rows'] == res['row_count']
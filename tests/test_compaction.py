@@ -0,0 +1,182 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+
+from conftest import load_lambda_module
+
+
+@pytest.fixture
+def handler(monkeypatch, tmp_path):
+    mod = load_lambda_module('compaction_lambda')
+    monkeypatch.setenv('LOCAL_UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(mod, 'RAW_BUCKET', '')
+    monkeypatch.setattr(mod, 'PROCESSED_BUCKET', '')
+    return mod
+
+
+def _write_raw(tmp_path, stamp, name, rows):
+    payload = {'fetched_at': stamp, 'row_count': len(rows), 'rows': rows}
+    (tmp_path / f'raw_{stamp}_{name}.json').write_text(json.dumps(payload))
+
+
+def _seed(tmp_path):
+    _write_raw(tmp_path, '2025-10-28T12-15-52Z', 'a', [{'TrackId': i} for i in range(0, 3)])
+    _write_raw(tmp_path, '2025-10-28T12-40-01Z', 'b', [{'TrackId': i} for i in range(3, 5)])
+    (tmp_path / 'raw_2025-10-28T12-50-00Z_c.ndjson').write_text('{"TrackId": 5}\n{"TrackId": 6}\n')
+    _write_raw(tmp_path, '2025-10-28T13-05-00Z', 'd', [{'TrackId': 7}])
+    (tmp_path / 'raw_2025-10-28T12-50-00Z_run__manifest.json').write_text('{}')
+
+
+def test_compacts_partition_into_gzip_ndjson_with_manifest(handler, tmp_path):
+    import compaction
+    from object_store import LocalObjectStore
+    _seed(tmp_path)
+
+    res = handler.lambda_handler({'prefixes': ['raw/']}, None)
+    by_partition = {r['partition']: r for r in res['results']}
+    assert by_partition['2025-10-28T12']['status'] == 'compacted'
+    assert by_partition['2025-10-28T12']['rows'] == 7
+    # A single small file is not worth rewriting
+    assert by_partition['2025-10-28T13']['status'] == 'skipped'
+
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert not any(n.startswith('raw_2025-10-28T12') and not n.endswith('_manifest.json') for n in names)
+    parts = [n for n in names if n.endswith('.ndjson.gz')]
+    assert len(parts) == 1
+    lines = gzip.decompress((tmp_path / parts[0]).read_bytes()).decode().splitlines()
+    assert sorted(json.loads(line)['TrackId'] for line in lines) == list(range(7))
+
+    store = LocalObjectStore(str(tmp_path))
+    manifest = compaction.load_manifest(store, 'raw/', '2025-10-28T12')
+    assert len(manifest['objects'][0]['sources']) == 3
+    rows = list(compaction.iter_partition_rows(store, 'raw/', '2025-10-28T12'))
+    assert sorted(r['TrackId'] for r in rows) == list(range(7))
+
+    # Re-running finds nothing left to do
+    again = handler.lambda_handler({'prefixes': ['raw/'], 'partitions': ['2025-10-28T12']}, None)
+    assert again['results'] == []
+
+
+def test_rerun_finishes_cleanup_after_crash_past_commit(handler, tmp_path):
+    import compaction
+    from object_store import LocalObjectStore
+    _seed(tmp_path)
+    leftover = tmp_path / 'raw_2025-10-28T12-15-52Z_a.json'
+    body = leftover.read_bytes()
+    handler.lambda_handler({'prefixes': ['raw/']}, None)
+
+    # Simulate a run that committed its manifest but died before deleting sources
+    leftover.write_bytes(body)
+    store = LocalObjectStore(str(tmp_path))
+    assert len(list(compaction.iter_partition_rows(store, 'raw/', '2025-10-28T12'))) == 7
+
+    res = handler.lambda_handler({'prefixes': ['raw/'], 'partitions': ['2025-10-28T12']}, None)
+    assert res['results'][0]['cleaned'] == 1
+    assert not leftover.exists()
+    assert len(compaction.load_manifest(store, 'raw/', '2025-10-28T12')['objects']) == 1
+
+
+def test_failure_before_commit_leaves_sources_untouched(handler, tmp_path, monkeypatch):
+    import compaction
+    _seed(tmp_path)
+    before = sorted(p.name for p in tmp_path.iterdir())
+
+    def boom(*args, **kwargs):
+        raise RuntimeError('manifest write failed')
+    monkeypatch.setattr(compaction, 'update_json', boom)
+
+    res = handler.lambda_handler({'prefixes': ['raw/'], 'partitions': ['2025-10-28T12']}, None)
+    assert res['status'] == 'error'
+    assert sorted(p.name for p in tmp_path.iterdir() if not p.name.startswith('.')) == before
+
+
+def test_rolls_over_at_target_size_on_s3(handler, fake_s3, monkeypatch):
+    import compaction
+    from object_store import S3ObjectStore
+    for i in range(3):
+        rows = [{'TrackId': i * 100 + j, 'Name': f'track {j}'} for j in range(100)]
+        fake_s3.put_object(Bucket='proc', Key=f'processed/2025-10-28T12-0{i}-00Z/{i}.json', Body=json.dumps({'rows': rows}))
+    store = S3ObjectStore(fake_s3, 'proc')
+    groups = compaction.group_partitions(store.list('processed/'), 'processed/')
+
+    res = compaction.compact_partition(store, 'processed/', '2025-10-28T12', groups[('2025-10-28T12', None)], target_bytes=1, small_bytes=1 << 20)
+    assert res['status'] == 'compacted'
+    assert len(res['outputs']) == 3
+    assert sorted(k for _, k in fake_s3.objects if k.startswith('processed/')) == []
+    rows = list(compaction.iter_partition_rows(store, 'processed/', '2025-10-28T12'))
+    assert len(rows) == 300
+
+
+def test_open_partition_is_left_alone(handler, tmp_path):
+    _seed(tmp_path)
+    results = handler.compact_prefix(
+        handler.open_store(None, ''), 'raw/', now=datetime(2025, 10, 28, 12, 30)
+    )
+    assert [r['status'] for r in results] == ['open', 'open']
+
+
+def test_partitioned_ingestion_runs_are_not_compacted(handler, tmp_path):
+    import compaction
+    _seed(tmp_path)
+    run = 'raw_2025-10-28T12-20-00Z_5f0c'
+    parts = [f'{run}_part-{i:05d}.ndjson' for i in range(2)]
+    for i, name in enumerate(parts):
+        (tmp_path / name).write_text(f'{{"TrackId": {100 + i}}}\n')
+    manifest = {'partitions': [{'s3_path': str(tmp_path / name)} for name in parts]}
+    (tmp_path / f'{run}__manifest.json').write_text(json.dumps(manifest))
+    # A run still in flight has parts but no manifest yet
+    (tmp_path / 'raw_2025-10-28T12-30-00Z_9a1b_part-00000.ndjson').write_text('{"TrackId": 200}\n')
+
+    res = handler.lambda_handler({'prefixes': ['raw/'], 'partitions': ['2025-10-28T12']}, None)
+    assert res['results'][0]['status'] == 'compacted'
+    assert res['results'][0]['rows'] == 7
+    # The run manifest still points at objects that exist
+    for entry in json.loads((tmp_path / f'{run}__manifest.json').read_text())['partitions']:
+        assert open(entry['s3_path']).read()
+    assert (tmp_path / 'raw_2025-10-28T12-30-00Z_9a1b_part-00000.ndjson').exists()
+
+    listing = [('raw/2025-10-28T12-20-00Z/5f0c/part-00000.ndjson', 10), ('raw/2025-10-28T12-20-00Z/5f0c/_manifest.json', 10),
+               ('raw/2025-10-28T12-20-00Z/a.json', 10)]
+    assert compaction.group_partitions(listing, 'raw/') == {('2025-10-28T12', None): [('raw/2025-10-28T12-20-00Z/a.json', 10)]}
+
+
+def test_tables_are_compacted_separately(handler, tmp_path):
+    import compaction
+    from object_store import LocalObjectStore
+    for table, rows in (('genre', [{'GenreId': 1}, {'GenreId': 2}]), ('media-type', [{'MediaTypeId': 1}, {'MediaTypeId': 2}])):
+        for i, row in enumerate(rows):
+            (tmp_path / f'raw_2025-10-28T12-0{i}-00Z_{table}_{i}.ndjson').write_text(json.dumps(row) + '\n')
+
+    res = handler.lambda_handler({'prefixes': ['raw/'], 'partitions': ['2025-10-28T12']}, None)
+    assert [(r['table'], r['status'], r['rows']) for r in res['results']] == [('genre', 'compacted', 2), ('media-type', 'compacted', 2)]
+
+    store = LocalObjectStore(str(tmp_path))
+    for table, column in (('genre', 'GenreId'), ('media-type', 'MediaTypeId')):
+        manifest = compaction.load_manifest(store, 'raw/', '2025-10-28T12', table)
+        assert manifest['table'] == table
+        (obj,) = manifest['objects']
+        assert obj['key'].startswith(f'compacted/raw/2025-10-28T12/{table}/part-')
+        assert all(f'_{table}_' in src for src in obj['sources'])
+        rows = list(compaction.iter_partition_rows(store, 'raw/', '2025-10-28T12', table))
+        assert sorted(r[column] for r in rows) == [1, 2] and all(list(r) == [column] for r in rows)
+    assert compaction.load_manifest(store, 'raw/', '2025-10-28T12') is None
+
+
+def test_processed_outputs_of_partitioned_runs_are_compacted(handler, fake_s3):
+    import compaction
+    from object_store import S3ObjectStore
+    run = 'processed/2025-10-28T12-20-00Z/5f0c'
+    for i in range(3):
+        fake_s3.put_object(Bucket='proc', Key=f'{run}/part-{i:05d}.json', Body=json.dumps({'rows': [{'track_id': i}]}))
+    store = S3ObjectStore(fake_s3, 'proc')
+    groups = compaction.group_partitions(store.list('processed/'), 'processed/')
+    # The run directory is not a table, and with no run manifest under processed/ nothing is held back
+    assert list(groups) == [('2025-10-28T12', None)]
+
+    res = compaction.compact_partition(store, 'processed/', '2025-10-28T12', groups[('2025-10-28T12', None)],
+                                       target_bytes=1 << 20, small_bytes=1 << 20)
+    assert res['status'] == 'compacted' and res['sources'] == 3
+    assert not [k for _, k in fake_s3.objects if k.startswith(run)]
+    assert sorted(r['track_id'] for r in compaction.iter_partition_rows(store, 'processed/', '2025-10-28T12')) == [0, 1, 2]
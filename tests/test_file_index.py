@@ -0,0 +1,127 @@
+import json
+import threading
+
+import pytest
+
+from conftest import load_lambda_module
+
+
+def _raw(start, stop, fetched_at):
+    rows = [
+        {'TrackId': i, 'Name': f't{i}', 'Title': 'album', 'Composer': None, 'Milliseconds': 1000 * i, 'UnitPrice': 0.99}
+        for i in range(start, stop)
+    ]
+    return json.dumps({'fetched_at': fetched_at, 'row_count': len(rows), 'rows': rows})
+
+
+def _event(*keys):
+    return {'Records': [{'s3': {'bucket': {'name': 'raw'}, 'object': {'key': k}}} for k in keys]}
+
+
+RAW_KEYS = {
+    'raw/2025-10-28T12-00-00Z/a.json': (1, 101, '2025-10-28T12-00-00Z'),
+    'raw/2025-10-28T12-30-00Z/b.json': (101, 201, '2025-10-28T12-30-00Z'),
+    'raw/2025-10-28T13-00-00Z/c.json': (201, 301, '2025-10-28T13-00-00Z'),
+}
+
+
+@pytest.fixture
+def processing(monkeypatch, fake_s3):
+    handler = load_lambda_module('processing_lambda')
+    monkeypatch.setattr(handler, 'ANALYTICS_BUCKET', 'analytics')
+    monkeypatch.setattr(handler, 'boto3_client', lambda name: fake_s3)
+    for key, args in RAW_KEYS.items():
+        fake_s3.put_object(Bucket='raw', Key=key, Body=_raw(*args))
+    return handler
+
+
+def test_stats_and_pruning_predicates():
+    load_lambda_module('processing_lambda')
+    from file_index import ColumnStats, may_match
+
+    stats = ColumnStats(['track_id', 'composer', 'mixed'])
+    for row in [{'track_id': 5, 'composer': None, 'mixed': 1}, {'track_id': 9, 'composer': None, 'mixed': 'x'}]:
+        stats.add(row)
+    columns = stats.to_dict()
+    assert columns['track_id'] == {'min': 5, 'max': 9, 'nulls': 0}
+    assert columns['composer'] == {'min': None, 'max': None, 'nulls': 2}
+    assert columns['mixed'] == {'nulls': 0}
+
+    entry = {'columns': columns}
+    assert may_match(entry, [('track_id', 'between', (8, 20))])
+    assert not may_match(entry, [('track_id', '>', 9)])
+    assert not may_match(entry, [('track_id', 'in', [1, 2, 10])])
+    assert not may_match(entry, [('track_id', 'is_null', None)])
+    assert not may_match(entry, [('composer', '=', 'Bach')])
+    # No min/max (or no stats at all) never prunes
+    assert may_match(entry, [('mixed', '=', 3), ('unit_price', '<', 0)])
+
+
+def test_processing_indexes_files_and_reader_prunes(processing, fake_s3, monkeypatch):
+    monkeypatch.setattr(processing, 'PROCESSED_BUCKET', 'processed')
+    assert processing.lambda_handler(_event(*RAW_KEYS), None)['status'] == 'ok'
+    from file_index import load_index, scan, select_files
+    from object_store import S3ObjectStore
+
+    store = S3ObjectStore(fake_s3, 'processed')
+    index = load_index(store, 'processed/', '2025-10-28T12')
+    entry = index['files']['processed/2025-10-28T12-30-00Z/b.json']
+    assert entry['rows'] == 100
+    assert entry['bytes'] == len(fake_s3.objects[('processed', entry['key'])])
+    assert entry['columns']['track_id'] == {'min': 101, 'max': 200, 'nulls': 0}
+    assert entry['time_range'] == {'min': '2025-10-28T12-30-00Z', 'max': '2025-10-28T12-30-00Z'}
+
+    assert [e['key'] for e in select_files(store, 'processed/', [('milliseconds', '>=', 250000)])] == ['processed/2025-10-28T13-00-00Z/c.json']
+    assert len(select_files(store, 'processed/', since='2025-10-28T12-15-00Z', until='2025-10-28T12-59-59Z')) == 1
+
+    fake_s3.calls.clear()
+    rows = list(scan(store, 'processed/', [('track_id', 'between', (150, 160))]))
+    assert [r['track_id'] for r in rows] == list(range(150, 161))
+    # Two index documents plus the single matching data object
+    assert fake_s3.calls.count('get_object') == 3
+
+
+def test_concurrent_appends_keep_every_entry(tmp_path):
+    load_lambda_module('processing_lambda')
+    from file_index import add_entry, build_entry, load_index
+    from object_store import LocalObjectStore
+
+    store = LocalObjectStore(str(tmp_path))
+
+    def writer(n):
+        for i in range(5):
+            key = f'processed/2025-10-28T12-00-0{n}Z/{i}.json'
+            add_entry(store, 'processed/', build_entry(key, i, 10, {}))
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(load_index(store, 'processed/', '2025-10-28T12')['files']) == 20
+
+
+def test_compaction_swaps_index_entries(processing, monkeypatch, tmp_path):
+    monkeypatch.setenv('LOCAL_UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(processing, 'PROCESSED_BUCKET', '')
+    monkeypatch.setattr(processing, 'ANALYTICS_BUCKET', '')
+    assert processing.lambda_handler(_event(*RAW_KEYS), None)['status'] == 'ok'
+
+    compaction = load_lambda_module('compaction_lambda')
+    monkeypatch.setattr(compaction, 'PROCESSED_BUCKET', '')
+    res = compaction.lambda_handler({'prefixes': ['processed/'], 'partitions': ['2025-10-28T12'], 'include_open': True}, None)
+    assert res['results'][0]['status'] == 'compacted'
+
+    from file_index import load_index, scan, select_files
+    from object_store import LocalObjectStore
+    store = LocalObjectStore(str(tmp_path))
+    files = load_index(store, 'processed/', '2025-10-28T12')['files']
+    assert len(files) == 1
+    (entry,) = files.values()
+    assert entry['key'].endswith('.ndjson.gz')
+    assert entry['columns']['track_id'] == {'min': 1, 'max': 200, 'nulls': 0}
+    assert entry['time_range'] == {'min': '2025-10-28T12-00-00Z', 'max': '2025-10-28T12-30-00Z'}
+
+    assert len(select_files(store, 'processed/', [('track_id', '<', 150)])) == 1
+    rows = list(scan(store, 'processed/', [('track_id', '>', 190)]))
+    assert sorted(r['track_id'] for r in rows) == list(range(191, 301))
@@ -0,0 +1,119 @@
+import json
+import os
+
+import pytest
+
+from conftest import DB_PATH, load_lambda_module
+
+QUERY = "SELECT TrackId, Name FROM Track"
+
+
+@pytest.fixture
+def handler(monkeypatch, tmp_path):
+    handler = load_lambda_module('ingestion_lambda')
+    monkeypatch.setattr(handler, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(handler, 'DB_PATH', DB_PATH)
+    monkeypatch.setattr(handler, 'RAW_BUCKET', '')
+    monkeypatch.setattr(handler, 'INCREMENTAL_COLUMN', 'TrackId')
+    monkeypatch.setattr(handler, 'INCREMENTAL_BATCH_LIMIT', 2000)
+    monkeypatch.setattr(handler, 'INGEST_STATE_DIR', str(tmp_path / 'state'))
+    monkeypatch.setenv('LOCAL_UPLOAD_DIR', str(tmp_path / 'uploads'))
+    monkeypatch.setenv('INGEST_QUERY', QUERY)
+    return handler
+
+
+@pytest.mark.parametrize('mode', ['batch', 'stream'])
+def test_incremental_runs_only_fetch_new_rows(handler, monkeypatch, tmp_path, mode):
+    monkeypatch.setattr(handler, 'INGEST_MODE', mode)
+
+    first = handler.lambda_handler({}, None)
+    assert first['status'] == 'ok'
+    assert first['row_count'] == 2000
+    assert first['watermark'] == 2000
+
+    second = handler.lambda_handler({}, None)
+    assert second['row_count'] == 1503
+    assert second['watermark'] == 3503
+
+    # Caught up: nothing is uploaded and the watermark stays put
+    third = handler.lambda_handler({}, None)
+    assert third['row_count'] == 0
+    assert third['s3_path'] is None
+    assert third['watermark'] == 3503
+    assert len(os.listdir(tmp_path / 'uploads')) == 2
+
+
+def test_watermark_not_advanced_when_upload_fails(handler, monkeypatch, tmp_path):
+    monkeypatch.setattr(handler, 'INGEST_MODE', 'batch')
+
+    def failing_upload(bucket, key, data):
+        raise RuntimeError('upload failed')
+
+    monkeypatch.setattr(handler, 'upload_json_to_s3', failing_upload)
+    assert handler.lambda_handler({}, None)['status'] == 'error'
+    assert not os.path.exists(tmp_path / 'state')
+
+
+def test_watermark_state_in_bucket(monkeypatch, fake_s3):
+    import watermark
+
+    store = watermark.WatermarkStore('raw-bucket', s3=fake_s3)
+    state_id = watermark.watermark_id(QUERY, 'TrackId')
+    assert store.load(state_id) is None
+    store.save(state_id, watermark.new_state('TrackId', 42, 's3://raw-bucket/raw/x.json', 42))
+    key = f'_state/watermarks/{state_id}.json'
+    assert json.loads(fake_s3.objects[('raw-bucket', key)])['value'] == 42
+    assert store.load(state_id)['value'] == 42
+
+
+def test_build_incremental_query_placeholders():
+    import watermark
+
+    sql, params = watermark.build_incremental_query('SELECT id FROM t;', 'id', None, placeholder='%s')
+    assert sql == 'SELECT * FROM (SELECT id FROM t) AS _src ORDER BY id'
+    assert params == ()
+    sql, params = watermark.build_incremental_query('SELECT id FROM t', 'id', 7, placeholder='%s')
+    assert sql == 'SELECT * FROM (SELECT id FROM t) AS _src WHERE id > %s ORDER BY id'
+    assert params == (7,)
+    sql, params = watermark.build_incremental_query('SELECT id FROM t', 'id', 7, placeholder='%s', limit=10)
+    assert sql == (
+        'SELECT * FROM (SELECT id FROM t) AS _src WHERE id > %s AND id <= '
+        '(SELECT MAX(id) FROM (SELECT id FROM (SELECT id FROM t) AS _src WHERE id > %s ORDER BY id LIMIT 10) AS _batch) '
+        'ORDER BY id'
+    )
+    assert params == (7, 7)
+
+
+def test_batches_end_on_watermark_value_boundaries():
+    import sqlite3
+    import watermark
+
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (id INTEGER, updated INTEGER)')
+    # Three rows tie on updated=2 across the first batch's limit of 3
+    conn.executemany('INSERT INTO t VALUES (?, ?)', [(1, 1), (2, 2), (3, 2), (4, 2), (5, 3), (6, 3)])
+    batches = []
+    mark = None
+    while True:
+        sql, params = watermark.build_incremental_query('SELECT id, updated FROM t', 'updated', mark, limit=3)
+        rows = [{'id': i, 'updated': u} for i, u in conn.execute(sql, params)]
+        if not rows:
+            break
+        batches.append([r['id'] for r in rows])
+        mark = watermark.advance(mark, rows, 'updated')
+    assert batches == [[1, 2, 3, 4], [5, 6]]
+
+
+def test_incremental_runs_with_duplicate_watermark_values_skip_nothing(handler, monkeypatch):
+    monkeypatch.setattr(handler, 'INCREMENTAL_COLUMN', 'AlbumId')
+    monkeypatch.setattr(handler, 'INCREMENTAL_BATCH_LIMIT', 100)
+    monkeypatch.setenv('INGEST_QUERY', 'SELECT TrackId, AlbumId FROM Track')
+
+    total = 0
+    while True:
+        res = handler.lambda_handler({}, None)
+        assert res['status'] == 'ok'
+        if not res['row_count']:
+            break
+        total += res['row_count']
+    assert total == 3503
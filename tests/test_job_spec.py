@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import DB_PATH, ROOT, load_lambda_module
+
+SPEC_FILE = os.path.join(ROOT, 'src', 'ingestion_lambda', 'chinook_tables.json')
+TABLES = ['Track', 'Album', 'Artist', 'Invoice', 'InvoiceLine', 'Customer']
+
+
+def _count(table):
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def handler(monkeypatch, tmp_path):
+    handler = load_lambda_module('ingestion_lambda')
+    monkeypatch.setattr(handler, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(handler, 'DB_PATH', DB_PATH)
+    monkeypatch.setattr(handler, 'RAW_BUCKET', '')
+    monkeypatch.setattr(handler, 'INGEST_STATE_DIR', str(tmp_path / 'state'))
+    monkeypatch.setenv('LOCAL_UPLOAD_DIR', str(tmp_path / 'uploads'))
+    return handler
+
+
+@pytest.fixture
+def job_spec():
+    load_lambda_module('ingestion_lambda')
+    import job_spec
+    return job_spec
+
+
+def test_event_spec_extracts_every_table(handler, tmp_path):
+    res = handler.lambda_handler({'concurrency': 3, 'defaults': {'mode': 'stream'}, 'tables': TABLES}, None)
+
+    assert res['status'] == 'ok'
+    assert [t['name'] for t in res['tables']] == ['track', 'album', 'artist', 'invoice', 'invoiceline', 'customer']
+    for table, result in zip(TABLES, res['tables']):
+        assert result['status'] == 'ok'
+        assert result['row_count'] == _count(table)
+        assert result['seconds'] >= 0
+        # Default layout raw/<timestamp>/<name>/<uuid>.ndjson, flattened by the local fallback
+        assert os.path.basename(result['s3_path']).startswith(f"raw_{res['fetched_at']}_{result['name']}_")
+        with open(result['s3_path']) as f:
+            assert sum(1 for _ in f) == result['row_count']
+    assert res['row_count'] == sum(_count(t) for t in TABLES)
+
+
+def test_failing_table_does_not_abort_the_others(handler):
+    spec = {'tables': ['Album', {'name': 'broken', 'query': 'SELECT * FROM NoSuchTable'}, 'Artist']}
+    res = handler.lambda_handler(spec, None)
+
+    assert res['status'] == 'partial'
+    assert [t['status'] for t in res['tables']] == ['ok', 'error', 'ok']
+    assert 'NoSuchTable' in res['tables'][1]['message']
+    assert res['tables'][2]['row_count'] == _count('Artist')
+
+
+def test_tables_run_concurrently_on_shared_resources(handler, monkeypatch):
+    active = []
+    peak = []
+    lock = threading.Lock()
+    run_job = handler.run_job
+
+    def tracking(job, now):
+        with lock:
+            active.append(job['name'])
+            peak.append(len(active))
+        try:
+            return run_job(job, now)
+        finally:
+            with lock:
+                active.remove(job['name'])
+
+    monkeypatch.setattr(handler, 'run_job', tracking)
+    before = handler.RESOURCES.stats()['connection_creates']
+    res = handler.lambda_handler({'concurrency': 2, 'tables': TABLES}, None)
+
+    assert res['status'] == 'ok'
+    assert max(peak) <= 2
+    # Connections come from the shared pool: never more than one per worker
+    assert handler.RESOURCES.stats()['connection_creates'] - before <= 2
+
+
+def test_spec_file_with_per_table_settings(handler, monkeypatch):
+    monkeypatch.setattr(handler, 'INGEST_JOB_SPEC_FILE', SPEC_FILE)
+    first = handler.lambda_handler({}, None)
+    assert first['status'] == 'ok'
+    tables = {t['name']: t for t in first['tables']}
+    assert tables['track']['watermark'] == _count('Track')
+    assert tables['album']['digest'].startswith('sha256:')
+    report = tables['sales-by-genre']
+    assert os.path.basename(report['s3_path']).startswith(f"raw_{first['fetched_at']}_sales-by-genre_report-")
+    with open(report['s3_path']) as f:
+        assert json.load(f)['row_count'] == report['row_count']
+
+    # Nothing changed: incremental tables fetch no rows, the others are skipped by digest
+    second = {t['name']: t for t in handler.lambda_handler({}, None)['tables']}
+    assert second['track']['row_count'] == 0
+    assert second['album']['status'] == 'unchanged'
+    assert second['sales-by-genre']['status'] == 'unchanged'
+
+
+def test_invalid_spec_is_rejected(handler):
+    res = handler.lambda_handler({'tables': ['Album', {'name': 'album', 'table': 'Artist'}]}, None)
+    assert res['status'] == 'error'
+    assert 'duplicate' in res['message']
+
+
+@pytest.mark.parametrize('spec, message', [
+    ({'tables': []}, 'non-empty'),
+    ({'tables': [{'name': 'a', 'table': 'Album', 'query': 'SELECT 1'}]}, 'exactly one'),
+    ({'tables': ['Album; DROP TABLE Album']}, 'name'),
+    ({'tables': [{'name': 'a', 'table': 'Album; DROP TABLE Album'}]}, 'invalid table'),
+    ({'tables': [{'table': 'Album', 'key': 'albums/{uuid}.json'}]}, 'must start with'),
+    ({'tables': [{'table': 'Album', 'key': 'raw/{timestamp}/{uuid}{suffix}'}]}, 'must start with'),
+    ({'tables': [{'table': 'Album', 'key': 'raw/{timestamp}/{name}/{table}.json'}]}, 'bad key layout'),
+    ({'tables': [{'table': 'Album', 'key': 'raw/{timestamp}/{name}/_{uuid}{suffix}'}]}, 'avoid'),
+    ({'tables': [{'table': 'Album', 'incremental': 'AlbumId'}]}, 'unknown setting'),
+])
+def test_normalize_job_spec_errors(job_spec, spec, message):
+    with pytest.raises(job_spec.JobSpecError, match=message):
+        job_spec.normalize_job_spec(spec)
+
+
+def test_normalize_job_spec_applies_defaults(job_spec):
+    spec = job_spec.normalize_job_spec({
+        'defaults': {'mode': 'stream', 'chunk_size': '500'},
+        'key': 'raw/{timestamp}/{name}/{date}/{uuid}{suffix}',
+        'tables': ['Invoice_Items', {'name': 'big', 'table': 'Track', 'mode': 'batch', 'change_detection': 'true'}]
+    })
+    small, big = spec['jobs']
+    assert small == {
+        'name': 'invoice-items', 'query': 'SELECT * FROM Invoice_Items',
+        'key': 'raw/{timestamp}/{name}/{date}/{uuid}{suffix}', 'mode': 'stream', 'chunk_size': 500
+    }
+    assert big['mode'] == 'batch' and big['chunk_size'] == 500 and big['change_detection'] is True
+    assert spec['concurrency'] is None
+
+
+def test_each_table_is_processed_with_its_own_projection(handler, monkeypatch, fake_s3):
+    monkeypatch.setattr(handler, 'RAW_BUCKET', 'raw')
+    monkeypatch.setattr(handler, 'boto3_client', lambda name: fake_s3)
+    res = handler.lambda_handler({'tables': ['Track', 'Album', 'Artist']}, None)
+    keys = {t['name']: t['s3_path'].split('/', 3)[3] for t in res['tables']}
+
+    processing = load_lambda_module('processing_lambda')
+    from projection import load_specs
+    specs = load_specs(path=os.path.join(ROOT, 'src', 'processing_lambda', 'chinook_projections.json'))
+    specs.update(load_specs('{"album": {"album_id": {"aliases": ["AlbumId"], "type": "int"}, "title": ["Title"]}}'))
+    monkeypatch.setattr(processing, 'PROJECTION_SPECS', specs)
+    monkeypatch.setattr(processing, 'PROCESSED_BUCKET', 'processed')
+    monkeypatch.setattr(processing, 'ANALYTICS_BUCKET', 'analytics')
+
+    album = processing.process_object(fake_s3, 'raw', keys['album'])
+    assert album['status'] == 'ok' and album['rows'] == _count('Album')
+    rows = json.loads(fake_s3.objects[('processed', album['processed_path'].split('/', 3)[3])])['rows']
+    assert rows[0] == {'album_id': 1, 'title': 'For Those About To Rock We Salute You'}
+
+    track = processing.process_object(fake_s3, 'raw', keys['track'])
+    rows = json.loads(fake_s3.objects[('processed', track['processed_path'].split('/', 3)[3])])['rows']
+    assert rows[0]['track_id'] == 1 and rows[0]['track_name'] == 'For Those About To Rock (We Salute You)'
+
+    # Not forced through the Track columns: tables without a projection are skipped
+    artist = processing.process_object(fake_s3, 'raw', keys['artist'])
+    assert artist['status'] == 'skipped'
+    assert artist['reason'] == "no projection for table 'artist'"
+    assert not [k for b, k in fake_s3.objects if b == 'processed' and '/artist/' in k]
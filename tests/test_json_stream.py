@@ -0,0 +1,129 @@
+import io
+import json
+import tracemalloc
+
+import pytest
+
+from conftest import load_lambda_module
+
+
+@pytest.fixture(scope='module')
+def json_stream():
+    load_lambda_module('processing_lambda')
+    import json_stream
+    return json_stream
+
+
+ROWS = [
+    {'TrackId': 1, 'Name': 'Fast As a Shark', 'Title': 'Restless and Wild', 'UnitPrice': 0.99},
+    {'TrackId': 12345, 'Name': 'Ünïcødé — ♫', 'Title': None, 'UnitPrice': 0},
+    {'TrackId': 3, 'Name': 'quote " and \\ backslash', 'Title': 'x', 'UnitPrice': 1.5e3},
+]
+
+
+@pytest.mark.parametrize('read_size', [1, 3, 7, 64 * 1024])
+def test_envelope_rows_and_meta(json_stream, read_size):
+    body = json.dumps({'fetched_at': '2025-10-28T12-00-00Z', 'row_count': 12345, 'rows': ROWS, 'tail': [1, 2]}, ensure_ascii=False)
+    reader = json_stream.EnvelopeReader(io.BytesIO(body.encode('utf-8')), read_size=read_size)
+    rows = iter(reader)
+    assert next(rows) == ROWS[0]
+    assert reader.meta == {'fetched_at': '2025-10-28T12-00-00Z', 'row_count': 12345}
+    assert list(rows) == ROWS[1:]
+    assert reader.meta['tail'] == [1, 2]
+
+
+@pytest.mark.parametrize('body,expected', [
+    (b'[]', []),
+    (b'{"rows": []}', []),
+    (b'{}', []),
+    (b' [ {"a": 1} , {"a": 2} ] ', [{'a': 1}, {'a': 2}]),
+])
+def test_bare_array_and_empty(json_stream, body, expected):
+    assert list(json_stream.EnvelopeReader(io.BytesIO(body), read_size=2)) == expected
+
+
+def test_malformed_envelope_raises(json_stream):
+    with pytest.raises(ValueError):
+        list(json_stream.EnvelopeReader(io.BytesIO(b'{"rows": [{"a": 1} {"a": 2}]}')))
+    with pytest.raises(ValueError):
+        list(json_stream.EnvelopeReader(io.BytesIO(b'{"rows": [{"a": 1}')))
+
+
+def test_ndjson_reader(json_stream):
+    body = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in ROWS).encode('utf-8')
+    reader = json_stream.PayloadReader(io.BytesIO(body), key='raw/2025-10-28T12-00-00Z/x.ndjson')
+    assert list(reader) == ROWS
+    assert reader.meta['fetched_at'] == '2025-10-28T12-00-00Z'
+    assert list(json_stream.iter_ndjson(io.BytesIO(body[:-1]), read_size=5)) == ROWS
+
+
+class _GeneratedEnvelope(io.RawIOBase):
+    """File-like body producing a large envelope on the fly, so the input itself is never in memory."""
+
+    def __init__(self, rows):
+        self._chunks = self._generate(rows)
+        self._pending = b''
+
+    @staticmethod
+    def _generate(rows):
+        yield b'{"fetched_at": "2025-10-28T12-00-00Z", "rows": ['
+        for i in range(rows):
+            row = {'TrackId': i, 'Name': f'track {i}' * 4, 'Title': f'album {i % 50}', 'Milliseconds': i, 'UnitPrice': 0.99}
+            yield (b', ' if i else b'') + json.dumps(row).encode('utf-8')
+        yield b']}'
+
+    def read(self, size=-1):
+        while len(self._pending) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._pending += chunk
+        out, self._pending = self._pending[:size], self._pending[size:]
+        return out
+
+
+class _CountingWriter:
+    def __init__(self):
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+
+
+def _peak_memory(handler, rows):
+    reader = handler.PayloadReader(_GeneratedEnvelope(rows), key='raw/t/big.json')
+    writer = _CountingWriter()
+    tracemalloc.start()
+    try:
+        count, albums = handler.stream_transform(reader, writer, 'now')
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert count == rows and len(albums) == 50
+    return peak, writer.bytes_written
+
+
+def test_processing_memory_stays_flat():
+    handler = load_lambda_module('processing_lambda')
+    small_peak, small_bytes = _peak_memory(handler, 2000)
+    large_peak, large_bytes = _peak_memory(handler, 10000)
+    # Five times the data, roughly the same peak (read buffer + one write batch)
+    assert large_bytes > 4 * small_bytes
+    assert large_peak < 1.5 * small_peak
+    assert large_peak < large_bytes / 2
+
+
+def test_processed_output_is_valid_envelope(monkeypatch, fake_s3):
+    handler = load_lambda_module('processing_lambda')
+    monkeypatch.setattr(handler, 'PROCESSED_BUCKET', 'processed')
+    monkeypatch.setattr(handler, 'ANALYTICS_BUCKET', 'analytics')
+    monkeypatch.setattr(handler, 'PROCESSING_WRITE_BATCH', 2)
+    fake_s3.put_object(Bucket='raw', Key='raw/t/a.json', Body=json.dumps({'fetched_at': 'f', 'rows': ROWS}))
+    fake_s3.put_object(Bucket='raw', Key='raw/t/empty.json', Body=json.dumps({'fetched_at': 'f', 'rows': []}))
+    handler.process_object(fake_s3, 'raw', 'raw/t/a.json')
+    handler.process_object(fake_s3, 'raw', 'raw/t/empty.json')
+    out = json.loads(fake_s3.objects[('processed', 'processed/t/a.json')])
+    assert out['fetched_at'] == 'f' and out['row_count'] == 3
+    assert [r['track_id'] for r in out['rows']] == [1, 12345, 3]
+    empty = json.loads(fake_s3.objects[('processed', 'processed/t/empty.json')])
+    assert empty['rows'] == [] and empty['row_count'] == 0
@@ -0,0 +1,121 @@
+import json
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+from local_s3 import FileSystemS3
+import benchmark
+import local_pipeline
+
+
+def test_filesystem_s3_put_get_head_metadata(tmp_path):
+    s3 = FileSystemS3(tmp_path)
+    put = s3.put_object(Bucket='b', Key='raw/x.json', Body=b'{"a": 1}', ContentType='application/json', Metadata={'Payload-Format': 'json'})
+    head = s3.head_object(Bucket='b', Key='raw/x.json')
+    assert head['ETag'] == put['ETag']
+    assert head['ContentLength'] == 8
+    obj = s3.get_object(Bucket='b', Key='raw/x.json')
+    assert obj['Body'].read() == b'{"a": 1}'
+    assert obj['ContentType'] == 'application/json'
+    assert obj['Metadata'] == {'payload-format': 'json'}
+    assert s3.get_object(Bucket='b', Key='raw/x.json', Range='bytes=1-3')['Body'].read() == b'"a"'
+
+    with pytest.raises(Exception) as err:
+        s3.head_object(Bucket='b', Key='raw/missing.json')
+    assert err.value.response['Error']['Code'] == '404'
+
+
+def test_filesystem_s3_conditional_put(tmp_path):
+    s3 = FileSystemS3(tmp_path)
+    etag = s3.put_object(Bucket='b', Key='k', Body=b'1', IfNoneMatch='*')['ETag']
+    with pytest.raises(Exception) as err:
+        s3.put_object(Bucket='b', Key='k', Body=b'2', IfNoneMatch='*')
+    assert err.value.response['Error']['Code'] == 'PreconditionFailed'
+    with pytest.raises(Exception):
+        s3.put_object(Bucket='b', Key='k', Body=b'2', IfMatch='"stale"')
+    s3.put_object(Bucket='b', Key='k', Body=b'2', IfMatch=etag)
+    assert s3.get_object(Bucket='b', Key='k')['Body'].read() == b'2'
+
+
+def test_filesystem_s3_multipart_and_pagination(tmp_path):
+    s3 = FileSystemS3(tmp_path)
+    upload = s3.create_multipart_upload(Bucket='b', Key='processed/big.json', ContentType='application/json')
+    parts = [
+        {'PartNumber': n, 'ETag': s3.upload_part(Bucket='b', Key='processed/big.json', UploadId=upload['UploadId'], PartNumber=n, Body=data)['ETag']}
+        for n, data in ((1, b'abc'), (2, b'def'))
+    ]
+    done = s3.complete_multipart_upload(Bucket='b', Key='processed/big.json', UploadId=upload['UploadId'], MultipartUpload={'Parts': parts})
+    assert done['ETag'].endswith('-2"')
+    assert s3.get_object(Bucket='b', Key='processed/big.json')['Body'].read() == b'abcdef'
+    assert not os.listdir(tmp_path / '.multipart')
+
+    for i in range(5):
+        s3.put_object(Bucket='b', Key=f'raw/{i}.json', Body=b'{}')
+    first = s3.list_objects_v2(Bucket='b', Prefix='raw/', MaxKeys=3)
+    assert first['IsTruncated'] and first['KeyCount'] == 3
+    assert local_pipeline.list_keys(s3, 'b', 'raw/') == [f'raw/{i}.json' for i in range(5)]
+
+
+@pytest.mark.parametrize('mode,payload_format', [('batch', 'json'), ('stream', 'columnar')])
+def test_local_pipeline_end_to_end(tmp_path, mode, payload_format):
+    pipeline = local_pipeline.LocalPipeline(tmp_path, mode=mode, payload_format=payload_format)
+    out = pipeline.run()
+
+    assert out['ingestion']['rows'] == 3503
+    assert out['processing']['rows'] == 3503
+    assert out['analytics']['rows'] == 3503
+    buckets = local_pipeline.BUCKETS
+    assert local_pipeline.list_keys(pipeline.s3, buckets['processed'], '_index/processed/')
+    rollups = local_pipeline.list_keys(pipeline.s3, buckets['analytics'], 'analytics/rollups/hourly/')
+    assert rollups
+    hourly = pipeline.read_json(buckets['analytics'], rollups[0])
+    assert hourly['row_count'] == 3503
+    assert local_pipeline.list_keys(pipeline.s3, buckets['analytics'], 'analytics/partials/')
+
+
+def test_grow_database(tmp_path):
+    import sqlite3
+    path = benchmark.grow_database(5000, str(tmp_path / 'db' / 'chinook_5000.db'))
+    conn = sqlite3.connect(path)
+    assert conn.execute('SELECT COUNT(*) FROM Track').fetchone()[0] == 5000
+    joined = conn.execute('SELECT COUNT(*) FROM Track JOIN Album ON Track.AlbumId = Album.AlbumId').fetchone()[0]
+    conn.close()
+    assert joined == 5000
+
+
+def test_benchmark_run_and_regression_check(tmp_path):
+    assert benchmark.main(['--sizes', '4000', '--repeat', '1', '--out', str(tmp_path)]) == 0
+    report = json.loads((tmp_path / 'latest.json').read_text())
+    assert report['mode'] == 'stream'
+    (result,) = report['results']
+    assert result['rows'] == 4000
+    assert result['peak_rss_mb'] > 0
+    for stage in benchmark.STAGES:
+        assert result['stages'][stage]['rows_per_sec'] > 0
+        assert result['stages'][stage]['p99_ms'] >= result['stages'][stage]['p50_ms']
+    assert {'query', 'serialize', 'upload'} <= set(result['stages']['ingestion']['breakdown_ms'])
+
+    faster = json.loads(json.dumps(report))
+    faster['results'][0]['stages']['processing']['rows_per_sec'] *= 10
+    regressions = benchmark.compare(report, faster, 0.2)
+    assert [(r['rows'], r['stage']) for r in regressions] == [(4000, 'processing')]
+    assert benchmark.compare(report, report, 0.2) == []
+
+
+def test_benchmark_baseline_is_read_before_latest_is_replaced(tmp_path):
+    args = ['--sizes', '2000', '--repeat', '1', '--out', str(tmp_path)]
+    assert benchmark.main(args) == 0
+    latest = tmp_path / 'latest.json'
+    previous = json.loads(latest.read_text())
+    for stage in previous['results'][0]['stages'].values():
+        stage['rows_per_sec'] *= 100
+    latest.write_text(json.dumps(previous))
+
+    # Compared against the previous (impossibly fast) run, not against itself
+    assert benchmark.main(args + ['--baseline', str(latest)]) == 1
+    assert json.loads(latest.read_text())['results'] != previous['results']
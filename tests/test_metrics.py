@@ -0,0 +1,160 @@
+import io
+import json
+import os
+import sys
+import time
+
+from conftest import ROOT, load_lambda_module
+
+sys.path.insert(0, os.path.join(ROOT, 'src', 'shared'))
+
+import metrics
+from metrics import Metrics, read_emf, stage, timed_iter, timed_reader, timed_writer
+
+
+def _by_stage(docs):
+    return {d['Stage']: d for d in docs if '_aws' in d}
+
+
+def test_stages_are_exclusive_and_emitted_as_emf(capsys):
+    m = Metrics('unit', namespace='Test')
+    with m.invocation({}, None):
+        with stage('outer') as t:
+            time.sleep(0.02)
+            with stage('inner', rows=10, bytes=1000):
+                time.sleep(0.05)
+            t.add(rows=5)
+        with stage('inner', rows=10, bytes=1000):
+            pass
+        metrics.add_totals(rows=5)
+
+    docs = read_emf(capsys.readouterr().out)
+    assert docs == m.last
+    stages = _by_stage(docs)
+    assert set(stages) == {'outer', 'inner', 'total'}
+    assert stages['inner']['Calls'] == 2
+    assert stages['inner']['Rows'] == 20 and stages['inner']['Bytes'] == 2000
+    assert stages['inner']['Duration'] >= 50
+    # The nested stage's time is not counted again in the enclosing one
+    assert stages['outer']['Duration'] < 45
+    assert stages['outer']['RowsPerSecond'] > 0
+
+    emf = stages['inner']['_aws']['CloudWatchMetrics'][0]
+    assert emf['Namespace'] == 'Test'
+    assert emf['Dimensions'] == [['Function', 'Stage']]
+    assert {'Name': 'Duration', 'Unit': 'Milliseconds'} in emf['Metrics']
+    assert {'Name': 'BytesPerSecond', 'Unit': 'Bytes/Second'} in emf['Metrics']
+    total = stages['total']
+    assert total['Rows'] == 5
+    assert total['Duration'] >= stages['outer']['Duration'] + stages['inner']['Duration']
+    assert total['PeakMemoryMB'] > 0
+
+
+def test_cold_start_only_on_first_invocation():
+    docs = []
+    m = Metrics('cold-check', sink=docs.append)
+    for _ in range(2):
+        with m.invocation():
+            pass
+    assert [d['ColdStart'] for d in docs] == [1, 0]
+
+
+def test_disabled_metrics_are_no_ops(capsys):
+    m = Metrics('off', enabled=False)
+    body = io.BytesIO(b'abc')
+    with m.invocation() as inv:
+        assert inv is None
+        assert stage('x') is metrics.NULL_STAGE
+        assert timed_reader(body) is body
+        chunks = [[1, 2]]
+        assert timed_iter(chunks, 'query') is chunks
+    assert capsys.readouterr().out == ''
+    assert m.last == []
+
+
+def test_timed_streams_count_bytes_and_rows(tmp_path):
+    docs = []
+    m = Metrics('io', sink=docs.append)
+
+    class Writer:
+        path = 'out'
+
+        def __init__(self):
+            self.data = b''
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def write(self, data):
+            self.data += data
+
+    with m.invocation():
+        reader = timed_reader(io.BytesIO(b'x' * 100))
+        while reader.read(30):
+            pass
+        with timed_writer(Writer()) as w:
+            w.write(b'abc')
+            w.write(b'de')
+        assert w.path == 'out'
+        assert sum(len(c) for c in timed_iter([[1, 2], [3]], 'query')) == 3
+
+    stages = _by_stage(docs)
+    assert stages['download']['Bytes'] == 100
+    assert stages['upload']['Bytes'] == 5
+    assert stages['query']['Rows'] == 3
+
+
+def test_profile_hook_writes_folded_stacks(tmp_path, monkeypatch):
+    monkeypatch.setenv('METRICS_PROFILE_DIR', str(tmp_path))
+    monkeypatch.setenv('METRICS_PROFILE_INTERVAL_MS', '1')
+    docs = []
+    m = Metrics('prof', sink=docs.append)
+
+    def busy_wait():
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+
+    with m.invocation({'profile': True}):
+        busy_wait()
+
+    profile = docs[-1]['profile']
+    assert profile['samples'] > 0
+    folded = open(profile['path']).read()
+    assert 'busy_wait' in folded
+    # Not requested: no profiler
+    with m.invocation({}):
+        pass
+    assert 'profile' not in m.last[-1]
+
+
+def test_percentile_nearest_rank():
+    assert metrics.percentile([], 50) is None
+    assert metrics.percentile([3, 1, 2], 50) == 2
+    assert metrics.percentile(list(range(1, 101)), 99) == 99
+    assert metrics.percentile([5], 99) == 5
+
+
+def test_processing_handler_reports_stages(monkeypatch, fake_s3):
+    handler = load_lambda_module('processing_lambda')
+    docs = []
+    monkeypatch.setattr(handler.METRICS, 'sink', docs.append)
+    monkeypatch.setattr(handler, 'PROCESSED_BUCKET', 'processed')
+    monkeypatch.setattr(handler, 'ANALYTICS_BUCKET', 'analytics')
+    monkeypatch.setattr(handler, 'boto3_client', lambda name: fake_s3)
+    rows = [{'TrackId': i, 'Title': f'a{i % 2}', 'Milliseconds': i} for i in range(50)]
+    body = json.dumps({'fetched_at': '2025-10-28T12-00-00Z', 'row_count': 50, 'rows': rows}).encode('utf-8')
+    fake_s3.put_object(Bucket='raw', Key='raw/2025-10-28T12-00-00Z/a.json', Body=body)
+
+    event = {'Records': [{'s3': {'bucket': {'name': 'raw'}, 'object': {'key': 'raw/2025-10-28T12-00-00Z/a.json'}}}]}
+    assert handler.lambda_handler(event, None)['status'] == 'ok'
+
+    stages = _by_stage(docs)
+    assert {'download', 'transform', 'upload', 'index', 'summary', 'total'} <= set(stages)
+    assert all(d['Function'] == 'processing' for d in stages.values())
+    assert stages['download']['Bytes'] == len(body)
+    assert stages['transform']['Rows'] == 50
+    assert stages['total']['Rows'] == 50
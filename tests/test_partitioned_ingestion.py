@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+from conftest import DB_PATH, load_lambda_module
+
+QUERY = "SELECT TrackId, Name FROM Track"
+
+
+@pytest.fixture
+def handler(monkeypatch, tmp_path):
+    handler = load_lambda_module('ingestion_lambda')
+    monkeypatch.setattr(handler, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(handler, 'DB_PATH', DB_PATH)
+    monkeypatch.setattr(handler, 'RAW_BUCKET', '')
+    monkeypatch.setenv('LOCAL_UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setenv('INGEST_QUERY', QUERY)
+    return handler
+
+
+def test_split_ranges_cover_every_key():
+    import partitioned
+
+    ranges = partitioned.split_ranges(1, 3503, 4)
+    assert len(ranges) == 4
+    assert ranges[0][0] == 1 and ranges[-1][1:] == (3503, True)
+    assert all(r[1] == n[0] for r, n in zip(ranges, ranges[1:]))
+    assert partitioned.split_ranges(5, 6, 8) == [(5, 6, False), (6, 6, True)]
+    assert partitioned.split_ranges(None, None, 4) == []
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+def test_partitioned_extract_writes_parts_and_manifest(handler, monkeypatch, tmp_path, concurrency):
+    monkeypatch.setattr(handler, 'PARTITION_COLUMN', 'TrackId')
+    monkeypatch.setattr(handler, 'PARTITION_COUNT', 4)
+    monkeypatch.setattr(handler, 'PARTITION_CONCURRENCY', concurrency)
+
+    res = handler.lambda_handler({}, None)
+    assert res['status'] == 'ok'
+    assert res['row_count'] == 3503
+    assert res['s3_path'].endswith('_manifest.json')
+
+    with open(res['s3_path']) as f:
+        manifest = json.load(f)
+    assert manifest['partition_count'] == 4
+    ids = []
+    for part in manifest['partitions']:
+        with open(part['s3_path']) as f:
+            ids.extend(json.loads(line)['TrackId'] for line in f)
+        assert part['row_count'] > 0
+    assert sorted(ids) == list(range(1, 3504))
+
+
+def test_partition_failure_skips_manifest(handler, monkeypatch, tmp_path):
+    monkeypatch.setattr(handler, 'PARTITION_COLUMN', 'TrackId')
+    monkeypatch.setattr(handler, 'PARTITION_COUNT', 3)
+    original = handler.stream_query_to_s3
+
+    def flaky(sql, bucket, key, **kwargs):
+        if key.endswith('part-00001.ndjson'):
+            raise RuntimeError('connection reset')
+        return original(sql, bucket, key, **kwargs)
+
+    monkeypatch.setattr(handler, 'stream_query_to_s3', flaky)
+    res = handler.lambda_handler({}, None)
+    assert res['status'] == 'error'
+    assert [p.get('error') for p in res['partitions']] == [None, 'connection reset', None]
+    assert not [p for p in os.listdir(tmp_path) if p.endswith('_manifest.json')]
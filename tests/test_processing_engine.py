@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import load_lambda_module
+
+
+def _event(*keys, bucket='raw'):
+    return {'Records': [{'s3': {'bucket': {'name': bucket}, 'object': {'key': k}}} for k in keys]}
+
+
+def _raw_payload(n):
+    rows = [
+        {'TrackId': i, 'Name': f't{i}', 'Title': f'album{i % 3}', 'Composer': None, 'Milliseconds': 1000 * i, 'UnitPrice': 0.99}
+        for i in range(1, n + 1)
+    ]
+    return json.dumps({'fetched_at': '2025-10-28T12-00-00Z', 'row_count': n, 'rows': rows})
+
+
+@pytest.fixture
+def handler(monkeypatch, fake_s3):
+    handler = load_lambda_module('processing_lambda')
+    monkeypatch.setattr(handler, 'PROCESSED_BUCKET', 'processed')
+    monkeypatch.setattr(handler, 'ANALYTICS_BUCKET', 'analytics')
+    monkeypatch.setattr(handler, 'boto3_client', lambda name: fake_s3)
+    return handler
+
+
+def test_single_pass_writes_processed_and_summary(handler, fake_s3):
+    fake_s3.put_object(Bucket='raw', Key='raw/2025-10-28T12-00-00Z/a.json', Body=_raw_payload(6))
+    res = handler.lambda_handler(_event('raw/2025-10-28T12-00-00Z/a.json'), None)
+
+    assert res['status'] == 'ok'
+    processed = json.loads(fake_s3.objects[('processed', 'processed/2025-10-28T12-00-00Z/a.json')])
+    assert processed['row_count'] == 6
+    assert processed['rows'][0]['track_id'] == 1
+    summary = json.loads(fake_s3.objects[('analytics', 'analytics/2025-10-28T12-00-00Z/a_summary.json')])
+    assert summary['album_counts'] == {'album0': 2, 'album1': 2, 'album2': 2}
+
+
+def test_bad_record_does_not_block_others(handler, fake_s3):
+    fake_s3.put_object(Bucket='raw', Key='raw/t/good.json', Body=_raw_payload(3))
+    fake_s3.put_object(Bucket='raw', Key='raw/t/bad.json', Body=b'{not json')
+    res = handler.lambda_handler(_event('raw/t/good.json', 'raw/t/bad.json', 'raw/t/missing.json', 'raw/t/_manifest.json'), None)
+
+    assert res['status'] == 'partial'
+    assert [r['status'] for r in res['results']] == ['ok', 'error', 'error', 'skipped']
+    assert res['results'][1]['input'] == 's3://raw/raw/t/bad.json'
+
+
+def test_ndjson_input(handler, fake_s3):
+    body = '\n'.join(json.dumps({'TrackId': i, 'Title': 'x'}) for i in range(5)) + '\n'
+    fake_s3.put_object(Bucket='raw', Key='raw/2025-10-28T12-00-00Z/run/part-00000.ndjson', Body=body)
+    res = handler.lambda_handler(_event('raw/2025-10-28T12-00-00Z/run/part-00000.ndjson'), None)
+    assert res['results'][0]['rows'] == 5
+    processed = json.loads(fake_s3.objects[('processed', 'processed/2025-10-28T12-00-00Z/run/part-00000.json')])
+    assert processed['fetched_at'] == '2025-10-28T12-00-00Z'
+
+
+def test_records_processed_concurrently(handler, monkeypatch, fake_s3):
+    active = []
+    peak = []
+    lock = threading.Lock()
+    original = fake_s3.get_object
+
+    def slow_get(**kwargs):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return original(**kwargs)
+
+    monkeypatch.setattr(fake_s3, 'get_object', slow_get)
+    monkeypatch.setattr(handler, 'PROCESSING_CONCURRENCY', 4)
+    keys = [f'raw/t/{i}.json' for i in range(4)]
+    for k in keys:
+        fake_s3.put_object(Bucket='raw', Key=k, Body=_raw_payload(2))
+    res = handler.lambda_handler(_event(*keys), None)
+    assert res['status'] == 'ok'
+    assert max(peak) > 1
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from conftest import load_lambda_module
+
+
+@pytest.fixture
+def projection():
+    load_lambda_module('processing_lambda')
+    import projection
+    return projection
+
+
+def test_falsy_values_are_kept(projection):
+    spec = projection.load_spec()
+    extract = projection.compile_projection(spec, ['TrackId', 'Name', 'Title', 'Composer', 'Milliseconds', 'UnitPrice'])
+    row = {'TrackId': 0, 'Name': '', 'Title': 'a', 'Composer': None, 'Milliseconds': 0, 'UnitPrice': 0.0}
+    assert extract(row) == {
+        'track_id': 0, 'track_name': '', 'album_title': 'a',
+        'composer': None, 'milliseconds': 0, 'unit_price': 0.0
+    }
+
+
+def test_aliases_resolved_against_file_columns(projection):
+    spec = projection.load_spec()
+    extract = projection.compile_projection(spec, ['track_id', 'album_title', 'unit_price'])
+    out = extract({'track_id': '7', 'album_title': 'x', 'unit_price': '0.99'})
+    assert out['track_id'] == 7
+    assert out['unit_price'] == 0.99
+    assert out['track_name'] is None and out['milliseconds'] is None
+
+
+def test_missing_key_in_row_falls_back(projection):
+    spec = projection.load_spec(json.dumps({'id': ['a'], 'name': ['b']}))
+    extract = projection.compile_projection(spec, ['a', 'b'])
+    assert extract({'a': 1}) == {'id': 1, 'name': None}
+
+
+def test_bool_parses_string_and_integer_forms(projection):
+    spec = projection.load_spec(json.dumps({'flag': {'aliases': ['f'], 'type': 'bool'}}))
+    extract = projection.compile_projection(spec, ['f'])
+    for value, expected in (('false', False), ('0', False), ('No', False), (0, False), (False, False),
+                            ('true', True), ('1', True), (' YES ', True), (1, True), (True, True), ('', None)):
+        assert extract({'f': value}) == {'flag': expected}, value
+    with pytest.raises(ValueError):
+        extract({'f': 'maybe'})
+
+
+def test_spec_from_file_and_bad_type(projection, tmp_path):
+    path = tmp_path / 'spec.json'
+    path.write_text(json.dumps({'customer_id': {'aliases': ['CustomerId'], 'type': 'int'}}))
+    spec = projection.load_spec(path=str(path))
+    assert projection.compile_projection(spec, ['CustomerId'])({'CustomerId': 3.0}) == {'customer_id': 3}
+    with pytest.raises(ValueError):
+        projection.load_spec(json.dumps({'x': {'type': 'uuid'}}))
+
+
+def test_transform_uses_projection_spec():
+    handler = load_lambda_module('processing_lambda')
+    rows = [{'TrackId': 1, 'Title': 'a', 'Milliseconds': 0}, {'TrackId': 2, 'Title': 'a', 'Milliseconds': 5}]
+    counts = {}
+    processed = list(handler.project_rows(rows, handler.PROJECTION_SPEC, counts))
+    assert [r['milliseconds'] for r in processed] == [0, 5]
+    assert counts == {'a': 2}
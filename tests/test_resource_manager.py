@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from conftest import DB_PATH, load_lambda_module
+
+
+@pytest.fixture
+def manager():
+    load_lambda_module('ingestion_lambda')  # puts src/shared on sys.path
+    from resource_manager import ResourceManager
+    mgr = ResourceManager(max_age=300, max_uses=3)
+    yield mgr
+    mgr.close_all()
+
+
+def _sqlite():
+    return sqlite3.connect(DB_PATH, check_same_thread=False)
+
+
+def test_connection_reused_until_max_uses(manager):
+    seen = []
+    for _ in range(4):
+        with manager.connection('db', _sqlite) as conn:
+            seen.append(conn)
+    assert seen[0] is seen[1] is seen[2]
+    assert seen[3] is not seen[0]
+    stats = manager.stats()
+    assert stats['connection_hits'] == 2
+    assert stats['connection_creates'] == 2
+    assert stats['reconnects'] == 1
+
+
+def test_dead_connection_replaced_after_liveness_check(manager):
+    with manager.connection('db', _sqlite) as conn:
+        first = conn
+    first.close()
+    with manager.connection('db', _sqlite) as conn:
+        assert conn is not first
+        assert conn.execute('SELECT COUNT(*) FROM Track').fetchone()[0] == 3503
+    stats = manager.stats()
+    assert stats['liveness_failures'] == 1
+    assert stats['reconnects'] == 1
+
+
+def test_connection_discarded_when_block_raises(manager):
+    with pytest.raises(RuntimeError):
+        with manager.connection('db', _sqlite):
+            raise RuntimeError('query failed')
+    assert manager.stats()['idle_connections'] == 0
+
+
+def test_client_cached(manager):
+    created = []
+
+    class Session:
+        def client(self, name, **kwargs):
+            created.append(name)
+            return object()
+
+    manager._session = Session()
+    assert manager.client('s3') is manager.client('s3')
+    assert created == ['s3']
+    assert manager.stats()['client_hits'] == 1
+
+
+def test_handler_reuses_sqlite_connection_across_invocations(monkeypatch, tmp_path):
+    handler = load_lambda_module('ingestion_lambda')
+    monkeypatch.setattr(handler, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(handler, 'DB_PATH', DB_PATH)
+    before = handler.RESOURCES.stats()
+    handler.query_db('SELECT 1 AS one')
+    handler.query_db('SELECT 1 AS one')
+    after = handler.RESOURCES.stats()
+    assert after['connection_hits'] - before['connection_hits'] >= 1
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from conftest import DB_PATH, load_lambda_module
+
+
+@pytest.fixture
+def cache_cls():
+    load_lambda_module('ingestion_lambda')
+    from snapshot_cache import SnapshotCache
+    return SnapshotCache
+
+
+def test_unchanged_snapshot_costs_one_head(cache_cls, fake_s3, tmp_path):
+    fake_s3.put_object(Bucket='b', Key='db/chinook.db', Body=b'v1')
+    cache = cache_cls(cache_dir=str(tmp_path))
+
+    first = cache.fetch(fake_s3, 'b', 'db/chinook.db')
+    fake_s3.calls.clear()
+    second = cache.fetch(fake_s3, 'b', 'db/chinook.db')
+
+    assert first == second
+    assert fake_s3.calls == ['head_object']
+    assert (cache.downloads, cache.hits) == (1, 1)
+
+
+def test_changed_snapshot_replaces_old_version(cache_cls, fake_s3, tmp_path):
+    cache = cache_cls(cache_dir=str(tmp_path))
+    fake_s3.put_object(Bucket='b', Key='db/chinook.db', Body=b'v1')
+    old = cache.fetch(fake_s3, 'b', 'db/chinook.db')
+    fake_s3.put_object(Bucket='b', Key='db/chinook.db', Body=b'v2')
+    new = cache.fetch(fake_s3, 'b', 'db/chinook.db')
+
+    assert new != old
+    assert os.listdir(tmp_path) == [os.path.basename(new)]
+    with open(new, 'rb') as f:
+        assert f.read() == b'v2'
+
+
+def test_large_snapshot_is_fetched_in_pinned_ranges(cache_cls, fake_s3, tmp_path):
+    body = bytes(range(256)) * 40
+    fake_s3.put_object(Bucket='b', Key='db/chinook.db', Body=body)
+    cache = cache_cls(cache_dir=str(tmp_path), chunk_size=1000, max_concurrency=4)
+    ranges = []
+    get_object = fake_s3.get_object
+
+    def recording(**kwargs):
+        ranges.append((kwargs.get('Range'), kwargs.get('IfMatch')))
+        return get_object(**kwargs)
+
+    fake_s3.get_object = recording
+    with open(cache.fetch(fake_s3, 'b', 'db/chinook.db'), 'rb') as f:
+        assert f.read() == body
+    # Every ranged GET is pinned to the ETag from the HEAD, and together they cover the object once
+    etag = fake_s3.head_object(Bucket='b', Key='db/chinook.db')['ETag']
+    assert all(match == etag for _, match in ranges)
+    assert sorted(ranges) == sorted((f'bytes={lo}-{min(lo + 999, len(body) - 1)}', etag) for lo in range(0, len(body), 1000))
+
+
+def test_snapshot_replaced_mid_download_is_not_cached(cache_cls, fake_s3, tmp_path):
+    fake_s3.put_object(Bucket='b', Key='db/chinook.db', Body=b'v1' * 1000)
+    cache = cache_cls(cache_dir=str(tmp_path), chunk_size=500)
+    get_object = fake_s3.get_object
+
+    def replacing(**kwargs):
+        fake_s3.put_object(Bucket='b', Key='db/chinook.db', Body=b'v2' * 1000)
+        return get_object(**kwargs)
+
+    fake_s3.get_object = replacing
+    with pytest.raises(Exception, match='PreconditionFailed'):
+        cache.fetch(fake_s3, 'b', 'db/chinook.db')
+    assert os.listdir(tmp_path) == []
+
+
+def test_byte_budget_evicts_least_recently_used(cache_cls, fake_s3, tmp_path):
+    cache = cache_cls(cache_dir=str(tmp_path), max_bytes=250)
+    for name in ('a', 'b', 'c'):
+        fake_s3.put_object(Bucket='b', Key=name, Body=b'x' * 100)
+    a = cache.fetch(fake_s3, 'b', 'a')
+    os.utime(a, (1, 1))
+    b = cache.fetch(fake_s3, 'b', 'b')
+    c = cache.fetch(fake_s3, 'b', 'c')
+    assert not os.path.exists(a)
+    assert os.path.exists(b) and os.path.exists(c)
+
+
+def test_handler_uses_snapshot_cache(monkeypatch, fake_s3, tmp_path):
+    handler = load_lambda_module('ingestion_lambda')
+    with open(DB_PATH, 'rb') as f:
+        fake_s3.put_object(Bucket='raw', Key='db/chinook.db', Body=f.read())
+    monkeypatch.setattr(handler, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(handler, 'DB_PATH', None)
+    monkeypatch.setattr(handler, 'DB_S3_BUCKET', 'raw')
+    monkeypatch.setattr(handler, 'DB_S3_KEY', 'db/chinook.db')
+    monkeypatch.setattr(handler, 'RAW_BUCKET', '')
+    monkeypatch.setattr(handler, 'boto3_client', lambda name: fake_s3)
+    monkeypatch.setattr(handler, 'SNAPSHOT_CACHE', handler.SnapshotCache(cache_dir=str(tmp_path / 'cache')))
+    monkeypatch.setenv('LOCAL_UPLOAD_DIR', str(tmp_path / 'uploads'))
+    monkeypatch.setenv('INGEST_QUERY', 'SELECT TrackId FROM Track LIMIT 5')
+
+    assert handler.lambda_handler({}, None)['row_count'] == 5
+    assert handler.lambda_handler({}, None)['row_count'] == 5
+    assert fake_s3.calls.count('get_object') == 1
+    assert fake_s3.calls.count('head_object') == 2
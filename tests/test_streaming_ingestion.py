@@ -0,0 +1,82 @@
+import json
+import os
+import sqlite3
+
+from conftest import DB_PATH, load_lambda_module
+
+QUERY = (
+    "SELECT Track.TrackId AS TrackId, Track.Name AS Name, Album.Title AS Title "
+    "FROM Track JOIN Album ON Track.AlbumId = Album.AlbumId ORDER BY Track.TrackId"
+)
+
+
+def _sqlite_handler(monkeypatch, tmp_path):
+    handler = load_lambda_module('ingestion_lambda')
+    monkeypatch.setattr(handler, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(handler, 'DB_PATH', DB_PATH)
+    monkeypatch.setenv('LOCAL_UPLOAD_DIR', str(tmp_path))
+    return handler
+
+
+def _track_count():
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM Track').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_iter_query_chunks_bounds_chunk_size(monkeypatch, tmp_path):
+    handler = _sqlite_handler(monkeypatch, tmp_path)
+    chunks = list(handler.iter_query_chunks(QUERY, chunk_size=500))
+    assert all(len(c) <= 500 for c in chunks)
+    assert sum(len(c) for c in chunks) == _track_count()
+    assert chunks[0][0]['TrackId'] == 1
+
+
+def test_stream_local_fallback_writes_ndjson(monkeypatch, tmp_path):
+    handler = _sqlite_handler(monkeypatch, tmp_path)
+    result = handler.stream_query_to_s3(QUERY, '', 'raw/t/run.ndjson', chunk_size=250)
+    assert result['row_count'] == _track_count()
+    with open(result['s3_path']) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == result['row_count']
+    assert json.loads(lines[0])['TrackId'] == 1
+    assert not [p for p in os.listdir(tmp_path) if p.endswith('.partial')]
+
+
+def test_stream_to_s3_uses_multipart_parts(monkeypatch, tmp_path, fake_s3):
+    handler = _sqlite_handler(monkeypatch, tmp_path)
+    monkeypatch.setattr(handler, 'boto3_client', lambda name: fake_s3)
+    import streaming
+    # Lower the part size below the S3 minimum so the ~300 KB extract spans several parts
+    monkeypatch.setattr(streaming, 'MIN_PART_SIZE', 64 * 1024)
+    monkeypatch.setattr(handler, 'S3_PART_SIZE', 64 * 1024)
+    result = handler.stream_query_to_s3(QUERY, 'raw-bucket', 'raw/t/run.ndjson', chunk_size=100)
+
+    assert result['parts'] > 1
+    assert fake_s3.calls.count('complete_multipart_upload') == 1
+    body = fake_s3.objects[('raw-bucket', 'raw/t/run.ndjson')]
+    rows = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    assert len(rows) == _track_count()
+    assert [r['TrackId'] for r in rows[:3]] == [1, 2, 3]
+
+
+def test_small_stream_uses_single_put(monkeypatch, tmp_path, fake_s3):
+    handler = _sqlite_handler(monkeypatch, tmp_path)
+    monkeypatch.setattr(handler, 'boto3_client', lambda name: fake_s3)
+    result = handler.stream_query_to_s3(QUERY + ' LIMIT 10', 'raw-bucket', 'raw/t/small.ndjson')
+    assert result['row_count'] == 10
+    assert fake_s3.calls == ['put_object']
+
+
+def test_lambda_handler_stream_mode(monkeypatch, tmp_path):
+    handler = _sqlite_handler(monkeypatch, tmp_path)
+    monkeypatch.setattr(handler, 'INGEST_MODE', 'stream')
+    monkeypatch.setattr(handler, 'RAW_BUCKET', '')
+    monkeypatch.setenv('INGEST_QUERY', QUERY)
+    res = handler.lambda_handler({}, None)
+    assert res['status'] == 'ok'
+    assert res['row_count'] == _track_count()
+    assert res['s3_path'].endswith('.ndjson')
+